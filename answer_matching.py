@@ -0,0 +1,126 @@
+# answer_matching.py
+import re
+import sys
+import unicodedata
+
+
+# Typed answers to open-ended questions. A question's correct options are its accepted
+# answers, each one an alias ("JFK", "John F. Kennedy"). Answers and aliases are
+# normalized the same way: casefolded, accents and punctuation stripped and a leading
+# article dropped. An answer is right when it equals an alias, with or without spaces
+# ("J.F.K." is "jfk"), when it is within a few edits of one (the longer the alias, the
+# more typos it tolerates) or when Jaro-Winkler rates it close, which forgives swapped
+# letters that cost two edits. Fuzzy matches need the right first letter, so "relieve"
+# doesn't pass for "believe", and aliases with digits only match exactly: 1984 is not
+# 1985.
+ARTICLES = frozenset(['the', 'a', 'an'])
+JARO_WINKLER_THRESHOLD = 0.95
+MAX_ANSWER_LENGTH = 200         # longer answers are cut before grading
+
+_WORDS = re.compile(r'[^\W_]+')
+
+
+def normalize_answer(text):
+    text = unicodedata.normalize('NFKD', str(text)[:MAX_ANSWER_LENGTH]).casefold()
+    words = _WORDS.findall(''.join(char for char in text if not unicodedata.combining(char)))
+    if len(words) > 1 and words[0] in ARTICLES:
+        del words[0]
+    return ' '.join(words)
+
+
+def allowed_typos(length):
+    # Edits tolerated against an alias of this many characters
+    if length <= 3:
+        return 0
+    return 1 if length <= 7 else 2
+
+
+def bounded_levenshtein(a, b, limit):
+    # Edit distance between a and b, or limit + 1 as soon as it must be larger. Only a
+    # band of 2 * limit + 1 cells around the diagonal can stay within the limit, so
+    # that's all each row computes.
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if len(a) > len(b):
+        a, b = b, a
+    too_far = limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char in enumerate(a, start=1):
+        start, end = max(1, i - limit), min(len(b), i + limit)
+        current = [too_far] * (len(b) + 1)
+        if start == 1:
+            current[0] = i
+        row_best = current[start - 1]
+        for j in range(start, end + 1):
+            cost = previous[j - 1] + (char != b[j - 1])
+            current[j] = min(cost, previous[j] + 1, current[j - 1] + 1)
+            if current[j] < row_best:
+                row_best = current[j]
+        if row_best > limit:
+            return too_far
+        previous = current
+    return min(previous[-1], too_far)
+
+
+def jaro_winkler(a, b, prefix_scale=0.1):
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    window = max(max(len(a), len(b)) // 2 - 1, 0)
+    used = [False] * len(b)
+    matched_a = []
+    for i, char in enumerate(a):
+        for j in range(max(0, i - window), min(len(b), i + window + 1)):
+            if not used[j] and b[j] == char:
+                used[j] = True
+                matched_a.append(char)
+                break
+    matches = len(matched_a)
+    if not matches:
+        return 0.0
+    matched_b = [char for char, was_used in zip(b, used) if was_used]
+    transpositions = sum(x != y for x, y in zip(matched_a, matched_b)) / 2
+    jaro = (matches / len(a) + matches / len(b) + (matches - transpositions) / matches) / 3
+
+    prefix = 0
+    for x, y in zip(a[:4], b[:4]):
+        if x != y:
+            break
+        prefix += 1
+    return jaro + prefix * prefix_scale * (1 - jaro)
+
+
+class AnswerMatcher:
+    # Accepted answers of one question, normalized once when the answer key is built.
+    # Fuzzy candidates are (alias, length, typos) so an answer only pays for the edit
+    # distance against aliases of about its length.
+    __slots__ = ('answer', 'exact', 'fuzzy')
+
+    def __init__(self, accepted):
+        accepted = [text for text in accepted if text]
+        self.answer = accepted[0] if accepted else None     # what to show as the right answer
+        aliases = sorted(set(filter(None, map(normalize_answer, accepted))))
+        self.exact = frozenset(aliases + [alias.replace(' ', '') for alias in aliases])
+        self.fuzzy = tuple((alias, len(alias), allowed_typos(len(alias))) for alias in aliases
+                           if allowed_typos(len(alias)) and not any(char.isdigit() for char in alias))
+
+    def matches(self, answer):
+        text = normalize_answer(answer)
+        if not text:
+            return False
+        if text in self.exact or text.replace(' ', '') in self.exact:
+            return True
+        length = len(text)
+        for alias, alias_length, typos in self.fuzzy:
+            if abs(length - alias_length) > typos or text[0] != alias[0]:
+                continue
+            if (bounded_levenshtein(text, alias, typos) <= typos
+                    or jaro_winkler(text, alias) >= JARO_WINKLER_THRESHOLD):
+                return True
+        return False
+
+    @property
+    def nbytes(self):
+        return (sys.getsizeof(self) + sys.getsizeof(self.exact)
+                + sum(sys.getsizeof(alias) for alias in self.exact) + sys.getsizeof(self.fuzzy))
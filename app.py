@@ -1,131 +1,306 @@
 # app.py
-from flask import Flask, render_template, request, url_for, redirect, session, flash
-from flask_sqlalchemy import SQLAlchemy 
+from flask import (Flask, render_template, request, url_for, redirect, session, flash, jsonify, abort, Response,
+                   stream_with_context)
 from flask_login import LoginManager, UserMixin, login_user, logout_user, current_user, login_required
-from sqlalchemy import or_
 from flask_migrate import Migrate
 from flask_caching import Cache
+import click
+import os
 import uuid
 
+from models import db, User, TriviaSet, Question, Option, UserScore
+from trivia_sets import create_trivia_sets, import_trivia_sets, read_sets, set_from_form
+from search_index import (ensure_search_index, index_trivia_sets, is_search_table, prune_search_index,
+                          rebuild_search_index, remove_trivia_sets, search_trivia_sets)
+from db_config import database_uri, engine_options, install_sqlite_pragmas, sqlite_pragmas
+from cache_backends import install_cache_stats
+from leaderboards import leaderboards, ranked, refresh_user_totals
+from live_rooms import live_rooms
+from passwords import HasherBusy, RateLimiter, is_hashed, password_hasher
+from metrics import request_metrics
+from score_writer import score_writer, upsert_scores
+from set_export import (export_trivia_sets, gzip_chunks, import_trivia_set_stream, ndjson_lines, read_checkpoint,
+                        read_ndjson_lines, write_checkpoint, write_export)
+from set_deletion import compact, compaction_job, count_orphans, delete_trivia_sets, set_ids_for, vacuum
+from set_editor import apply_set_edit, bump_set_versions, edit_from_form, load_questions
+from set_snapshots import get_set_snapshot, guest_page_cache, invalidate_set_snapshot, snapshot_cache
+from question_dedup import (clear_signatures, duplicate_report, index_questions, merge_within_sets, prune_signatures,
+                            unindexed_set_ids)
+from set_similarity import describe_sets, set_documents, similarity_index
+from static_assets import build_assets, missing_asset_packages, static_assets
+from http_caching import http_caching, page_validators
+from session_users import get_session_user, invalidate_session_user, session_user_cache
+from user_dashboards import average_score, dashboard_page, dashboard_summaries
+from scoring import answer_key_cache, get_answer_key, invalidate_answer_key, parse_answers, score_submission
+
 # Configure app
 app = Flask(__name__)
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///db.sqlite"
+app.config["SQLALCHEMY_DATABASE_URI"] = database_uri()
 app.config["SECRET_KEY"] = "abc"
-db = SQLAlchemy()
+
+# Configure database
+# DATABASE_URL switches to Postgres (or anything SQLAlchemy supports); pool sizes come
+# from DB_POOL_* and SQLite connections get the pragmas in db_config.sqlite_pragmas
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
+app.config["SQLITE_TUNING"] = os.environ.get("SQLITE_TUNING", "1") == "1"
+app.config["SQLITE_PRAGMAS"] = sqlite_pragmas() if app.config["SQLITE_TUNING"] else {}
 
 # Configure migration
-migrate = Migrate(app, db, render_as_batch=True)
+# The search index is maintained by search_index.py, keep autogenerate away from it
+def include_object(object, name, type_, reflected, compare_to):
+    return not (type_ == 'table' and is_search_table(name))
+
+migrate = Migrate(app, db, render_as_batch=True, include_object=include_object)
 
 #Configure caching
-app.config['CACHE_TYPE'] = 'simple'
-app.config['CACHE_DEFAULT_TIMEOUT'] = 300   #seconds
+# SimpleCache is private to each worker. To share the cache between workers use
+# CACHE_TYPE=cache_backends.SQLiteCache (one host) or RedisCache with CACHE_REDIS_URL.
+app.config['CACHE_TYPE'] = os.environ.get('CACHE_TYPE', 'SimpleCache')
+app.config['CACHE_DEFAULT_TIMEOUT'] = int(os.environ.get('CACHE_DEFAULT_TIMEOUT', 300))   #seconds
+app.config['CACHE_THRESHOLD'] = int(os.environ.get('CACHE_THRESHOLD', 10000))
+app.config['CACHE_SQLITE_PATH'] = os.environ.get('CACHE_SQLITE_PATH')
+app.config['CACHE_REDIS_URL'] = os.environ.get('CACHE_REDIS_URL')
 cache = Cache(app)
+shared_cache = install_cache_stats(cache, app)
+
+# Compiled answer keys are kept per worker, bounded by count and memory. An edit only
+# clears the worker that saved it; the others pick it up within SET_CACHE_TTL seconds
+# (0 keeps entries until they are evicted, for a single worker).
+app.config['SET_CACHE_TTL'] = int(os.environ.get('SET_CACHE_TTL', 10))
+app.config['ANSWER_KEY_CACHE_ENTRIES'] = int(os.environ.get('ANSWER_KEY_CACHE_ENTRIES', 4096))
+app.config['ANSWER_KEY_CACHE_BYTES'] = int(os.environ.get('ANSWER_KEY_CACHE_BYTES', 16 * 1024 * 1024))
+answer_key_cache.resize(app.config['ANSWER_KEY_CACHE_ENTRIES'], app.config['ANSWER_KEY_CACHE_BYTES'],
+                        ttl=app.config['SET_CACHE_TTL'])
+
+# Play page snapshots and rendered guest pages, same bounds and TTL
+app.config['SET_SNAPSHOT_CACHE_ENTRIES'] = int(os.environ.get('SET_SNAPSHOT_CACHE_ENTRIES', 1024))
+app.config['SET_SNAPSHOT_CACHE_BYTES'] = int(os.environ.get('SET_SNAPSHOT_CACHE_BYTES', 32 * 1024 * 1024))
+snapshot_cache.resize(app.config['SET_SNAPSHOT_CACHE_ENTRIES'], app.config['SET_SNAPSHOT_CACHE_BYTES'],
+                      ttl=app.config['SET_CACHE_TTL'])
+guest_page_cache.resize(app.config['SET_SNAPSHOT_CACHE_ENTRIES'], app.config['SET_SNAPSHOT_CACHE_BYTES'],
+                        ttl=app.config['SET_CACHE_TTL'])
+
+#Configure search
+app.config['SEARCH_PAGE_SIZE'] = int(os.environ.get('SEARCH_PAGE_SIZE', 20))
+
+#Configure leaderboards
+# Per-set boards are updated in place on every score write; LEADERBOARD_MAX_AGE bounds
+# how long scores written by other workers can take to show up in them. The global
+# board is read from the user_total_score table and is always current.
+app.config['LEADERBOARD_MAX_SETS'] = int(os.environ.get('LEADERBOARD_MAX_SETS', 1024))
+app.config['LEADERBOARD_MAX_AGE'] = int(os.environ.get('LEADERBOARD_MAX_AGE', 60))   #seconds
+leaderboards.configure(app.config['LEADERBOARD_MAX_SETS'], app.config['LEADERBOARD_MAX_AGE'])
+
+#Configure dashboard
+# Per-user totals are kept like the leaderboards: updated in place on set and score
+# writes, reloaded after DASHBOARD_SUMMARY_MAX_AGE.
+app.config['DASHBOARD_PAGE_SIZE'] = int(os.environ.get('DASHBOARD_PAGE_SIZE', 20))
+app.config['DASHBOARD_SUMMARY_MAX_USERS'] = int(os.environ.get('DASHBOARD_SUMMARY_MAX_USERS', 1024))
+app.config['DASHBOARD_SUMMARY_MAX_AGE'] = int(os.environ.get('DASHBOARD_SUMMARY_MAX_AGE', 60))   #seconds
+dashboard_summaries.configure(app.config['DASHBOARD_SUMMARY_MAX_USERS'], app.config['DASHBOARD_SUMMARY_MAX_AGE'])
+
+#Configure score writes
+# SCORE_WRITE_BEHIND=1 queues score writes and commits them in batches from a
+# background thread instead of inside the request
+app.config['SCORE_WRITE_BEHIND'] = os.environ.get('SCORE_WRITE_BEHIND', '0') == '1'
+app.config['SCORE_WRITE_QUEUE_SIZE'] = int(os.environ.get('SCORE_WRITE_QUEUE_SIZE', 10000))
+app.config['SCORE_WRITE_BATCH_SIZE'] = int(os.environ.get('SCORE_WRITE_BATCH_SIZE', 500))
+app.config['SCORE_WRITE_FLUSH_INTERVAL'] = float(os.environ.get('SCORE_WRITE_FLUSH_INTERVAL_MS', 5)) / 1000
+
+#Configure compaction
+# COMPACTION_INTERVAL > 0 runs a background job every that many seconds that removes
+# options, questions and scores left behind by deleted sets
+app.config['COMPACTION_INTERVAL'] = int(os.environ.get('COMPACTION_INTERVAL', 0))
+app.config['COMPACTION_BATCH_SIZE'] = int(os.environ.get('COMPACTION_BATCH_SIZE', 5000))
+
+#Configure live rooms
+# Rooms are held in memory by the process that created them, so run a single worker
+# (gunicorn -k gevent -w 1 for thousands of open event streams) or route by room code.
+# Every open stream holds a thread; past LIVE_ROOM_MAX_STREAMS per process (or
+# LIVE_ROOM_MAX_ROOM_STREAMS per room, 0 = off) new streams get a 503.
+app.config['LIVE_ROOM_SECONDS'] = int(os.environ.get('LIVE_ROOM_SECONDS', 20))   #per question
+app.config['LIVE_ROOM_REVEAL_SECONDS'] = int(os.environ.get('LIVE_ROOM_REVEAL_SECONDS', 5))
+app.config['LIVE_ROOM_MAX_PLAYERS'] = int(os.environ.get('LIVE_ROOM_MAX_PLAYERS', 5000))
+app.config['LIVE_ROOM_MAX_ROOMS'] = int(os.environ.get('LIVE_ROOM_MAX_ROOMS', 1000))
+app.config['LIVE_ROOM_TTL'] = int(os.environ.get('LIVE_ROOM_TTL', 3600))   #seconds without activity
+app.config['LIVE_ROOM_PROGRESS_INTERVAL'] = float(os.environ.get('LIVE_ROOM_PROGRESS_INTERVAL', 1))   #seconds
+app.config['LIVE_ROOM_MAX_STREAMS'] = int(os.environ.get('LIVE_ROOM_MAX_STREAMS', 256))
+app.config['LIVE_ROOM_MAX_ROOM_STREAMS'] = int(os.environ.get('LIVE_ROOM_MAX_ROOM_STREAMS', 0))
+
+#Configure duplicate questions
+# Questions of new and edited sets are checked against every stored question; those at
+# least DEDUP_THRESHOLD similar (estimated Jaccard of words and options) are flagged
+app.config['DEDUP_ON_INGEST'] = os.environ.get('DEDUP_ON_INGEST', '1') == '1'
+app.config['DEDUP_THRESHOLD'] = float(os.environ.get('DEDUP_THRESHOLD', 0.8))
+
+#Configure similar sets
+# `flask build-similarity-index` writes the index to SIMILARITY_INDEX_PATH; it is
+# memory-mapped by every worker and kept up to date as sets are written
+app.config['SIMILARITY_INDEX_PATH'] = os.environ.get('SIMILARITY_INDEX_PATH')   #default instance/similarity
+app.config['SIMILARITY_DIM'] = int(os.environ.get('SIMILARITY_DIM', 256))
+similarity_index.init_app(app)
+
+#Configure static files
+# After `flask build-assets`, url_for('static') points at content-hashed copies that
+# are cached for STATIC_ASSET_MAX_AGE and served precompressed. STATIC_ASSETS=0
+# serves the plain files, e.g. while editing stylesheets.
+app.config['STATIC_ASSETS'] = os.environ.get('STATIC_ASSETS', '1') == '1'
+app.config['STATIC_ASSET_MAX_AGE'] = int(os.environ.get('STATIC_ASSET_MAX_AGE', 365 * 24 * 3600))   #seconds
+static_assets.init_app(app)
+
+#Configure HTTP caching
+# Search, play and results pages carry weak ETags from set versions and answer
+# revalidation with 304. Guest pages may be served by a proxy for
+# HTTP_CACHE_SHARED_MAX_AGE seconds after an edit.
+app.config['HTTP_CACHING'] = os.environ.get('HTTP_CACHING', '1') == '1'
+app.config['HTTP_CACHE_SHARED_MAX_AGE'] = int(os.environ.get('HTTP_CACHE_SHARED_MAX_AGE', 30))   #seconds
+http_caching.init_app(app)
+
+#Configure metrics
+# Request latency, SQL and cache counters are served at /metrics (Prometheus text format)
+# to METRICS_ALLOWED_IPS (addresses or networks, loopback only by default) and to
+# requests bearing METRICS_TOKEN when it is set. PROFILE_REQUESTS=1 lets those same
+# clients add ?profile=1 to get a cProfile dump in PROFILE_DIR. A request that runs the same
+# statement METRICS_N_PLUS_ONE_THRESHOLD times is logged as a possible N+1.
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+app.config['METRICS_ALLOWED_IPS'] = os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1')
+app.config['METRICS_N_PLUS_ONE_THRESHOLD'] = int(os.environ.get('METRICS_N_PLUS_ONE_THRESHOLD', 5))
+app.config['PROFILE_REQUESTS'] = os.environ.get('PROFILE_REQUESTS', '0') == '1'
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR')
+app.logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
+
+#Configure passwords
+# Hashing runs on PASSWORD_HASH_WORKERS threads whatever the number of requests; the
+# cost is part of each stored hash, raising it rehashes passwords as users log in.
+# Every login attempt counts against the client address, failed ones also against the
+# account (LOGIN_*_LIMIT attempts per LOGIN_*_PERIOD seconds).
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+app.config['PASSWORD_HASH_QUEUE'] = int(os.environ.get('PASSWORD_HASH_QUEUE', 32))
+app.config['LOGIN_IP_LIMIT'] = int(os.environ.get('LOGIN_IP_LIMIT', 20))
+app.config['LOGIN_IP_PERIOD'] = int(os.environ.get('LOGIN_IP_PERIOD', 60))   #seconds
+app.config['LOGIN_ACCOUNT_LIMIT'] = int(os.environ.get('LOGIN_ACCOUNT_LIMIT', 5))
+app.config['LOGIN_ACCOUNT_PERIOD'] = int(os.environ.get('LOGIN_ACCOUNT_PERIOD', 300))   #seconds
+password_hasher.init_app(app)
+login_ip_limiter = RateLimiter(app.config['LOGIN_IP_LIMIT'], app.config['LOGIN_IP_PERIOD'])
+login_account_limiter = RateLimiter(app.config['LOGIN_ACCOUNT_LIMIT'], app.config['LOGIN_ACCOUNT_PERIOD'])
 
 #Configure login
+# The logged-in user is loaded from a per-worker cache of slim records; a change made
+# by another worker (or a deactivation) is seen within SESSION_USER_CACHE_TTL seconds
+app.config['SESSION_USER_CACHE_ENTRIES'] = int(os.environ.get('SESSION_USER_CACHE_ENTRIES', 10000))
+app.config['SESSION_USER_CACHE_TTL'] = int(os.environ.get('SESSION_USER_CACHE_TTL', 30))
+session_user_cache.resize(app.config['SESSION_USER_CACHE_ENTRIES'], session_user_cache.max_bytes,
+                          ttl=app.config['SESSION_USER_CACHE_TTL'])
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = "login"  # type:ignore
 
-# Models
+
+# Helpers
 #--------------------------------------------------------------------------------------
-class User(db.Model, UserMixin):
-    id = db.Column(db.Integer, primary_key=True)
-    email = db.Column(db.String(120), unique=True, nullable=False)
-    username = db.Column(db.String(80), unique=True, nullable=False)
-    password = db.Column(db.String(length=120), nullable=False)
-    is_active = db.Column(db.Boolean, default=True, nullable=False)
+def generate_unique_id():
+    return str(uuid.uuid4())
 
-    def get_id(self):
-        return str(self.id)
 
-    def __init__(self, username, email, password):
-        self.username = username
-        self.email = email
-        self.password = password
 
-class TriviaSet(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    set_title = db.Column(db.String(100), nullable=False)
-    category = db.Column(db.String(50), nullable=False)
-    difficulty = db.Column(db.String(50), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    trivia_set_id = db.Column(db.String(50), unique=True, nullable=False)
+# Everything derived from a set (answer keys, play page snapshots, search index)
+# has to be refreshed after the set is written.
+def trivia_sets_changed(set_ids):
+    set_ids = list(set_ids)
+    for set_id in set_ids:
+        invalidate_answer_key(set_id)
+        invalidate_set_snapshot(set_id)
+    index_trivia_sets(set_ids)
+    if app.config['DEDUP_ON_INGEST']:
+        index_questions(set_ids, app.config['DEDUP_THRESHOLD'])
+    similarity_index.update(set_ids)
+    dashboard_summaries.sets_changed(set_ids)
 
-    questions = db.relationship('Question', backref='trivia_set', lazy='dynamic')
 
-    def __init__(self, set_title, category, difficulty, user_id, trivia_set_id):
-        self.set_title = set_title
-        self.category = category
-        self.difficulty = difficulty
-        self.user_id = user_id
-        self.trivia_set_id = trivia_set_id
+def trivia_sets_deleted(set_ids, user_ids=()):
+    # user_ids: players who had scores on the deleted sets
+    set_ids = list(set_ids)
+    for set_id in set_ids:
+        invalidate_answer_key(set_id)
+        invalidate_set_snapshot(set_id)
+        leaderboards.drop_set(set_id)
+    for user_id in user_ids:
+        cache.delete_memoized(get_top_scores, user_id)
+    remove_trivia_sets(set_ids)
+    similarity_index.remove(set_ids)
+    dashboard_summaries.sets_deleted(set_ids)
 
 
-class Question(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    question_text = db.Column(db.String(255), nullable=False)
-    question_type = db.Column(db.Enum('multiple_choice', 'open_ended'), nullable=False)
-    trivia_set_id = db.Column(db.Integer, db.ForeignKey('trivia_set.id'), nullable=False)
+def delete_sets(set_ids):
+    # Bulk delete of sets with their questions, options and scores
+    deleted = delete_trivia_sets(set_ids)
+    trivia_sets_deleted(deleted.set_ids, deleted.user_ids)
+    return deleted
 
-    options = db.relationship('Option', backref='question', lazy='dynamic')
 
-    def __init__(self, question_text, question_type, trivia_set_id):
-        self.question_text = question_text
-        self.question_type = question_type
-        self.trivia_set_id = trivia_set_id
+def orphans_compacted(result):
+    # Removed scores may still be counted on the boards and in cached top scores
+    if result.scores:
+        leaderboards.clear()
+        dashboard_summaries.clear()
+        cache.delete_memoized(get_top_scores)
 
 
-class Option(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    text = db.Column(db.String(255), nullable=False)
-    is_correct = db.Column(db.Boolean, default=False, nullable=False)
-    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), nullable=False)
 
-    def __init__(self, text, question_id, is_correct=False):
-        self.text = text
-        self.is_correct = is_correct
-        self.question_id = question_id
+def users_changed(user_ids):
+    for user_id in user_ids:
+        invalidate_session_user(user_id)
 
 
-class UserScore(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    trivia_set_id = db.Column(db.Integer, db.ForeignKey('trivia_set.id'), nullable=False)
-    score = db.Column(db.Integer, nullable=False)
+def save_set_edit(trivia_set):
+    # Both edit forms go through the diff engine, which writes only what changed
+    edit = apply_set_edit(trivia_set, edit_from_form(request.form))
+    if any(edit):
+        trivia_sets_changed([trivia_set.id])
+    return edit
 
-    def __init__(self, user_id, trivia_set_id, score):
-        self.user_id = user_id
-        self.trivia_set_id = trivia_set_id
-        self.score = score
 
+def calculate_score(trivia_set, user_answers):
+    return score_submission(trivia_set.id, parse_answers(user_answers))
 
 
+def record_score(user_id, trivia_set_id, score):
+    # One score per user and set, the latest play wins.
+    # In write-behind mode the score is queued and committed in a batch shortly after;
+    # a full queue falls back to writing it here.
+    if app.config['SCORE_WRITE_BEHIND'] and score_writer.submit(user_id, trivia_set_id, score):
+        return
 
-def generate_unique_id():
-    return str(uuid.uuid4())
+    previous = db.session.query(UserScore.score).filter_by(user_id=user_id, trivia_set_id=trivia_set_id).scalar()
+    if previous != score:
+        # Upserted rather than inserted, so a concurrent first play of the same set
+        # updates the row instead of failing on the unique index
+        upsert_scores({(user_id, trivia_set_id): score})
+        db.session.commit()
+    scores_changed(user_id, trivia_set_id, score, previous)
 
 
+def scores_changed(user_id, trivia_set_id, score, previous=None):
+    # Memoized top scores live in the shared cache, drop them for every worker
+    cache.delete_memoized(get_top_scores, user_id)
+    leaderboards.record(user_id, trivia_set_id, score)
+    dashboard_summaries.score_recorded(trivia_set_id, score, previous)
 
-def calculate_score(trivia_set, user_answers):
-    score = 0
-    for question in trivia_set.questions:
-        correct_option_id = None
 
-        for option in question.options:
-            if option.is_correct:
-                correct_option_id = option.id
-                break
+def queued_scores_written(batch):
+    for user_id, trivia_set_id, score, previous in batch:
+        scores_changed(user_id, trivia_set_id, score, previous)
 
-        user_answer = user_answers.get(question.id)
-        if user_answer and user_answer == str(correct_option_id):
-            score += 1
 
-    return score
+def live_round_finished(room):
+    # Logged-in players keep their live score like a solo play, in batched upserts
+    score_writer.write([(user_id, room.trivia_set_id, score) for user_id, score in room.results()])
 
 
 @cache.memoize()
 def get_top_scores(userId):
-    player = User.query.get(userId)
+    player = get_session_user(userId)
     if player is None:
         return None
     
@@ -146,11 +321,25 @@ def get_top_scores(userId):
 #--------------------------------------------------------------------------------------
 
 db.init_app(app)
+with app.app_context():
+    install_sqlite_pragmas(db.engine, app.config["SQLITE_PRAGMAS"])
+score_writer.init_app(app, on_written=queued_scores_written)
+compaction_job.init_app(app, on_compacted=orphans_compacted)
+live_rooms.init_app(app, on_finished=live_round_finished)
+with app.app_context():
+    request_metrics.init_app(app, db.engine, shared_cache)
+request_metrics.add_cache('answer_keys', answer_key_cache.stats)
+request_metrics.add_cache('set_snapshots', snapshot_cache.stats)
+request_metrics.add_cache('guest_pages', guest_page_cache.stats)
+request_metrics.add_cache('session_users', session_user_cache.stats)
+request_metrics.add_cache('http_conditional', http_caching.stats)
 
 
 @login_manager.user_loader
 def loader_user(user_id):
-	return db.session.query(User).get(user_id)
+	# Deactivated users are logged out on their next request
+	user = get_session_user(user_id)
+	return user if user is not None and user.is_active else None
 
 
 # Routes
@@ -165,28 +354,23 @@ def home():
 @login_required
 def print_database():
 
-        trivia_sets = TriviaSet.query.all()
+        # One streamed query for the whole bank instead of a query per set and question
+        for set in export_trivia_sets():
+            app.logger.info("Set Title: %s", set['set_title'])
+            app.logger.info("Category: %s", set['category'])
+            app.logger.info("Difficulty: %s", set['difficulty'])
 
+            for question in set['questions']:
+                app.logger.info("Question: %s", question['question_text'])
+                app.logger.info("Question Type: %s", question['question_type'])
 
-        for set in trivia_sets:
-            print(f"Set Title: {set.set_title}")
-            print(f"Category: {set.category}")
-            print(f"Difficulty: {set.difficulty}")
+                for option in question['options']:
+                    app.logger.info("Option: %s", option['text'])
+                    app.logger.info("Is Correct: %s", option['is_correct'])
 
-            for question in set.questions:
-                print(f"Question: {question.question_text}")
-                print(f"Question Type: {question.question_type}")
-
-                for option in question.options:
-                    print(f"Option: {option.text}")
-                    print(f"Is Correct: {option.is_correct}")
-
-                correct_option = next((opt for opt in question.options if opt.is_correct), None)
+                correct_option = next((opt for opt in question['options'] if opt['is_correct']), None)
                 if correct_option:
-                    print(f"Correct Answer: {correct_option.text}")
-
-
-            print("\n")
+                    app.logger.info("Correct Answer: %s", correct_option['text'])
 
 
         return "Database contents printed in the terminal."
@@ -197,13 +381,17 @@ def print_database():
 @login_required  # only logged-in users can access this route
 def dashboard():
     if isinstance(current_user, UserMixin) and current_user.is_authenticated:
-        # Query the user's trivia sets from the database
-        user_trivia_sets = TriviaSet.query.filter_by(user_id=current_user.id).all() # type: ignore
+        # One page of the user's sets with their counts, plus the cached totals over all of them
+        user_trivia_sets, next_cursor = dashboard_page(current_user.id, after=request.args.get('after', type=int), # type: ignore
+                                                       limit=app.config['DASHBOARD_PAGE_SIZE'])
+        summary = dashboard_summaries.for_user(current_user.id).view() # type: ignore
         user_top_scores = get_top_scores(current_user.id) # type: ignore
         #print(user_top_scores)
-        return render_template("dashboard.html", current_user=current_user, user_trivia_sets=user_trivia_sets, user_top_scores=user_top_scores)
+        return render_template("dashboard.html", current_user=current_user, user_trivia_sets=user_trivia_sets,
+                               next_cursor=next_cursor, summary=summary, average_score=average_score,
+                               user_top_scores=user_top_scores)
     else:
-        print('User is not authenticated')
+        app.logger.info('User is not authenticated')
         return redirect(url_for('login'))
 
 
@@ -220,7 +408,12 @@ def register():
         if existing_user:
             return "Email or username already in use"
 
-        new_user = User(email=email, username=username, password=password)
+        try:
+            password_hash = password_hasher.hash(password)
+        except HasherBusy:
+            return "Too many sign-ups right now, please try again in a moment", 503
+
+        new_user = User(email=email, username=username, password=password_hash)
         db.session.add(new_user)
         db.session.commit()
 
@@ -232,60 +425,78 @@ def register():
 
 
 
+def find_login_user(email, username):
+    # The form takes an email or a username; an email match wins
+    users = User.query.filter((User.email == email) | (User.username == username)).limit(2).all()
+    return next((user for user in users if user.email == email), users[0] if users else None)
+
+
+def login_refused(message, status, retry_after=None):
+    flash(message, "error")
+    response = app.make_response((render_template("login.html"), status))
+    if retry_after:
+        response.headers['Retry-After'] = str(int(retry_after) + 1)
+    return response
+
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == "POST":
         email = request.form.get('email')
         username = request.form.get('username')
-        password = request.form.get('password')
-        
-        user = User.query.filter((User.email == email) | (User.username == username)).first()
-        
-        if user:
-            print('Login successful')
-            print(f'Email: {email}')
-            print(f'Username: {username}')
-            login_user(user)
+        password = request.form.get('password') or ''
+
+        user = find_login_user(email, username)
+        account = f'user:{user.id}' if user else f'name:{(email or username or "").lower()}'
+        wait = max(login_ip_limiter.hit(request.remote_addr), login_account_limiter.retry_after(account))
+        if wait:
+            return login_refused("Too many login attempts, please try again later", 429, wait)
+
+        try:
+            matches, needs_rehash = password_hasher.verify(user.password if user else None, password)
+        except HasherBusy:
+            return login_refused("Too many logins right now, please try again in a moment", 503, 1)
+
+        if matches:
+            login_account_limiter.reset(account)
+            if needs_rehash:
+                rehash_password(user, password)
+            if not login_user(user):
+                return login_refused("This account has been deactivated", 403)
+            app.logger.info('Login successful for user %s', user.id)
             return redirect(url_for('dashboard'))
-        else:
-            flash("Invalid credentials", "error")
+
+        login_account_limiter.hit(account)
+        flash("Invalid credentials", "error")
 
     return render_template("login.html")
 
 
+def rehash_password(user, password):
+    # Legacy plain passwords and hashes made with an older method are replaced on login;
+    # when the pool is busy it waits for the next one
+    try:
+        user.password = password_hasher.hash(password)
+    except HasherBusy:
+        return
+    db.session.commit()
+    password_hasher.rehashed += 1
+
+
 
 @app.route('/create_trivia_set', methods=['GET', 'POST'])
 @login_required
 def create_trivia_set():
     if request.method == 'POST':
-        set_title = request.form.get('set_title')
-        category = request.form.get('category')
-        difficulty = request.form.get('difficulty')
-        user_id = current_user.id  # type:ignore
-
-        trivia_set_id = generate_unique_id()
+        try:
+            trivia_set = set_from_form(request.form)
+        except ValueError as error:
+            flash(str(error), 'error')
+            return render_template('create_trivia_set.html')
 
-        trivia_set = TriviaSet(set_title=set_title, category=category, difficulty=difficulty, user_id=user_id, trivia_set_id=trivia_set_id)
-        db.session.add(trivia_set)
-        db.session.commit()
-
-        # Process and save questions and options
-        for question_num in range(1, 6):
-            question_text = request.form.get(f'question_{question_num}')
-            options = request.form.getlist(f'question_{question_num}_options[]')
-            correct_option = int(request.form.get(f'correct_option_{question_num}')) # type:ignore
-
-            # Create a new question associated with the trivia set
-            question = Question(question_text=question_text, question_type='multiple_choice', trivia_set_id=trivia_set.id)
-            db.session.add(question)
-            db.session.commit()
-
-            # Create options for the question
-            for option_num, option_text in enumerate(options, start=1):
-                is_correct = (option_num == correct_option)
-                option = Option(text=option_text, is_correct=is_correct, question_id=question.id)
-                db.session.add(option)
-                db.session.commit()
+        # The set, its questions and their options are written in one transaction
+        created = create_trivia_sets([trivia_set], user_id=current_user.id)  # type:ignore
+        trivia_sets_changed(created_set.id for created_set in created)
 
         flash('Trivia set created successfully', 'success')
         return redirect(url_for('dashboard'))
@@ -311,43 +522,16 @@ def edit_trivia_set(trivia_set_id):
         return redirect(url_for('dashboard'))
 
     if request.method == 'POST':
-        # Get the updated data from the form submission
-        set_title = request.form.get('set_title')
-        category = request.form.get('category')
-        difficulty = request.form.get('difficulty')
-
-        # Update the trivia set data
-        trivia_set.set_title = set_title
-        trivia_set.category = category
-        trivia_set.difficulty = difficulty
-
-        # Update questions and options
-        for question_num in range(1, 11):
-            question_text = request.form.get(f'questions_{question_num}_text')
-            question = trivia_set.questions[question_num - 1]
-
-            if question_text:
-                question.question_text = question_text
-
-            for option_num in range(1, 5):
-                option_text = request.form.get(f'options_{question_num}_{option_num}_text')
-                option = question.options[option_num - 1]
-
-                if option_text is not None:
-                    option.text = option_text
-
-                # Check if this option is the correct one based on the selected radio button
-                is_correct = (request.form.get(f'correct_option_{question_num}') == str(option_num))
-                option.is_correct = is_correct
-
-
-        # Commit changes to the database
-        db.session.commit()
+        try:
+            save_set_edit(trivia_set)
+        except ValueError as error:
+            flash(str(error), 'error')
+            return render_template('edit_trivia_set.html', trivia_set=trivia_set, questions=load_questions(trivia_set.id))
 
         flash('Trivia set updated successfully', 'success')
         return redirect(url_for('dashboard'))
 
-    return render_template('edit_trivia_set.html', trivia_set=trivia_set)
+    return render_template('edit_trivia_set.html', trivia_set=trivia_set, questions=load_questions(trivia_set.id))
 
 
 
@@ -369,39 +553,11 @@ def update_trivia_set(trivia_set_id):
         return redirect(url_for('dashboard'))
 
     if request.method == 'POST':
-        # Get the updated data from the form submission
-        set_title = request.form.get('set_title')
-        category = request.form.get('category')
-        difficulty = request.form.get('difficulty')
-
-        # Update the trivia set data
-        trivia_set.set_title = set_title
-        trivia_set.category = category
-        trivia_set.difficulty = difficulty
-
-        # Update questions and options
-        for question_num in range(1, 11):
-            question_text = request.form.get(f'question_{question_num}')
-            options = request.form.getlist(f'question_{question_num}_options[]')
-            correct_option = int(request.form.get(f'correct_option_{question_num}')) # type:ignore
-
-            # Check if the question exists before updating
-            if len(trivia_set.questions) >= question_num:
-                question = trivia_set.questions[question_num - 1]
-                question.question_text = question_text
-
-                # Update options for the question
-                for option_num, option_text in enumerate(options, start=1):
-                    is_correct = (option_num == correct_option)
-
-                    # Check if the option exists before updating
-                    if len(question.options) >= option_num:
-                        option = question.options[option_num - 1]
-                        option.text = option_text
-                        option.is_correct = is_correct
-
-        # Commit changes to the database
-        db.session.commit()
+        try:
+            save_set_edit(trivia_set)
+        except ValueError as error:
+            flash(str(error), 'error')
+            return redirect(url_for('edit_trivia_set', trivia_set_id=trivia_set.trivia_set_id))
 
         flash('Trivia set updated successfully', 'success')
         return redirect(url_for('dashboard'))
@@ -421,32 +577,15 @@ def submit_trivia_set(trivia_set_id):
         flash("Trivia set not found.", "error")
         return redirect(url_for('dashboard'))
 
-    # Get user's answers from the form submission
-    user_answers = {}
-    for question in trivia_set.questions:
-        answer_key = f"answer_{question.id}"
-        user_answers[question.id] = request.form.get(answer_key)
-
-    # Calculate the user's score
+    # Get user's answers from the form submission and calculate the score
+    user_answers = parse_answers(request.form, prefix='answer_')
     score = calculate_score(trivia_set, user_answers)
 
     # Update the user's score in the database
-    user_score = UserScore.query.filter_by(
-        user_id=current_user.id, trivia_set_id=trivia_set.id).first() # type:ignore
-
-    if not user_score:
-        # If no previous score exists, create a new entry
-        user_score = UserScore(
-        user_id=current_user.id, trivia_set_id=trivia_set.id, score=score) # type:ignore
-        db.session.add(user_score)
-    else:
-        # Update the existing score
-        user_score.score = score
+    record_score(current_user.id, trivia_set.id, score) # type:ignore
 
-    db.session.commit()
-
-    # Render the results HTML template
-    return render_template('trivia_results.html', trivia_set=trivia_set, user_score=score)
+    # Same results page as play_set (there is no trivia_results.html)
+    return redirect(url_for('results', set_id=trivia_set.id, score=score))
 
 
 
@@ -459,12 +598,8 @@ def delete_trivia_set(trivia_set_id):
     if trivia_set:
 
         if current_user.id == trivia_set.user_id:  # type:ignore
-            # delete associated questions first!!! important
-            for question in trivia_set.questions:
-                db.session.delete(question)
-            # Delete the trivia set and commit to db
-            db.session.delete(trivia_set)
-            db.session.commit()
+            # Options, questions and scores go with it, as set-based DELETEs
+            delete_sets([trivia_set.id])
 
             return redirect(url_for('dashboard'))
         else:
@@ -474,80 +609,500 @@ def delete_trivia_set(trivia_set_id):
         return "Trivia set not found", 404
 
 
+@app.route('/delete_trivia_sets', methods=['POST'])
+@login_required
+def delete_trivia_sets_route():
+    # Delete all of the user's sets, or only those in one category
+    category = request.form.get('category') or None
+    if category is None and request.form.get('all') != '1':
+        flash("Choose a category or confirm deleting all of your trivia sets.", "error")
+        return redirect(url_for('dashboard'))
+
+    deleted = delete_sets(set_ids_for(user_id=current_user.id, category=category)) # type: ignore
+    flash(f"Deleted {len(deleted.set_ids)} trivia sets.", "success")
+    return redirect(url_for('dashboard'))
+
+
+
 # Route to display results after the user submits their answers
 @app.route('/results/<int:set_id>/<int:score>')
 def results(set_id, score):
-    trivia_set = TriviaSet.query.get(set_id)
-    try:
-        user_score = UserScore.query.filter_by(trivia_set_id=set_id, user_id=current_user.id).first() # type: ignore
-    except:
-        user_score=score
-    return render_template('results.html', trivia_set=trivia_set, user_score=user_score, guest_score=score)
+    trivia_set = get_set_snapshot(set_id)
+    board = leaderboards.for_set(set_id)
+    standing = board.standing(current_user.id) if current_user.is_authenticated else None # type: ignore
+
+    def render():
+        try:
+            user_score = UserScore.query.filter_by(trivia_set_id=set_id, user_id=current_user.id).first() # type: ignore
+            # A queued score may not be committed yet
+            pending = score_writer.pending(current_user.id, set_id) # type: ignore
+            if pending is not None:
+                user_score = UserScore(user_id=current_user.id, trivia_set_id=set_id, score=pending) # type: ignore
+        except:
+            user_score=score
+
+        top_players = leaderboard_entries(board, limit=5)
+        return render_template('results.html', trivia_set=trivia_set, user_score=user_score, guest_score=score,
+                               top_players=top_players, standing=standing)
+
+    if trivia_set is None:
+        return render()
+    # The page shows the score, the top five and the player's standing, all in memory
+    top = ranked(board.top(5))
+    validators = page_validators('results', trivia_set.trivia_set_id, trivia_set.version, score, top, standing,
+                                 public=standing is None)
+    return http_caching.page(validators, render)
 
 @app.route('/play_set/<int:set_id>', methods=['GET', 'POST'])
 @login_required
 def play_set(set_id):
-    trivia_set = TriviaSet.query.get(set_id)
-    if not trivia_set:
-        # flash('Trivia set not found', 'danger')
-        return redirect(url_for('dashboard'))
-
     if request.method == 'POST':
-        score = 0
-        for question_id, selected_option_id in request.form.items():
-            question = Question.query.get(question_id)
-            selected_option = Option.query.get(selected_option_id)
+        # Scored against the cached answer key, no need to load the set itself
+        answer_key = get_answer_key(set_id)
+        if answer_key is None:
+            return redirect(url_for('dashboard'))
 
-            if question and selected_option:
-                if selected_option.is_correct:
-                    score += 1
+        score = answer_key.score(parse_answers(request.form))
 
-        user_score = UserScore(user_id=current_user.id, trivia_set_id=set_id, score=score) # type: ignore
-        db.session.add(user_score)
-        db.session.commit()
+        record_score(current_user.id, set_id, score) # type: ignore
         # flash(f'Your score: {score}', 'success')
         return redirect(url_for('results', set_id=set_id, score=score))  # Redirect to a dashboard page or another route
 
-    questions = trivia_set.questions.all()
-    return render_template('play_set.html', trivia_set=trivia_set, questions=questions)
-
-@app.route('/guest_play_set/<int:set_id>', methods=['GET', 'POST'])
-def guest_play_set(set_id):
-    trivia_set = TriviaSet.query.get(set_id)
+    # Set, questions and options come from one cached snapshot instead of 1+N queries
+    trivia_set = get_set_snapshot(set_id)
     if not trivia_set:
         # flash('Trivia set not found', 'danger')
         return redirect(url_for('dashboard'))
 
-    if request.method == 'POST':
-        score = 0
-        for question_id, selected_option_id in request.form.items():
-            question = Question.query.get(question_id)
-            selected_option = Option.query.get(selected_option_id)
+    validators = page_validators('play_set', trivia_set.trivia_set_id, trivia_set.version,
+                                 last_modified=trivia_set.updated_at, public=False)
+    return http_caching.page(validators, lambda: render_template('play_set.html', trivia_set=trivia_set,
+                                                                 questions=trivia_set.questions))
 
-            if question and selected_option:
-                if selected_option.is_correct:
-                    score += 1
+@app.route('/guest_play_set/<int:set_id>', methods=['GET', 'POST'])
+def guest_play_set(set_id):
+    if request.method == 'POST':
+        answer_key = get_answer_key(set_id)
+        if answer_key is None:
+            return redirect(url_for('dashboard'))
 
+        score = answer_key.score(parse_answers(request.form))
         # flash(f'Your score: {score}', 'success')
         return redirect(url_for('results', set_id=set_id, score=score))  # Redirect to a dashboard page or another route
 
-    questions = trivia_set.questions.all()
-    return render_template('guest_play_set.html', trivia_set=trivia_set, questions=questions)
+    trivia_set = get_set_snapshot(set_id)
+    if not trivia_set:
+        # flash('Trivia set not found', 'danger')
+        return redirect(url_for('dashboard'))
+
+    def render():
+        # Kept with the version it shows, so a reloaded snapshot never gets an older page
+        cached = guest_page_cache.get(set_id)
+        if cached is not None and cached[0] == trivia_set.version:
+            return cached[1]
+        page = render_template('guest_play_set.html', trivia_set=trivia_set, questions=trivia_set.questions)
+        guest_page_cache.set(set_id, (trivia_set.version, page))
+        return page
+
+    validators = page_validators('guest_play_set', trivia_set.trivia_set_id, trivia_set.version,
+                                 last_modified=trivia_set.updated_at)
+    return http_caching.page(validators, render)
 
 
 @app.route('/search', methods=['GET', 'POST'])
 def search():
-    if request.method == 'POST':
-        search_term = request.form.get('search_term', '')
+    # The form POSTs the term, further pages are plain GET links carrying a cursor
+    search_term = request.values.get('search_term', '')
+    if request.method == 'POST' or search_term:
+        trivia_sets, next_cursor = search_trivia_sets(
+            search_term, limit=app.config['SEARCH_PAGE_SIZE'], after=request.args.get('after'))
+
+        def render():
+            return render_template('search.html', trivia_sets=trivia_sets, search_term=search_term,
+                                   next_cursor=next_cursor)
+
+        if request.method == 'POST':
+            return render()
+        # Links differ for logged-in players, so their pages stay private
+        validators = page_validators('search', search_term, [(row.id, row.version) for row in trivia_sets],
+                                     next_cursor, current_user.is_authenticated,
+                                     public=not current_user.is_authenticated)
+        return http_caching.page(validators, render)
 
-        # Query trivia sets matching the search term in 'set_title' or 'category'
-        trivia_sets = TriviaSet.query.filter(
-            or_(TriviaSet.set_title.ilike(f"%{search_term}%"), TriviaSet.category.ilike(f"%{search_term}%"))
-        ).all()
+    return render_template('search.html')
 
-        return render_template('search.html', trivia_sets=trivia_sets, search_term=search_term)
 
-    return render_template('search.html')
+
+# Play session API
+#--------------------------------------------------------------------------------------
+# The client fetches a set once, posts answers one question (or a batch) at a time and
+# finishes the play at the end. Progress lives in the signed session cookie, only the
+# first answer to each question counts. Starting a play clears what an abandoned one
+# left behind, so a new play never inherits its answers.
+MAX_PLAYS_IN_SESSION = 5
+
+
+def play_progress(set_id):
+    plays = session.get('plays', {})
+    return plays.get(str(set_id), {})
+
+
+def save_play_progress(set_id, progress):
+    plays = dict(session.get('plays', {}))
+    plays.pop(str(set_id), None)
+    if progress is not None:
+        plays[str(set_id)] = progress
+    # Oldest plays drop out so the cookie stays small
+    while len(plays) > MAX_PLAYS_IN_SESSION:
+        plays.pop(next(iter(plays)))
+    session['plays'] = plays
+
+
+@app.route('/api/sets/<int:set_id>')
+def api_trivia_set(set_id):
+    trivia_set = get_set_snapshot(set_id)
+    if trivia_set is None:
+        abort(404)
+
+    validators = page_validators('api_trivia_set', trivia_set.trivia_set_id, trivia_set.version,
+                                 last_modified=trivia_set.updated_at)
+    return http_caching.page(validators, lambda: jsonify(
+        id=trivia_set.id,
+        set_title=trivia_set.set_title,
+        category=trivia_set.category,
+        difficulty=trivia_set.difficulty,
+        questions=[{
+            'id': question.id,
+            'question_text': question.question_text,
+            'question_type': question.question_type,
+            # An open-ended question's options are its accepted answers
+            'options': [] if question.question_type == 'open_ended' else
+                       [{'id': option.id, 'text': option.text} for option in question.options],
+        } for question in trivia_set.questions],
+    ))
+
+
+@app.route('/api/sets/<int:set_id>/start', methods=['POST'])
+def api_start(set_id):
+    answer_key = get_answer_key(set_id)
+    if answer_key is None:
+        abort(404)
+
+    save_play_progress(set_id, {})
+    return jsonify(answered=0, total=len(answer_key.correct_options()))
+
+
+@app.route('/api/sets/<int:set_id>/answers', methods=['POST'])
+def api_answer(set_id):
+    # Accepts {"question_id": 1, "option_id": 2} or {"answers": {"1": 2, ...}}; open-ended
+    # questions take typed text, {"question_id": 1, "answer": "..."} or {"answers": {"1": "..."}}
+    answer_key = get_answer_key(set_id)
+    if answer_key is None:
+        abort(404)
+
+    data = request.get_json(silent=True) or {}
+    if 'answers' in data and isinstance(data['answers'], dict):
+        answers = parse_answers(data['answers'])
+    else:
+        answers = parse_answers({data.get('question_id'): data.get('option_id', data.get('answer'))})
+
+    progress = dict(play_progress(set_id))
+    correct_options = answer_key.correct_options()
+    results = {}
+    for question_id, correct in answer_key.grade(answers).items():
+        if question_id not in correct_options:
+            continue
+        # Answered questions keep their first result
+        correct = progress.setdefault(str(question_id), correct)
+        accepted = answer_key.accepted_answer(question_id)
+        if accepted is not None:
+            # Open-ended: the option ids are never shown, so send the answer itself
+            results[question_id] = {'correct': correct, 'answer': accepted}
+        else:
+            results[question_id] = {'correct': correct, 'correct_option_id': correct_options[question_id]}
+    save_play_progress(set_id, progress)
+
+    return jsonify(results=results, score=sum(progress.values()), answered=len(progress), total=len(correct_options))
+
+
+@app.route('/api/sets/<int:set_id>/finish', methods=['POST'])
+def api_finish(set_id):
+    if get_answer_key(set_id) is None:
+        abort(404)
+
+    progress = play_progress(set_id)
+    score = sum(progress.values())
+    save_play_progress(set_id, None)
+
+    if current_user.is_authenticated:
+        record_score(current_user.id, set_id, score) # type: ignore
+    return jsonify(score=score, results_url=url_for('results', set_id=set_id, score=score))
+
+
+
+def leaderboard_entries(board, limit):
+    top = board.top(limit)
+    usernames = dict(
+        db.session.query(User.id, User.username).filter(User.id.in_([user_id for user_id, _ in top])).all()
+    ) if top else {}
+    return [{'rank': rank, 'user_id': user_id, 'username': usernames.get(user_id), 'score': score}
+            for rank, user_id, score in ranked(top)]
+
+
+def leaderboard_limit():
+    return max(1, min(request.args.get('limit', 10, type=int), 100))
+
+
+@app.route('/api/leaderboards/global')
+def global_leaderboard():
+    board = leaderboards.global_board()
+    return jsonify(players=len(board), top=leaderboard_entries(board, leaderboard_limit()))
+
+
+@app.route('/api/leaderboards/global/users/<int:user_id>')
+def global_leaderboard_user(user_id):
+    return jsonify(leaderboards.global_board().standing(user_id))
+
+
+@app.route('/api/leaderboards/<int:set_id>')
+def set_leaderboard(set_id):
+    board = leaderboards.for_set(set_id)
+    return jsonify(trivia_set_id=set_id, players=len(board), top=leaderboard_entries(board, leaderboard_limit()))
+
+
+@app.route('/api/leaderboards/<int:set_id>/users/<int:user_id>')
+def set_leaderboard_user(set_id, user_id):
+    return jsonify(trivia_set_id=set_id, **leaderboards.for_set(set_id).standing(user_id))
+
+
+
+# Similar sets and recommendations
+#--------------------------------------------------------------------------------------
+# Both are empty until the index has been built with `flask build-similarity-index`.
+def recommendation_limit():
+    return max(1, min(request.args.get('limit', 10, type=int), 50))
+
+
+@app.route('/api/sets/<int:set_id>/similar')
+def similar_sets(set_id):
+    return jsonify(trivia_set_id=set_id,
+                   sets=describe_sets(similarity_index.similar(set_id, recommendation_limit())))
+
+
+@app.route('/api/recommendations')
+@login_required
+def recommendations():
+    return jsonify(sets=describe_sets(similarity_index.recommend(current_user.id, recommendation_limit()))) # type: ignore
+
+
+
+# Live rooms
+#--------------------------------------------------------------------------------------
+# A host opens a room for one of the sets and shares its code. Players join (guests
+# too), get questions pushed over server-sent events from /rooms/<code>/events and
+# answer through the JSON endpoint; the server keeps the clock and the scores.
+MAX_ROOMS_IN_SESSION = 5
+
+
+def room_or_404(code):
+    room = live_rooms.get(code)
+    if room is None:
+        abort(404)
+    return room
+
+
+def host_room_or_403(code):
+    room = room_or_404(code)
+    if not current_user.is_authenticated or room.host_id != current_user.id: # type: ignore
+        abort(403)
+    return room
+
+
+def room_player_id(code):
+    return session.get('rooms', {}).get(code)
+
+
+def save_room_player(code, player_id):
+    rooms = dict(session.get('rooms', {}))
+    rooms.pop(code, None)
+    rooms[code] = player_id
+    while len(rooms) > MAX_ROOMS_IN_SESSION:
+        rooms.pop(next(iter(rooms)))
+    session['rooms'] = rooms
+
+
+@app.route('/rooms', methods=['GET', 'POST'])
+def open_room():
+    if request.method == 'GET':
+        # Join by code
+        code = request.args.get('code', '').strip().upper()
+        if live_rooms.get(code) is None:
+            flash('No live room with that code', 'error')
+            return redirect(url_for('dashboard') if current_user.is_authenticated else url_for('home'))
+        return redirect(url_for('live_room', code=code))
+
+    if not current_user.is_authenticated:
+        return login_manager.unauthorized()
+    set_id = request.form.get('set_id', type=int)
+    trivia_set = get_set_snapshot(set_id) if set_id else None
+    if trivia_set is None or not trivia_set.questions:
+        abort(404)
+    try:
+        room = live_rooms.create(trivia_set, get_answer_key(set_id), current_user.id, # type: ignore
+                                 seconds=request.form.get('seconds', type=int))
+    except ValueError as error:
+        return jsonify(error=str(error)), 503
+    return redirect(url_for('host_room', code=room.code))
+
+
+@app.route('/rooms/<code>')
+def live_room(code):
+    room = room_or_404(code)
+    return render_template('live_room.html', room=room, player_id=room_player_id(room.code))
+
+
+@app.route('/rooms/<code>/host')
+@login_required
+def host_room(code):
+    room = host_room_or_403(code)
+    return render_template('host_room.html', room=room, join_url=url_for('live_room', code=room.code, _external=True))
+
+
+@app.route('/rooms/<code>/join', methods=['POST'])
+def join_room(code):
+    room = room_or_404(code)
+    data = request.get_json(silent=True) or request.form
+    player_id = room_player_id(room.code)
+    if player_id is None or player_id not in room.players:
+        user_id = current_user.id if current_user.is_authenticated else None # type: ignore
+        name = current_user.username if current_user.is_authenticated else data.get('name') # type: ignore
+        try:
+            player_id = room.join(name, user_id)
+        except ValueError as error:
+            return jsonify(error=str(error)), 409
+        save_room_player(room.code, player_id)
+    return jsonify(player_id=player_id, events_url=url_for('room_events', code=room.code))
+
+
+@app.route('/rooms/<code>/answer', methods=['POST'])
+def room_answer(code):
+    room = room_or_404(code)
+    data = request.get_json(silent=True) or {}
+    # {"question_id": 1, "option_id": 2}, or {"question_id": 1, "answer": "..."} for open-ended questions
+    answers = parse_answers({data.get('question_id'): data.get('option_id', data.get('answer'))})
+    if not answers:
+        return jsonify(error='Send a question_id and an option_id or answer'), 409
+    (question_id, answer), = answers.items()
+    try:
+        result = room.answer(room_player_id(room.code), question_id, answer)
+    except (TypeError, ValueError) as error:
+        return jsonify(error=str(error)), 409
+    return jsonify(result)
+
+
+@app.route('/rooms/<code>/start', methods=['POST'])
+@login_required
+def start_room(code):
+    room = host_room_or_403(code)
+    try:
+        room.start()
+    except ValueError as error:
+        return jsonify(error=str(error)), 409
+    return jsonify(room.snapshot())
+
+
+@app.route('/rooms/<code>/next', methods=['POST'])
+@login_required
+def advance_room(code):
+    room = host_room_or_403(code)
+    room.advance()
+    return jsonify(room.snapshot())
+
+
+@app.route('/rooms/<code>/state')
+def room_state(code):
+    room = room_or_404(code)
+    return jsonify(room.snapshot(room_player_id(room.code)))
+
+
+@app.route('/rooms/<code>/events')
+def room_events(code):
+    room = room_or_404(code)
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    try:
+        stream = live_rooms.open_stream(room, room_player_id(room.code), last_event_id)
+    except ValueError as error:
+        # live_room.js tries again after a while
+        response = jsonify(error=str(error))
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    # The stream never touches the database, so no request context is kept for it
+    response = Response(stream, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'   # don't let nginx buffer the stream
+    return response
+
+
+
+@app.route('/cache_stats')
+@login_required
+def cache_stats():
+    return jsonify(shared=shared_cache.stats(), answer_keys=answer_key_cache.stats(),
+                   set_snapshots=snapshot_cache.stats(), guest_pages=guest_page_cache.stats(),
+                   score_writer=score_writer.stats(), compaction=compaction_job.stats(),
+                   session_users=session_user_cache.stats(), live_rooms=live_rooms.stats(),
+                   passwords=password_hasher.stats(), dashboards=dashboard_summaries.stats(),
+                   static_assets=static_assets.stats(), similarity=similarity_index.stats(),
+                   http_conditional=http_caching.stats())
+
+
+
+# Export and import
+#--------------------------------------------------------------------------------------
+# NDJSON, one set per line (same shape as the JSON content packs), optionally gzipped.
+# Exports are streamed from a single cursor; imports commit in batches and report the
+# last committed line so an interrupted upload can be resumed with ?start_line=.
+@app.route('/export/sets.ndjson')
+@login_required
+def export_sets():
+    lines = ndjson_lines(export_trivia_sets(user_id=current_user.id)) # type: ignore
+    if request.args.get('gzip') == '1':
+        response = Response(stream_with_context(gzip_chunks(lines)), mimetype='application/gzip')
+        filename = 'trivia_sets.ndjson.gz'
+    else:
+        response = Response(stream_with_context(lines), mimetype='application/x-ndjson')
+        filename = 'trivia_sets.ndjson'
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+
+
+@app.route('/import/sets', methods=['POST'])
+@login_required
+def import_sets():
+    start_line = request.args.get('start_line', 0, type=int)
+    batch_size = min(request.args.get('batch_size', 500, type=int), 5000)
+    committed = {'line': start_line}
+
+    def batch_written(created, last_line):
+        trivia_sets_changed(created_set.id for created_set in created)
+        committed['line'] = last_line
+
+    try:
+        imported, skipped = import_trivia_set_stream(read_ndjson_lines(request.stream), current_user.id, # type: ignore
+                                                     batch_size=batch_size, start_line=start_line,
+                                                     on_batch=batch_written)
+    except ValueError as error:
+        return jsonify(error=str(error), last_line=committed['line']), 400
+    return jsonify(imported=imported, skipped=skipped, last_line=committed['line'])
+
+
+
+@app.route('/metrics')
+def metrics():
+    if not request_metrics.may_scrape():
+        abort(401 if app.config['METRICS_TOKEN'] else 403)
+    return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
 
 
 
@@ -559,7 +1114,218 @@ def logout():
 
 
 
+# CLI commands
+#--------------------------------------------------------------------------------------
+@app.cli.command('import-sets')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user', 'username', required=True, help='Username or email that will own the imported sets.')
+@click.option('--format', 'file_format', type=click.Choice(['json', 'csv']), help='Defaults to the file extension.')
+@click.option('--batch-size', default=500, show_default=True, help='Sets written per bulk insert.')
+def import_sets_command(path, username, file_format, batch_size):
+    """Bulk import trivia sets from a JSON or CSV content pack."""
+    user = User.query.filter((User.username == username) | (User.email == username)).first()
+    if user is None:
+        raise click.ClickException(f"No user named '{username}'")
+
+    try:
+        created = import_trivia_sets(read_sets(path, file_format), user.id, batch_size=batch_size)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    trivia_sets_changed(created_set.id for created_set in created)
+
+    click.echo(f"Imported {len(created)} trivia sets "
+               f"({sum(len(trivia_set.question_ids) for trivia_set in created)} questions)")
+
+
+
+@app.cli.command('export-sets')
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--user', 'username', help='Only export sets owned by this username or email.')
+def export_sets_command(path, username):
+    """Stream every trivia set to an NDJSON file (gzipped when PATH ends in .gz)."""
+    user_id = None
+    if username:
+        user = User.query.filter((User.username == username) | (User.email == username)).first()
+        if user is None:
+            raise click.ClickException(f"No user named '{username}'")
+        user_id = user.id
+
+    count = write_export(path, export_trivia_sets(user_id=user_id))
+    click.echo(f"Exported {count} trivia sets to {path}")
+
+
+
+@app.cli.command('import-ndjson')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user', 'username', required=True, help='Username or email that will own the imported sets.')
+@click.option('--batch-size', default=500, show_default=True, help='Sets committed per batch.')
+@click.option('--checkpoint', 'checkpoint_path', help='Defaults to PATH.checkpoint.')
+@click.option('--restart', is_flag=True, help='Ignore an existing checkpoint and start from the first line.')
+def import_ndjson_command(path, username, batch_size, checkpoint_path, restart):
+    """Import an NDJSON export in committed batches, resuming from the last checkpoint."""
+    user = User.query.filter((User.username == username) | (User.email == username)).first()
+    if user is None:
+        raise click.ClickException(f"No user named '{username}'")
+
+    checkpoint_path = checkpoint_path or path + '.checkpoint'
+    start_line = 0 if restart else read_checkpoint(checkpoint_path)
+    if start_line:
+        click.echo(f"Resuming after line {start_line}")
+
+    def batch_written(created, last_line):
+        trivia_sets_changed(created_set.id for created_set in created)
+        write_checkpoint(checkpoint_path, last_line)
+
+    with open(path, 'rb') as f:
+        try:
+            imported, skipped = import_trivia_set_stream(read_ndjson_lines(f), user.id, batch_size=batch_size,
+                                                         start_line=start_line, on_batch=batch_written)
+        except ValueError as error:
+            raise click.ClickException(str(error))
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    click.echo(f"Imported {imported} trivia sets, skipped {skipped} already present")
+
+
+
+@app.cli.command('delete-sets')
+@click.option('--user', 'username', help='Delete the sets owned by this username or email.')
+@click.option('--category', help='Delete the sets in this category.')
+@click.option('--yes', is_flag=True, help='Do not ask for confirmation.')
+def delete_sets_command(username, category, yes):
+    """Delete trivia sets by owner and/or category, with their questions, options and scores."""
+    if not username and not category:
+        raise click.UsageError('Give --user and/or --category')
+    user_id = None
+    if username:
+        user = User.query.filter((User.username == username) | (User.email == username)).first()
+        if user is None:
+            raise click.ClickException(f"No user named '{username}'")
+        user_id = user.id
+
+    set_ids = set_ids_for(user_id=user_id, category=category)
+    if not set_ids:
+        click.echo('No matching trivia sets')
+        return
+    if not yes:
+        click.confirm(f'Delete {len(set_ids)} trivia sets?', abort=True)
+
+    deleted = delete_sets(set_ids)
+    click.echo(f"Deleted {len(deleted.set_ids)} trivia sets, {deleted.questions} questions, "
+               f"{deleted.options} options and {deleted.scores} scores")
+
+
+
+@app.cli.command('compact-db')
+@click.option('--batch-size', default=5000, show_default=True, help='Rows deleted per transaction.')
+@click.option('--dry-run', is_flag=True, help='Only count the orphaned rows.')
+@click.option('--vacuum', 'run_vacuum', is_flag=True, help='VACUUM afterwards to give the space back.')
+def compact_db_command(batch_size, dry_run, run_vacuum):
+    """Remove options, questions and scores orphaned by deleted trivia sets."""
+    if dry_run:
+        orphans = count_orphans()
+        click.echo(f"Orphaned: {orphans.options} options, {orphans.questions} questions, {orphans.scores} scores "
+                   f"and {orphans.signatures} duplicate signatures")
+        return
+
+    result = compact(batch_size)
+    orphans_compacted(result)
+    pruned = prune_search_index()
+    # Also catches signatures left by questions compacted before they were removed together
+    signatures = result.signatures + prune_signatures()
+    click.echo(f"Removed {result.options} options, {result.questions} questions, {result.scores} scores, "
+               f"{pruned} search entries and {signatures} duplicate signatures")
+    if run_vacuum and vacuum():
+        click.echo('Vacuumed')
+
+
+
+@app.cli.command('hash-passwords')
+def hash_passwords_command():
+    """Hash every password still stored in plain text."""
+    count = 0
+    for user in User.query.all():
+        if not is_hashed(user.password):
+            user.password = password_hasher.hash(user.password)
+            count += 1
+    db.session.commit()
+    click.echo(f'Hashed {count} passwords')
+
+
+@app.cli.command('set-user-active')
+@click.argument('username')
+@click.option('--active/--inactive', default=True, help='Reactivate or deactivate the account')
+def set_user_active_command(username, active):
+    """Deactivate or reactivate an account. Running workers notice within SESSION_USER_CACHE_TTL."""
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f'No user named {username}')
+    user.is_active = active
+    db.session.commit()
+    users_changed([user.id])
+    click.echo(f"{username} is now {'active' if active else 'inactive'}")
+
+
+@app.cli.command('dedup-questions')
+@click.option('--rebuild', is_flag=True, help='Recompute every signature instead of only the missing ones.')
+@click.option('--merge', is_flag=True, help='Delete questions repeated within their own set.')
+@click.option('--threshold', type=float, default=None, help='Similarity that counts as a duplicate [DEDUP_THRESHOLD].')
+def dedup_questions_command(rebuild, merge, threshold):
+    """Flag near-duplicate questions and report the space they take."""
+    threshold = app.config['DEDUP_THRESHOLD'] if threshold is None else threshold
+    pruned = prune_signatures()
+    set_ids = set_ids_for() if rebuild else unindexed_set_ids()
+    if rebuild:
+        # Start empty so questions are only compared with ones indexed before them
+        clear_signatures()
+    flagged = index_questions(set_ids, threshold)
+    click.echo(f"Indexed {len(set_ids)} trivia sets, flagged {flagged} questions, pruned {pruned} stale signatures")
+
+    if merge:
+        merged = merge_within_sets()
+        bump_set_versions(merged)
+        db.session.commit()
+        trivia_sets_changed(list(merged))
+        click.echo(f"Deleted {sum(len(ids) for ids in merged.values())} questions repeated in {len(merged)} sets")
+
+    report = duplicate_report()
+    click.echo(f"{report.duplicates} of {report.indexed} questions duplicate {report.originals} others. Removing them "
+               f"would free {report.duplicates + report.options} rows and "
+               f"{(report.question_bytes + report.option_bytes) / 1024:.1f} KB of text")
+
+
+@app.cli.command('build-similarity-index')
+def build_similarity_index_command():
+    """Build the similar-sets index from the trivia set tables."""
+    count = similarity_index.build(set_documents)
+    click.echo(f'Indexed {count} trivia sets in {similarity_index.path}')
+
+
+@app.cli.command('build-assets')
+@click.option('--max-width', default=2560, show_default=True, help='Images wider than this are scaled down.')
+@click.option('--quality', default=80, show_default=True, help='WebP and JPEG quality.')
+@click.option('--clean', is_flag=True, help='Remove files left over from earlier builds.')
+def build_assets_command(max_width, quality, clean):
+    """Write content-hashed, precompressed copies of the static files to static/dist."""
+    manifest = build_assets(app.static_folder, max_width=max_width, quality=quality, clean=clean)
+    sizes = manifest['sizes']
+    click.echo(f"Built {len(manifest['files'])} files: {sizes['source'] / 1024:.0f} KB -> "
+               f"{sizes['built'] / 1024:.0f} KB with the smallest variant of each")
+    for package in missing_asset_packages():
+        click.echo(f'{package} is not installed, skipped what needs it')
+
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Rebuild the full-text search index from the trivia set tables."""
+    rebuild_search_index()
+    click.echo('Search index rebuilt')
+
+
+
 if __name__ == "__main__":
     with app.app_context():
         db.create_all()
+        ensure_search_index()
     app.run(debug=True, host='0.0.0.0')
@@ -0,0 +1,98 @@
+# benchmarks/bench_dashboard.py
+#
+# Dashboard for a power user with thousands of sets: the old page (every set loaded
+# as an ORM object), the same with per-set counts done one query at a time, and the
+# paginated page with the grouped counts and the cached summary, cold and warm.
+#
+#   python -m benchmarks.bench_dashboard --sets 5000
+import argparse
+
+from sqlalchemy import func, insert
+
+from benchmarks.common import QueryCounter, load_app, seed_user, summarize, timed
+
+
+def seed(trivia_app, user_id, num_sets, num_questions, num_players):
+    db = trivia_app.db
+    for first in range(0, num_sets, 500):
+        trivia_app.create_trivia_sets([
+            {'set_title': f'Bench {set_num}', 'category': f'Category {set_num % 20}', 'difficulty': 'easy',
+             'questions': [{'question_text': f'Question {question_num}', 'question_type': 'multiple_choice',
+                            'options': [{'text': 'Right', 'is_correct': True}, {'text': 'Wrong', 'is_correct': False}]}
+                           for question_num in range(num_questions)]}
+            for set_num in range(first, min(first + 500, num_sets))
+        ], user_id)
+    db.session.execute(insert(trivia_app.User), [
+        {'username': f'player{player_num}', 'email': f'player{player_num}@example.com', 'password': ''}
+        for player_num in range(num_players)
+    ])
+    set_ids = db.session.scalars(db.select(trivia_app.TriviaSet.id)).all()
+    player_ids = db.session.scalars(db.select(trivia_app.User.id).where(trivia_app.User.id != user_id)).all()
+    db.session.execute(insert(trivia_app.UserScore), [
+        {'user_id': player_id, 'trivia_set_id': set_id, 'score': (set_id + player_id) % (num_questions + 1)}
+        for set_id in set_ids for player_id in player_ids
+    ])
+    db.session.commit()
+
+
+def legacy_page(trivia_app, user_id):
+    return trivia_app.TriviaSet.query.filter_by(user_id=user_id).all()
+
+
+def legacy_counts(trivia_app, user_id):
+    UserScore = trivia_app.UserScore
+    rows = []
+    for trivia_set in legacy_page(trivia_app, user_id):
+        plays, score_sum = trivia_app.db.session.execute(
+            trivia_app.db.select(func.count(), func.sum(UserScore.score)).where(UserScore.trivia_set_id == trivia_set.id)
+        ).one()
+        rows.append((trivia_set, trivia_set.questions.count(), plays, score_sum))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Dashboard for a user with many sets')
+    parser.add_argument('--sets', type=int, default=3000)
+    parser.add_argument('--questions', type=int, default=10)
+    parser.add_argument('--players', type=int, default=5, help='scores per set')
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    trivia_app = load_app()
+    db = trivia_app.db
+    summaries = trivia_app.dashboard_summaries
+    with trivia_app.app.app_context():
+        user_id = seed_user(trivia_app)
+        seed(trivia_app, user_id, args.sets, args.questions, args.players)
+
+        def cold_summary():
+            summaries.clear()
+            summaries.for_user(user_id)
+
+        page_size = trivia_app.app.config['DASHBOARD_PAGE_SIZE']
+        cases = (
+            ('all sets, no counts', lambda: legacy_page(trivia_app, user_id)),
+            ('all sets, counts per set', lambda: legacy_counts(trivia_app, user_id)),
+            ('page of sets', lambda: trivia_app.dashboard_page(user_id, limit=page_size)),
+            ('summary, cold', cold_summary),
+            ('summary, warm', lambda: summaries.for_user(user_id)),
+        )
+        print(f'{args.sets} sets of {args.questions} questions, {args.players} scores each, pages of {page_size}')
+        print(f"{'case':>24} | {'queries':>7} | {'mean ms':>8} | {'p99 ms':>8}")
+        for name, run in cases:
+            db.session.remove()
+            with QueryCounter(db.engine) as counter:
+                run()
+            runs = args.runs if 'per set' not in name else max(1, args.runs // 10)
+            result = summarize(timed(lambda: (run(), db.session.remove()), runs))
+            print(f"{name:>24} | {counter.count:>7} | {result['mean_ms']:>8.2f} | {result['p99_ms']:>8.2f}")
+
+    client = trivia_app.app.test_client()
+    client.post('/login', data={'email': 'bench@example.com', 'password': 'bench'})
+    client.get('/dashboard')
+    result = summarize(timed(lambda: client.get('/dashboard'), args.runs))
+    print(f"{'GET /dashboard':>24} | {'':>7} | {result['mean_ms']:>8.2f} | {result['p99_ms']:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# benchmarks/bench_dedup.py
+#
+# Duplicate question detection: bulk indexing throughput, the cost of checking one new
+# set as the number of stored questions grows (it should stay flat), and how many of
+# the planted near duplicates (copies with small edits) are flagged.
+#
+#   python -m benchmarks.bench_dedup --sizes 1000 10000 50000
+import argparse
+import random
+import time
+
+from benchmarks.common import QueryCounter, load_app, seed_user, summarize, timed
+from models import QuestionSignature
+
+WORDS = ['capital', 'river', 'planet', 'largest', 'smallest', 'first', 'famous', 'painter', 'composer', 'battle',
+         'ocean', 'mountain', 'element', 'author', 'novel', 'empire', 'island', 'desert', 'bridge', 'language',
+         'currency', 'tower', 'city', 'country', 'king', 'queen', 'war', 'treaty', 'animal', 'bird']
+
+
+def random_question(rng):
+    text = ' '.join(rng.choice(WORDS) + str(rng.randrange(500)) for _ in range(rng.randint(5, 9)))
+    return text, [f'{rng.choice(WORDS)} {rng.randrange(1000)}' for _ in range(4)]
+
+
+def near_copy(question, rng):
+    # Same question with a word changed case, punctuation added or a filler word added
+    text, options = question
+    text_words = text.split()
+    edit = rng.randrange(3)
+    if edit == 0:
+        position = rng.randrange(len(text_words))
+        text_words[position] = text_words[position].upper()
+    elif edit == 1:
+        text_words[-1] += '?'
+    else:
+        text_words.insert(rng.randrange(len(text_words)), 'the')
+    return ' '.join(text_words), list(options)
+
+
+def trivia_set(questions, num):
+    return {'set_title': f'Dedup {num}', 'category': 'Bench', 'difficulty': 'easy',
+            'questions': [{'question_text': text, 'question_type': 'multiple_choice',
+                           'options': [{'text': option, 'is_correct': option_num == 0}
+                                       for option_num, option in enumerate(options)]}
+                          for text, options in questions]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Duplicate question detection cost and recall')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000], help='stored questions')
+    parser.add_argument('--duplicate-rate', type=float, default=0.1)
+    parser.add_argument('--runs', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    trivia_app = load_app()
+    app, db = trivia_app.app, trivia_app.db
+    threshold = app.config['DEDUP_THRESHOLD']
+    rng = random.Random(args.seed)
+    stored, planted = [], set()
+
+    with app.app_context():
+        user_id = seed_user(trivia_app)
+        print(f"{'stored':>8} | {'bulk q/s':>8} | {'check set ms':>12} | {'p99 ms':>7} | {'queries':>7} | {'recall':>6}")
+        for size in sorted(args.sizes):
+            # Grow the bank to `size` questions, some of them near copies of earlier ones
+            new_questions, copies = [], set()
+            while len(stored) + len(new_questions) < size:
+                if stored and rng.random() < args.duplicate_rate:
+                    copies.add(len(new_questions))
+                    new_questions.append(near_copy(rng.choice(stored), rng))
+                else:
+                    new_questions.append(random_question(rng))
+            sets = [trivia_set(new_questions[start:start + 10], start) for start in range(0, len(new_questions), 10)]
+            created = trivia_app.create_trivia_sets(sets, user_id)
+            question_ids = [question_id for created_set in created for question_id in created_set.question_ids]
+            planted.update(question_ids[position] for position in copies)
+            started = time.perf_counter()
+            trivia_app.index_questions([created_set.id for created_set in created], threshold)
+            bulk_rate = len(new_questions) / (time.perf_counter() - started)
+            stored.extend(new_questions)
+
+            flagged = set(db.session.scalars(db.select(QuestionSignature.question_id)
+                                             .where(QuestionSignature.duplicate_of.is_not(None))))
+            recall = len(planted & flagged) / len(planted) if planted else 1.0
+
+            # One new set of 10 questions, two of them copies, checked against the bank
+            def check_set():
+                questions = [random_question(rng) for _ in range(8)] + [near_copy(rng.choice(stored), rng)
+                                                                        for _ in range(2)]
+                new_set = trivia_app.create_trivia_sets([trivia_set(questions, 'check')], user_id)[0]
+                trivia_app.index_questions([new_set.id], threshold)
+                trivia_app.delete_trivia_sets([new_set.id])
+
+            with QueryCounter(db.engine) as counter:
+                new_set = trivia_app.create_trivia_sets([trivia_set([random_question(rng)], 'count')], user_id)[0]
+                before = counter.count
+                trivia_app.index_questions([new_set.id], threshold)
+                queries = counter.count - before
+            trivia_app.delete_trivia_sets([new_set.id])
+            result = summarize(timed(check_set, args.runs))
+            print(f"{size:>8} | {bulk_rate:>8.0f} | {result['mean_ms']:>12.2f} | {result['p99_ms']:>7.2f} | "
+                  f"{queries:>7} | {100 * recall:>5.0f}%")
+        print('check set: create a 10 question set, check it, delete it again')
+
+
+if __name__ == '__main__':
+    main()
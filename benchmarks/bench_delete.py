@@ -0,0 +1,58 @@
+# benchmarks/bench_delete.py
+#
+# Deleting N sets: per-object ORM deletes (load each set and delete its options,
+# questions, scores and the set one object at a time; the old route body did this for
+# questions only and failed on the options' NOT NULL question_id) vs the set-based bulk
+# delete. Each side gets its own identical copy of the data.
+import argparse
+import time
+
+from benchmarks.common import QueryCounter, load_app, seed_user
+from benchmarks.bench_export import synthetic_sets
+
+
+def orm_delete(trivia_app, set_ids):
+    db = trivia_app.db
+    for set_id in set_ids:
+        trivia_set = db.session.get(trivia_app.TriviaSet, set_id)
+        for question in trivia_set.questions:
+            for option in question.options:
+                db.session.delete(option)
+            db.session.delete(question)
+        for user_score in trivia_app.UserScore.query.filter_by(trivia_set_id=set_id):
+            db.session.delete(user_score)
+        db.session.delete(trivia_set)
+        db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Deleting many sets, per-object ORM deletes vs bulk DELETEs')
+    parser.add_argument('--sets', type=int, default=1000)
+    args = parser.parse_args()
+
+    trivia_app = load_app()
+    db = trivia_app.db
+    with trivia_app.app.app_context():
+        user_id = seed_user(trivia_app)
+        orm_ids = [created.id for created in trivia_app.import_trivia_sets(synthetic_sets(args.sets), user_id)]
+        bulk_ids = [created.id for created in trivia_app.import_trivia_sets(synthetic_sets(args.sets), user_id)]
+        for set_id in orm_ids + bulk_ids:
+            db.session.add(trivia_app.UserScore(user_id=user_id, trivia_set_id=set_id, score=3))
+        db.session.commit()
+        print(f'seeded 2 x {args.sets} sets x 10 questions x 4 options, one score each')
+
+        print(f"{'delete':>6} | {'queries':>7} | {'seconds':>8} | {'orphaned options':>16} | {'orphaned scores':>15}")
+        for name, set_ids, run in (('orm', orm_ids, lambda ids: orm_delete(trivia_app, ids)),
+                                   ('bulk', bulk_ids, trivia_app.delete_trivia_sets)):
+            before = trivia_app.count_orphans()
+            with QueryCounter(db.engine) as counter:
+                started = time.perf_counter()
+                run(set_ids)
+                elapsed = time.perf_counter() - started
+            after = trivia_app.count_orphans()
+            print(f"{name:>6} | {counter.count:>7} | {elapsed:>8.2f} | {after.options - before.options:>16} | "
+                  f"{after.scores - before.scores:>15}")
+
+
+if __name__ == '__main__':
+    main()
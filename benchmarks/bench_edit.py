@@ -0,0 +1,83 @@
+# benchmarks/bench_edit.py
+#
+# Saving the edit page for a 10 question set: the old loop (one OFFSET query per
+# question and option on the dynamic relationships, every option rewritten) vs the
+# diff engine, for an unchanged form and for a form with a single changed option.
+import argparse
+
+from werkzeug.datastructures import MultiDict
+
+from benchmarks.common import QueryCounter, load_app, seed_trivia_set, seed_user, summarize, timed
+
+
+def legacy_edit(trivia_app, set_id, form):
+    trivia_set = trivia_app.db.session.get(trivia_app.TriviaSet, set_id)
+    trivia_set.set_title = form.get('set_title')
+    trivia_set.category = form.get('category')
+    trivia_set.difficulty = form.get('difficulty')
+    for question_num in range(1, 11):
+        question = trivia_set.questions[question_num - 1]
+        question.question_text = form.get(f'questions_{question_num - 1}_text')
+        for option_num in range(1, 5):
+            option = question.options[option_num - 1]
+            option.text = form.get(f'options_{question_num - 1}_{option_num - 1}_text')
+            option.is_correct = str(option_num - 1) in form.getlist(f'correct_option_{question_num - 1}[]')
+    trivia_app.db.session.commit()
+
+
+def edit_form(trivia_app, set_id, changed=False):
+    fields = [('set_title', 'Bench 10'), ('category', 'Bench'), ('difficulty', 'easy')]
+    for question_num, question in enumerate(trivia_app.load_questions(set_id)):
+        fields += [(f'questions_{question_num}_id', str(question.id)),
+                   (f'questions_{question_num}_text', question.question_text)]
+        for option_num, option in enumerate(question.options):
+            text = option.text
+            if changed and question_num == 3 and option_num == 2:
+                text = text + ' (edited)' if not text.endswith('(edited)') else text[:-9]
+            fields += [(f'options_{question_num}_{option_num}_id', str(option.id)),
+                       (f'options_{question_num}_{option_num}_text', text)]
+            if option.is_correct:
+                fields.append((f'correct_option_{question_num}[]', str(option_num)))
+    return MultiDict(fields)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Edit page save, per-index loop vs diff engine')
+    parser.add_argument('--runs', type=int, default=200)
+    args = parser.parse_args()
+
+    trivia_app = load_app()
+    db = trivia_app.db
+    with trivia_app.app.app_context():
+        user_id = seed_user(trivia_app)
+        set_id, _ = seed_trivia_set(trivia_app, user_id, 10)
+
+        print(f"{'form':>10} | {'engine':>6} | {'queries':>7} | {'mean ms':>8} | {'p99 ms':>8}")
+        for changed in (False, True):
+            label = 'one edit' if changed else 'unchanged'
+
+            def run_legacy():
+                legacy_edit(trivia_app, set_id, edit_form(trivia_app, set_id, changed))
+                db.session.remove()
+
+            def run_diff():
+                trivia_set = db.session.get(trivia_app.TriviaSet, set_id)
+                trivia_app.apply_set_edit(trivia_set, trivia_app.edit_from_form(edit_form(trivia_app, set_id, changed)))
+                db.session.remove()
+
+            for name, run in (('legacy', run_legacy), ('diff', run_diff)):
+                form = edit_form(trivia_app, set_id, changed)
+                db.session.remove()
+                with QueryCounter(db.engine) as counter:
+                    if name == 'legacy':
+                        legacy_edit(trivia_app, set_id, form)
+                    else:
+                        trivia_app.apply_set_edit(db.session.get(trivia_app.TriviaSet, set_id),
+                                                  trivia_app.edit_from_form(form))
+                db.session.remove()
+                result = summarize(timed(run, args.runs))
+                print(f"{label:>10} | {name:>6} | {counter.count:>7} | {result['mean_ms']:>8.2f} | {result['p99_ms']:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
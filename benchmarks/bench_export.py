@@ -0,0 +1,88 @@
+# benchmarks/bench_export.py
+#
+# Dumping and restoring the whole question bank: the old print_database walk
+# (TriviaSet.query.all() plus lazy questions/options) vs the streamed NDJSON export,
+# and the batched import of that export into a second database.
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import QueryCounter, load_app, seed_user
+
+
+def synthetic_sets(count, num_questions=10):
+    for set_num in range(count):
+        yield {
+            'set_title': f'Export {set_num}',
+            'category': 'Bench',
+            'difficulty': 'easy',
+            'questions': [
+                {'question_text': f'Question {set_num}.{question_num}',
+                 'options': [{'text': f'Option {option_num}', 'is_correct': option_num == 0} for option_num in range(4)]}
+                for question_num in range(num_questions)
+            ],
+        }
+
+
+def legacy_walk(trivia_app):
+    count = 0
+    for trivia_set in trivia_app.TriviaSet.query.all():
+        for question in trivia_set.questions:
+            for option in question.options:
+                count += len(option.text)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Whole-bank export and import, lazy walk vs streamed NDJSON')
+    parser.add_argument('--sets', type=int, default=5000)
+    parser.add_argument('--import-into', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.import_into:
+        # Child process: fresh app and database, import the file given on the command line
+        trivia_app = load_app()
+        with trivia_app.app.app_context():
+            user_id = seed_user(trivia_app, 'importer')
+            started = time.perf_counter()
+            with open(args.import_into, 'rb') as f:
+                imported, _ = trivia_app.import_trivia_set_stream(trivia_app.read_ndjson_lines(f), user_id)
+            print(f'import    | {imported:>7} sets | {time.perf_counter() - started:>8.2f} s')
+        return
+
+    trivia_app = load_app()
+    app = trivia_app.app
+
+    with app.app_context():
+        user_id = seed_user(trivia_app)
+        trivia_app.import_trivia_sets(synthetic_sets(args.sets), user_id, batch_size=2000)
+        print(f'seeded {args.sets} sets x 10 questions x 4 options')
+
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        path = os.path.join(tempfile.mkdtemp(prefix='trivia_export_'), 'bank.ndjson.gz')
+        with QueryCounter(trivia_app.db.engine) as counter:
+            started = time.perf_counter()
+            trivia_app.write_export(path, trivia_app.export_trivia_sets())
+            elapsed = time.perf_counter() - started
+        grown = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+        print(f'export    | {counter.count:>7} queries | {elapsed:>8.2f} s | '
+              f'{os.path.getsize(path) / 1024:.0f} KiB gzipped | peak RSS +{grown / 1024:.1f} MiB')
+        trivia_app.db.session.remove()
+
+        # Last, its peak memory would hide the export's
+        with QueryCounter(trivia_app.db.engine) as counter:
+            started = time.perf_counter()
+            legacy_walk(trivia_app)
+            elapsed = time.perf_counter() - started
+        trivia_app.db.session.remove()
+        print(f'lazy walk | {counter.count:>7} queries | {elapsed:>8.2f} s')
+
+    subprocess.run([sys.executable, '-m', 'benchmarks.bench_export', '--import-into', path], check=True)
+
+
+if __name__ == '__main__':
+    main()
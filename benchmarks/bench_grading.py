@@ -0,0 +1,132 @@
+# benchmarks/bench_grading.py
+#
+# Open-ended grading over synthetic questions: building the answer key (matchers
+# compiled once per set), then grading 10k typed answers one submission at a time,
+# against a naive grader that normalizes the aliases and runs a full Levenshtein for
+# every answer. Answers are a mix of exact, reformatted (case, accents, punctuation,
+# articles), misspelled and wrong ones; the accuracy column counts answers graded as
+# their kind intends. Runs without a database.
+#
+#   python -m benchmarks.bench_grading --answers 10000
+import argparse
+import random
+import time
+
+from answer_matching import allowed_typos, jaro_winkler, normalize_answer
+from benchmarks.common import summarize
+from scoring import AnswerKey
+
+SYLLABLES = ['ka', 'ro', 'mi', 'tan', 'bel', 'zu', 'ri', 'os', 'len', 'va', 'dor', 'ne', 'sha', 'pi', 'gru', 'el']
+ACCENTED = {'a': 'á', 'e': 'é', 'o': 'ö', 'u': 'ü', 'i': 'í'}
+
+
+def word(rng):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def aliases(rng):
+    # e.g. ["Kamitan Belzu", "Belzu"], some with a number
+    name = ' '.join(word(rng).capitalize() for _ in range(rng.randint(1, 3)))
+    names = [name]
+    if ' ' in name and rng.random() < 0.5:
+        names.append(name.split()[-1])
+    if rng.random() < 0.1:
+        names = [str(rng.randint(1000, 2024))]
+    return names
+
+
+def reformat(text, rng):
+    text = ''.join(ACCENTED.get(char, char) if rng.random() < 0.2 else char for char in text)
+    text = text.upper() if rng.random() < 0.5 else text.lower()
+    return ('The ' if rng.random() < 0.3 else '') + text + rng.choice(['', '.', '!', '?'])
+
+
+def misspell(text, rng):
+    chars = list(text)
+    position = rng.randrange(1, len(chars) - 1)
+    edit = rng.randrange(3)
+    if edit == 0:
+        chars[position] = rng.choice('aeiou')
+    elif edit == 1:
+        del chars[position]
+    else:
+        chars[position], chars[position + 1] = chars[position + 1], chars[position]
+    return ''.join(chars)
+
+
+def typed_answer(accepted, rng):
+    # (answer, should it be accepted)
+    alias = rng.choice(accepted)
+    kind = rng.random()
+    if kind < 0.4:
+        return alias, True
+    if kind < 0.6:
+        return reformat(alias, rng), True
+    if kind < 0.8 and len(alias) >= 8 and not alias.isdigit():
+        return misspell(alias, rng), True
+    return word(rng), False
+
+
+def levenshtein(a, b):
+    previous = list(range(len(b) + 1))
+    for i, char in enumerate(a, start=1):
+        current = [i]
+        for j, other in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != other)))
+        previous = current
+    return previous[-1]
+
+
+def naive_correct(accepted, answer):
+    text = normalize_answer(answer)
+    for alias in map(normalize_answer, accepted):
+        if text == alias or (not alias.isdigit() and (levenshtein(text, alias) <= allowed_typos(len(alias))
+                                                      or jaro_winkler(text, alias) >= 0.95)):
+            return True
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Open-ended answer grading latency')
+    parser.add_argument('--answers', type=int, default=10000)
+    parser.add_argument('--questions', type=int, default=10, help='questions per set')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    num_sets = max(1, args.answers // args.questions)
+    sets = [{question_id: aliases(rng) for question_id in range(set_num * args.questions,
+                                                                (set_num + 1) * args.questions)}
+            for set_num in range(num_sets)]
+
+    started = time.perf_counter()
+    keys = [AnswerKey(set_num, [], accepted) for set_num, accepted in enumerate(sets)]
+    compile_ms = (time.perf_counter() - started) * 1000
+
+    submissions, expected = [], []
+    for accepted in sets:
+        typed = {question_id: typed_answer(texts, rng) for question_id, texts in accepted.items()}
+        submissions.append({question_id: answer for question_id, (answer, _) in typed.items()})
+        expected.append({question_id: right for question_id, (_, right) in typed.items()})
+    total = sum(len(submission) for submission in submissions)
+
+    print(f'{num_sets} sets x {args.questions} open-ended questions, answer keys built in {compile_ms:.1f} ms')
+    print(f"{'grader':>8} | {'answers':>7} | {'total ms':>9} | {'us/answer':>9} | {'p99 us/answer':>13} | {'accuracy':>8}")
+    for name in ('matcher', 'naive'):
+        latencies, correct = [], 0
+        for key, accepted, submission, wanted in zip(keys, sets, submissions, expected):
+            started = time.perf_counter()
+            if name == 'matcher':
+                graded = key.grade(submission)
+            else:
+                graded = {question_id: naive_correct(accepted[question_id], answer)
+                          for question_id, answer in submission.items()}
+            latencies.append((time.perf_counter() - started) * 1e6 / len(submission))
+            correct += sum(graded[question_id] == right for question_id, right in wanted.items())
+        result = summarize(latencies)     # in microseconds per answer here
+        print(f"{name:>8} | {total:>7} | {sum(latencies) * args.questions / 1000:>9.1f} | "
+              f"{result['mean_ms']:>9.1f} | {result['p99_ms']:>13.1f} | {100 * correct / total:>7.1f}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# benchmarks/bench_http_caching.py
+#
+# Conditional GET on the read-only pages: a full request (no validators, as a first
+# visit), a revalidation of an unchanged page (If-None-Match, answered 304) and the
+# same revalidation right after the set was edited, when the snapshot is reloaded.
+# Reports latency, SQL queries and bytes sent per request.
+#
+#   python -m benchmarks.bench_http_caching --questions 50
+import argparse
+
+from benchmarks.common import QueryCounter, load_app, seed_trivia_set, seed_user, summarize, timed
+
+
+def measure(client, engine, url, headers, runs, before=None):
+    sizes, queries = [], []
+
+    def request():
+        if before is not None:
+            before()
+        with QueryCounter(engine) as counter:
+            response = client.get(url, headers=headers())
+        sizes.append(len(response.data))
+        queries.append(counter.count)
+
+    result = summarize(timed(request, runs))
+    return result, sum(queries) / len(queries), sum(sizes) / len(sizes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Full page vs 304 revalidation latency')
+    parser.add_argument('--questions', type=int, default=50)
+    parser.add_argument('--runs', type=int, default=500)
+    args = parser.parse_args()
+
+    trivia_app = load_app()
+    app, db = trivia_app.app, trivia_app.db
+    with app.app_context():
+        user_id = seed_user(trivia_app)
+        set_id, _ = seed_trivia_set(trivia_app, user_id, args.questions)
+        trivia_app.trivia_sets_changed([set_id])
+        trivia_app.record_score(user_id, set_id, 3)
+        engine = db.engine
+
+    guest = app.test_client()
+
+    def edit():
+        # What an edit does to the set: version bumped, caches dropped
+        with app.app_context():
+            trivia_app.bump_set_versions([set_id])
+            db.session.commit()
+            trivia_app.invalidate_set_snapshot(set_id)
+
+    pages = [('guest_play_set', f'/guest_play_set/{set_id}'), ('api set', f'/api/sets/{set_id}'),
+             ('search', '/search?search_term=bench'), ('results', f'/results/{set_id}/3')]
+    print(f"{'page':>15} | {'request':>14} | {'mean ms':>8} | {'p99 ms':>8} | {'queries':>7} | {'bytes':>7}")
+    for name, url in pages:
+        etag = guest.get(url).headers['ETag']
+        for label, headers, before in (('full', lambda: {}, None),
+                                       ('304', lambda: {'If-None-Match': etag}, None),
+                                       ('after an edit', lambda: {'If-None-Match': etag}, edit)):
+            result, queries, size = measure(guest, engine, url, headers, args.runs, before)
+            print(f"{name:>15} | {label:>14} | {result['mean_ms']:>8.2f} | {result['p99_ms']:>8.2f} | "
+                  f"{queries:>7.1f} | {size:>7.0f}")
+    print("'after an edit' includes committing the version bump")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+# benchmarks/bench_login.py
+#
+# Login throughput at each password hash cost. For every method, concurrent clients log
+# in as fast as they can while one more client keeps requesting a cheap play route; the
+# play latency shows how much the logins take away from everything else. Run it with
+# different PASSWORD_HASH_WORKERS to size the hashing pool:
+#
+#   PASSWORD_HASH_WORKERS=1 python -m benchmarks.bench_login
+import argparse
+import statistics
+import threading
+import time
+
+from werkzeug.security import generate_password_hash
+
+from benchmarks.common import load_app, percentile, seed_trivia_set
+
+METHODS = ('pbkdf2:sha256:260000', 'pbkdf2:sha256:600000', 'scrypt:16384:8:1', 'scrypt:32768:8:1',
+           'scrypt:65536:8:1')
+
+
+def hash_ms(method, runs=5):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        generate_password_hash('bench', method)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def run(trivia_app, method, users, set_id, clients, seconds):
+    app = trivia_app.app
+    trivia_app.password_hasher.method = method
+    trivia_app.password_hasher._dummy = None
+    with app.app_context():
+        password_hash = generate_password_hash('bench', method)
+        trivia_app.User.query.update({'password': password_hash})
+        trivia_app.db.session.commit()
+
+    logins, plays, statuses = [], [], []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def log_in(client_num):
+        latencies, seen = [], []
+        user_num = client_num
+        while time.perf_counter() < deadline:
+            username = users[user_num % len(users)]
+            started = time.perf_counter()
+            status = app.test_client().post('/login', data={'email': f'{username}@example.com', 'username': username,
+                                                            'password': 'bench'}).status_code
+            latencies.append((time.perf_counter() - started) * 1000)
+            seen.append(status)
+            user_num += clients
+        with lock:
+            logins.extend(latencies)
+            statuses.extend(seen)
+
+    def play():
+        client = app.test_client()
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            client.get(f'/api/sets/{set_id}')
+            plays.append((time.perf_counter() - started) * 1000)
+
+    workers = [threading.Thread(target=log_in, args=(client_num,)) for client_num in range(clients)]
+    workers.append(threading.Thread(target=play))
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    return {
+        'logins_per_s': sum(1 for status in statuses if status == 302) / seconds,
+        'busy': sum(1 for status in statuses if status == 503),
+        'login_p50_ms': percentile(logins, 50),
+        'login_p99_ms': percentile(logins, 99),
+        'play_p50_ms': percentile(plays, 50),
+        'play_p99_ms': percentile(plays, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Login throughput per password hash method')
+    parser.add_argument('--methods', nargs='+', default=METHODS)
+    parser.add_argument('--clients', type=int, default=8, help='concurrent logins')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    trivia_app = load_app()
+    with trivia_app.app.app_context():
+        users = [f'player{user_num}' for user_num in range(args.users)]
+        trivia_app.db.session.add_all([trivia_app.User(username=username, email=f'{username}@example.com',
+                                                       password='') for username in users])
+        trivia_app.db.session.commit()
+        set_id, _ = seed_trivia_set(trivia_app, 1, 10)
+
+    print(f'{args.clients} clients logging in, hashing pool of {trivia_app.password_hasher.max_workers}')
+    print(f"{'method':>22} | {'hash ms':>7} | {'logins/s':>8} | {'login p50':>9} | {'login p99':>9} | "
+          f"{'play p50':>8} | {'play p99':>8} | {'busy':>4}")
+    for method in args.methods:
+        result = run(trivia_app, method, users, set_id, args.clients, args.seconds)
+        print(f"{method:>22} | {hash_ms(method):>7.1f} | {result['logins_per_s']:>8.1f} | "
+              f"{result['login_p50_ms']:>9.1f} | {result['login_p99_ms']:>9.1f} | {result['play_p50_ms']:>8.2f} | "
+              f"{result['play_p99_ms']:>8.2f} | {result['busy']:>4}")
+
+
+if __name__ == '__main__':
+    main()
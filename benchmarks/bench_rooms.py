@@ -0,0 +1,216 @@
+# benchmarks/bench_rooms.py
+#
+# Load test for live rooms: one host and many simulated players against a local
+# threaded WSGI server, or a running one with --url. Players are asyncio clients on
+# plain sockets (one event stream and short-lived answer requests each), so a single
+# process can drive thousands of them. Reports join and answer latency and how long
+# each pushed question took to reach every player (fan-out).
+#
+#   python -m benchmarks.bench_rooms --players 1000 --questions 5
+#   python -m benchmarks.bench_rooms --url http://127.0.0.1:8000 --set-id 1 --email host@example.com --password ...
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import urllib.parse
+
+from benchmarks.common import percentile
+
+
+def request_head(method, path, host, cookie=None, body=b'', content_type='application/json', accept=None):
+    # HTTP/1.0 so the server closes the connection instead of chunking the stream
+    lines = [f'{method} {path} HTTP/1.0', f'Host: {host}']
+    if cookie:
+        lines.append(f'Cookie: {cookie}')
+    if accept:
+        lines.append(f'Accept: {accept}')
+    if body:
+        lines += [f'Content-Type: {content_type}', f'Content-Length: {len(body)}']
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode() + body
+
+
+class Client:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.cookie = None
+
+    async def _open(self, method, path, body=b'', content_type='application/json', accept=None):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        writer.write(request_head(method, path, f'{self.host}:{self.port}', self.cookie, body, content_type, accept))
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode().strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.lower()] = value.strip()
+            if name.lower() == 'set-cookie' and value.strip().startswith('session='):
+                self.cookie = value.strip().split(';', 1)[0]
+        return status, headers, reader, writer
+
+    async def request(self, method, path, data=None, form=None):
+        if form is not None:
+            body, content_type = urllib.parse.urlencode(form).encode(), 'application/x-www-form-urlencoded'
+        else:
+            body, content_type = (json.dumps(data).encode() if data is not None else b''), 'application/json'
+        status, headers, reader, writer = await self._open(method, path, body, content_type)
+        await reader.read()
+        writer.close()
+        return status, headers
+
+    async def events(self, path):
+        # Yields (event type, data) from a server-sent event stream
+        status, _, reader, writer = await self._open('GET', path, accept='text/event-stream')
+        if status != 200:
+            raise RuntimeError(f'{path} returned {status}')
+        event_type, data = None, None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                line = line.decode().rstrip('\n')
+                if line.startswith('event: '):
+                    event_type = line[7:]
+                elif line.startswith('data: '):
+                    data = json.loads(line[6:])
+                elif not line and event_type:
+                    yield event_type, data
+                    event_type, data = None, None
+        finally:
+            writer.close()
+
+
+class Results:
+    def __init__(self):
+        self.join_ms = []
+        self.answer_ms = []
+        self.fanout_ms = []      # question pushed -> received, per player and question
+        self.errors = 0
+        self.finished = 0
+
+
+class Player:
+    def __init__(self, client, code, name, rng, think_max):
+        self.client = client
+        self.code = code
+        self.name = name
+        self.rng = rng
+        self.think_max = think_max
+        self.connected = asyncio.Event()
+
+    async def play(self, results, connect_slots):
+        async with connect_slots:
+            started = time.perf_counter()
+            status, _ = await self.client.request('POST', f'/rooms/{self.code}/join', {'name': self.name})
+            results.join_ms.append((time.perf_counter() - started) * 1000)
+            if status != 200:
+                results.errors += 1
+                return
+            stream = self.client.events(f'/rooms/{self.code}/events')
+            await stream.__anext__()    # the initial 'state' event
+        self.connected.set()
+
+        async for event_type, data in stream:
+            if event_type == 'question':
+                results.fanout_ms.append(time.time() * 1000 - data['started'])
+                await asyncio.sleep(self.rng.uniform(0, self.think_max))
+                option = self.rng.choice(data['options'])
+                started = time.perf_counter()
+                status, _ = await self.client.request('POST', f'/rooms/{self.code}/answer',
+                                                      {'question_id': data['id'], 'option_id': option['id']})
+                results.answer_ms.append((time.perf_counter() - started) * 1000)
+                if status != 200:
+                    results.errors += 1
+            elif event_type in ('finished', 'closed'):
+                results.finished += 1
+                return
+
+
+async def run_round(host, port, set_id, args):
+    host_client = Client(host, port)
+    await host_client.request('POST', '/login', form={'email': args.email, 'password': args.password})
+    status, headers = await host_client.request('POST', '/rooms', form={'set_id': set_id, 'seconds': args.seconds})
+    if status != 302:
+        raise RuntimeError(f'creating the room returned {status}')
+    code = headers['location'].rstrip('/').split('/')[-2]
+    print(f'room {code}: {args.players} players, {args.questions} questions of {args.seconds}s')
+
+    results = Results()
+    rng = random.Random(args.seed)
+    connect_slots = asyncio.Semaphore(args.connect_concurrency)
+    players = [Player(Client(host, port), code, f'player{player_num}', random.Random(rng.random()), args.think)
+               for player_num in range(args.players)]
+    started = time.perf_counter()
+    tasks = [asyncio.ensure_future(player.play(results, connect_slots)) for player in players]
+    try:
+        await asyncio.wait_for(asyncio.gather(*(player.connected.wait() for player in players)),
+                               args.connect_timeout)
+    except asyncio.TimeoutError:
+        pass
+    connected = sum(1 for player in players if player.connected.is_set())
+    print(f'{connected} players connected in {time.perf_counter() - started:.1f}s')
+
+    started = time.perf_counter()
+    await host_client.request('POST', f'/rooms/{code}/start')
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return code, results, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Live room load test')
+    parser.add_argument('--players', type=int, default=500)
+    parser.add_argument('--questions', type=int, default=5, help='questions in the seeded set')
+    parser.add_argument('--seconds', type=int, default=5, help='per question')
+    parser.add_argument('--think', type=float, default=2.0, help='max seconds a player waits before answering')
+    parser.add_argument('--connect-concurrency', type=int, default=64, help='players joining at the same time')
+    parser.add_argument('--connect-timeout', type=float, default=60)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--url', help='use a running server instead of a local one (e.g. under gunicorn -k gevent)')
+    parser.add_argument('--set-id', type=int, help='set to host with --url')
+    parser.add_argument('--email', default='bench@example.com', help='host login with --url')
+    parser.add_argument('--password', default='bench')
+    args = parser.parse_args()
+
+    trivia_app = server = None
+    if args.url:
+        if args.set_id is None:
+            parser.error('--url needs --set-id')
+        base_url, set_id = args.url.rstrip('/'), args.set_id
+    else:
+        os.environ.setdefault('LIVE_ROOM_REVEAL_SECONDS', '1')
+        os.environ.setdefault('LIVE_ROOM_MAX_PLAYERS', str(max(5000, args.players)))
+        os.environ.setdefault('LIVE_ROOM_MAX_STREAMS', str(args.players + 10))
+        from benchmarks.common import load_app, seed_trivia_set, seed_user
+        from benchmarks.e2e import start_server
+
+        trivia_app = load_app()
+        with trivia_app.app.app_context():
+            user_id = seed_user(trivia_app)
+            set_id, _ = seed_trivia_set(trivia_app, user_id, args.questions)
+        server, base_url = start_server(trivia_app.app)
+
+    host, port = urllib.parse.urlsplit(base_url)[1].split(':')
+    code, results, elapsed = asyncio.run(run_round(host, int(port), set_id, args))
+    if server is not None:
+        server.shutdown()
+
+    print(f'round took {elapsed:.1f}s, {results.finished} players saw the end, {results.errors} errors, '
+          f'{len(results.answer_ms) / elapsed:.0f} answers/s')
+    for name, values in (('join', results.join_ms), ('answer', results.answer_ms),
+                         ('fan-out', results.fanout_ms)):
+        if values:
+            print(f'{name:>8} ms | p50 {percentile(values, 50):8.2f} | p95 {percentile(values, 95):8.2f} | '
+                  f'p99 {percentile(values, 99):8.2f} | max {max(values):8.2f}')
+    print('fan-out is the time from a question going out to a player receiving it')
+    if trivia_app is not None:
+        print(f'server: {trivia_app.live_rooms.stats()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+# benchmarks/bench_scoring.py
+#
+# Query count and latency per submission for growing set sizes: the old per-field
+# lookups, the answer-key query, and the answer key served from the cache.
+import argparse
+
+from benchmarks.common import QueryCounter, load_app, seed_trivia_set, seed_user, summarize, timed
+
+
+def legacy_score(trivia_app, form):
+    # The scoring loop play_set/guest_play_set used to run
+    score = 0
+    for question_id, selected_option_id in form.items():
+        question = trivia_app.db.session.get(trivia_app.Question, int(question_id))
+        selected_option = trivia_app.db.session.get(trivia_app.Option, int(selected_option_id))
+        if question and selected_option and selected_option.is_correct:
+            score += 1
+    return score
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scoring query count and latency per submission')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5, 10, 25, 50, 100])
+    parser.add_argument('--runs', type=int, default=200)
+    args = parser.parse_args()
+
+    trivia_app = load_app()
+    db = trivia_app.db
+
+    with trivia_app.app.app_context():
+        user_id = seed_user(trivia_app)
+        print(f"{'questions':>9} | {'legacy q':>8} | {'legacy ms':>9} | {'engine q':>8} | {'engine ms':>9}"
+              f" | {'cached q':>8} | {'cached ms':>9}")
+
+        for size in args.sizes:
+            set_id, questions = seed_trivia_set(trivia_app, user_id, size)
+            form = {str(question_id): str(correct) for question_id, _, correct in questions}
+
+            def run_legacy():
+                legacy_score(trivia_app, form)
+                db.session.remove()
+
+            def run_engine():
+                trivia_app.invalidate_answer_key(set_id)
+                trivia_app.score_submission(set_id, trivia_app.parse_answers(form))
+                db.session.remove()
+
+            def run_cached():
+                trivia_app.score_submission(set_id, trivia_app.parse_answers(form))
+                db.session.remove()
+
+            results = []
+            for fn in (run_legacy, run_engine, run_cached):
+                with QueryCounter(db.engine) as counter:
+                    fn()
+                latency = summarize(timed(fn, args.runs))
+                results.append((counter.count, latency['mean_ms']))
+
+            row = ' | '.join(f'{queries:>8} | {ms:>9.3f}' for queries, ms in results)
+            print(f'{size:>9} | {row}')
+
+
+if __name__ == '__main__':
+    main()
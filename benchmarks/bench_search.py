@@ -0,0 +1,76 @@
+# benchmarks/bench_search.py
+#
+# /search lookups over a large synthetic catalogue: the old unbounded ILIKE scan
+# vs the FTS5 index (first page and a deep keyset page).
+import argparse
+import random
+
+from sqlalchemy import or_
+
+from benchmarks.common import load_app, seed_user, summarize, timed
+
+WORDS = ('cats', 'dogs', 'ghibli', 'pokemon', 'history', 'science', 'space', 'music', 'movies', 'math',
+         'geography', 'anime', 'sports', 'football', 'chemistry', 'physics', 'art', 'literature', 'food', 'birds')
+CATEGORIES = ('Animals', 'Film', 'Games', 'History', 'Science', 'Sports', 'Music', 'Books')
+
+
+def synthetic_sets(count, rng):
+    for set_num in range(count):
+        yield {
+            'set_title': ' '.join(rng.sample(WORDS, 3)) + f' {set_num}',
+            'category': rng.choice(CATEGORIES),
+            'difficulty': rng.choice(('easy', 'medium', 'hard')),
+            'questions': [{'question_text': ' '.join(rng.sample(WORDS, 5)) + '?'} for _ in range(3)],
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Search latency, ILIKE scan vs FTS5 index')
+    parser.add_argument('--sets', type=int, default=100000)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--terms', nargs='+', default=['ghibli', 'sci', 'history music', 'Animals'])
+    args = parser.parse_args()
+
+    trivia_app = load_app()
+    db = trivia_app.db
+    TriviaSet = trivia_app.TriviaSet
+
+    with trivia_app.app.app_context():
+        user_id = seed_user(trivia_app)
+        rng = random.Random(42)
+        trivia_app.import_trivia_sets(synthetic_sets(args.sets, rng), user_id, batch_size=5000)
+        trivia_app.rebuild_search_index()
+        print(f'seeded {args.sets} sets')
+        print(f"{'term':>16} | {'ilike rows':>10} | {'ilike ms':>9} | {'fts p1 ms':>9} | {'fts p10 ms':>10}")
+
+        for term in args.terms:
+            def run_ilike():
+                rows = TriviaSet.query.filter(
+                    or_(TriviaSet.set_title.ilike(f'%{term}%'), TriviaSet.category.ilike(f'%{term}%'))
+                ).all()
+                db.session.remove()
+                return rows
+
+            ilike_rows = len(run_ilike())
+            ilike = summarize(timed(run_ilike, args.runs))
+
+            def run_fts():
+                trivia_app.search_trivia_sets(term, limit=20)
+                db.session.remove()
+
+            # Walk to page 10 once, then time fetching it from its cursor
+            cursor = None
+            for _ in range(9):
+                _, cursor = trivia_app.search_trivia_sets(term, limit=20, after=cursor)
+
+            def run_fts_deep():
+                trivia_app.search_trivia_sets(term, limit=20, after=cursor)
+                db.session.remove()
+
+            first = summarize(timed(run_fts, args.runs))
+            deep = summarize(timed(run_fts_deep, args.runs))
+            print(f"{term:>16} | {ilike_rows:>10} | {ilike['mean_ms']:>9.2f} | {first['mean_ms']:>9.2f} | {deep['mean_ms']:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
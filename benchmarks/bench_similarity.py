@@ -0,0 +1,88 @@
+# benchmarks/bench_similarity.py
+#
+# Similar-set index over synthetic sets: build time, file size, query latency for
+# similar sets and for a recommendation profile, and how many of the top results share
+# the query set's topic (sets are generated from per-topic vocabularies plus shared
+# filler words). Runs without a database.
+#
+#   python -m benchmarks.bench_similarity --sets 100000
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.common import summarize, timed
+from set_similarity import SimilarityIndex
+
+FILLER = ['which', 'famous', 'first', 'best', 'known', 'called', 'name', 'year', 'number', 'world', 'most', 'large',
+          'small', 'old', 'new', 'great', 'made', 'long', 'high', 'found']
+
+
+def topic_vocabularies(topics, words_per_topic, rng):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return [[''.join(rng.choice(letters) for _ in range(rng.randint(4, 9))) for _ in range(words_per_topic)]
+            for _ in range(topics)]
+
+
+def synthetic_sets(count, topics, questions, seed):
+    # Returns a callable yielding (id, title, category, question text) and the topic of each set
+    rng = random.Random(seed)
+    vocabularies = topic_vocabularies(topics, 60, rng)
+    set_topics = [rng.randrange(topics) for _ in range(count)]
+
+    def documents():
+        rng = random.Random(seed + 1)
+        for set_num, topic in enumerate(set_topics):
+            vocabulary = vocabularies[topic]
+
+            def sentence(length):
+                return ' '.join(rng.choice(vocabulary) if rng.random() < 0.5 else rng.choice(FILLER)
+                                for _ in range(length))
+
+            yield (set_num + 1, sentence(3), f'Topic {topic % (topics // 4 or 1)}',
+                   ' '.join(sentence(8) for _ in range(questions)))
+
+    return documents, set_topics
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Similar-set index build and query latency')
+    parser.add_argument('--sets', type=int, default=100000)
+    parser.add_argument('--topics', type=int, default=200)
+    parser.add_argument('--questions', type=int, default=10)
+    parser.add_argument('--dim', type=int, default=256)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    documents, set_topics = synthetic_sets(args.sets, args.topics, args.questions, args.seed)
+    index = SimilarityIndex(os.path.join(tempfile.mkdtemp(prefix='trivia_bench_'), 'similarity'), args.dim)
+    started = time.perf_counter()
+    index.build(documents)
+    generation = os.path.join(index.path, index.stats()['generation'])
+    size = sum(os.path.getsize(os.path.join(generation, name)) for name in os.listdir(generation))
+    print(f'{args.sets} sets, {args.topics} topics: built in {time.perf_counter() - started:.1f}s, '
+          f'{size / 1024 / 1024:.0f} MB on disk')
+
+    rng = random.Random(args.seed)
+    query_ids = [rng.randint(1, args.sets) for _ in range(args.queries)]
+    same_topic = []
+    for set_id in query_ids[:50]:
+        similar = index.similar(set_id, 10)
+        same_topic.append(sum(set_topics[found - 1] == set_topics[set_id - 1] for found, _ in similar) / len(similar))
+
+    queries = iter(query_ids * 2)
+    similar = summarize(timed(lambda: index.similar(next(queries), 10), args.queries))
+    histories = [{rng.randint(1, args.sets): rng.random() for _ in range(50)} for _ in range(args.queries)]
+    profiles = iter(histories)
+    recommend = summarize(timed(lambda: index.recommend_for(next(profiles), 10), args.queries))
+
+    print(f"{'query':>22} | {'mean ms':>8} | {'p50 ms':>8} | {'p99 ms':>8}")
+    for name, result in (('similar, top 10', similar), ('recommend, 50 played', recommend)):
+        print(f"{name:>22} | {result['mean_ms']:>8.2f} | {result['p50_ms']:>8.2f} | {result['p99_ms']:>8.2f}")
+    print(f'top 10 similar sets on the same topic: {100 * sum(same_topic) / len(same_topic):.0f}%')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+# benchmarks/bench_writes.py
+#
+# Write throughput of POST /play_set with N concurrent submitters in three modes:
+# SQLite tuning off (the old default journal), tuning on, and tuning on with the
+# write-behind score queue. Each mode runs in a fresh process and a fresh database
+# because the settings are read when the app is imported. In write-behind mode the
+# clock stops only once the queue has been committed.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.common import load_app, seed_trivia_set, summarize
+
+
+def run(threads, submissions):
+    trivia_app = load_app()
+    app = trivia_app.app
+
+    with app.app_context():
+        users = []
+        password_hash = trivia_app.password_hasher.hash('bench')
+        for user_num in range(threads):
+            user = trivia_app.User(username=f'player{user_num}', email=f'player{user_num}@example.com',
+                                   password=password_hash)
+            trivia_app.db.session.add(user)
+            users.append(user)
+        trivia_app.db.session.commit()
+        user_ids = [user.id for user in users]
+        sets = [seed_trivia_set(trivia_app, user_ids[0], 5) for _ in range(10)]
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    start_line = threading.Barrier(threads)
+
+    def player(user_num):
+        client = app.test_client()
+        client.post('/login', data={'email': f'player{user_num}@example.com', 'username': f'player{user_num}',
+                                    'password': 'bench'})
+        start_line.wait()
+        for submission in range(submissions):
+            set_id, questions = sets[submission % len(sets)]
+            form = {str(question_id): str(correct) for question_id, _, correct in questions}
+            started = time.perf_counter()
+            try:
+                status = client.post(f'/play_set/{set_id}', data=form).status_code
+                failed = status >= 400
+            except Exception as error:
+                status, failed = repr(error), True
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                latencies.append(elapsed)
+                if failed:
+                    errors.append(status)
+
+    workers = [threading.Thread(target=player, args=(user_num,)) for user_num in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    trivia_app.score_writer.flush()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        stored = trivia_app.UserScore.query.count()
+    result = {'threads': threads, 'submissions': len(latencies), 'errors': len(errors),
+              'throughput_per_s': len(latencies) / elapsed, 'stored': stored,
+              'batches': trivia_app.score_writer.batches}
+    result.update(summarize(latencies))
+    return result
+
+
+MODES = {
+    'baseline': {'SQLITE_TUNING': '0', 'SCORE_WRITE_BEHIND': '0'},
+    'tuned': {'SQLITE_TUNING': '1', 'SCORE_WRITE_BEHIND': '0'},
+    'write-behind': {'SQLITE_TUNING': '1', 'SCORE_WRITE_BEHIND': '1'},
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent score write throughput: baseline, tuned SQLite, write-behind')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--submissions', type=int, default=50, help='per thread')
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run(args.threads[0], args.submissions)))
+        return
+
+    print(f"{'mode':>12} | {'threads':>7} | {'writes/s':>9} | {'p50 ms':>8} | {'p99 ms':>8} | "
+          f"{'batches':>7} | {'errors':>6}")
+    for threads in args.threads:
+        for mode in args.modes:
+            env = dict(os.environ, **MODES[mode])
+            output = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_writes', '--child', '--threads', str(threads),
+                 '--submissions', str(args.submissions)],
+                env=env, check=True, capture_output=True, text=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{mode:>12} | {threads:>7} | {result['throughput_per_s']:>9.1f} | "
+                  f"{result['p50_ms']:>8.2f} | {result['p99_ms']:>8.2f} | {result['batches']:>7} | "
+                  f"{result['errors']:>6}")
+
+
+if __name__ == '__main__':
+    main()
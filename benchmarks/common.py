@@ -0,0 +1,96 @@
+# benchmarks/common.py
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import event
+
+
+def load_app(db_path=None):
+    # Point the app at a throwaway database *before* it is imported,
+    # so benchmarks never touch instance/db.sqlite
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='trivia_bench_'), 'bench.sqlite')
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ.setdefault('SIMILARITY_INDEX_PATH', os.path.join(os.path.dirname(db_path), 'similarity'))
+    # Every simulated player logs in from 127.0.0.1
+    os.environ.setdefault('LOGIN_IP_LIMIT', '1000000')
+
+    import app as trivia_app
+    with trivia_app.app.app_context():
+        trivia_app.db.create_all()
+    return trivia_app
+
+
+class QueryCounter:
+    # Counts SQL statements sent to the engine while the block runs
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _before_cursor_execute(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+
+
+def seed_user(trivia_app, name='bench'):
+    user = trivia_app.User(username=name, email=f'{name}@example.com',
+                           password=trivia_app.password_hasher.hash('bench'))
+    trivia_app.db.session.add(user)
+    trivia_app.db.session.commit()
+    return user.id
+
+
+def seed_trivia_set(trivia_app, user_id, num_questions, num_options=4):
+    # Returns the set id and a list of (question id, option ids, correct option id)
+    db = trivia_app.db
+    trivia_set = trivia_app.TriviaSet(set_title=f'Bench {num_questions}', category='Bench', difficulty='easy',
+                                      user_id=user_id, trivia_set_id=trivia_app.generate_unique_id())
+    db.session.add(trivia_set)
+    db.session.flush()
+
+    questions = []
+    for question_num in range(num_questions):
+        question = trivia_app.Question(question_text=f'Question {question_num}', question_type='multiple_choice',
+                                       trivia_set_id=trivia_set.id)
+        db.session.add(question)
+        db.session.flush()
+        options = [trivia_app.Option(text=f'Option {option_num}', is_correct=(option_num == 0), question_id=question.id)
+                   for option_num in range(num_options)]
+        db.session.add_all(options)
+        db.session.flush()
+        questions.append((question.id, [option.id for option in options], options[0].id))
+
+    db.session.commit()
+    return trivia_set.id, questions
+
+
+def timed(fn, runs):
+    # Returns per-call latencies in milliseconds
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies):
+    return {
+        'mean_ms': statistics.fmean(latencies),
+        'p50_ms': percentile(latencies, 50),
+        'p99_ms': percentile(latencies, 99),
+    }
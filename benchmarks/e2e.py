@@ -0,0 +1,319 @@
+# benchmarks/e2e.py
+#
+# End-to-end load test: seeds a throwaway database, then simulated players log in and
+# hit the real routes with a weighted mix of actions, concurrently, either through
+# Flask's test client (in process) or over HTTP against a local threaded WSGI server.
+# Reports throughput, latency percentiles and SQL queries per request (read from the
+# Server-Timing header), and can save the results as a baseline or compare against one:
+#
+#   python -m benchmarks.e2e --save benchmarks/baselines/e2e.json
+#   python -m benchmarks.e2e --compare benchmarks/baselines/e2e.json   # exit 1 on regression
+import argparse
+import http.cookiejar
+import json
+import logging
+import platform
+import random
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from benchmarks.common import load_app, percentile
+from benchmarks.seed import add_seed_arguments, seed, user_credentials
+
+DEFAULT_BASELINE = 'benchmarks/baselines/e2e.json'
+
+_QUERIES = re.compile(r'db;desc="(\d+) queries"')
+
+
+# Clients
+#--------------------------------------------------------------------------------------
+class TestClientSession:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, url, data=None):
+        response = self.client.open(url, method=method, data=data)
+        response.get_data()
+        return response.status_code, response.headers.get('Server-Timing', '')
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPSession:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+                                                  _NoRedirect)
+
+    def request(self, method, url, data=None):
+        body = urllib.parse.urlencode(data, doseq=True).encode() if data is not None else None
+        request = urllib.request.Request(self.base_url + url, data=body, method=method)
+        try:
+            with self.opener.open(request) as response:
+                response.read()
+                return response.status, response.headers.get('Server-Timing', '')
+        except urllib.error.HTTPError as error:
+            error.read()
+            return error.code, error.headers.get('Server-Timing', '')
+
+
+def start_server(app):
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)   # no access log line per request
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+# Player actions
+#--------------------------------------------------------------------------------------
+# (label, weight, build(player) -> (method, url, form))
+def _answers(player, set_id, prefix=''):
+    return {f'{prefix}{question_id}': str(option_id) for question_id, option_id in player.answer_keys[set_id].items()}
+
+
+def _create_form(player):
+    form = {'set_title': f'Load test {player.rng.randint(0, 10 ** 9)}', 'category': 'Load', 'difficulty': 'easy'}
+    for question_num in range(1, 6):
+        form[f'question_{question_num}'] = f'Load question {question_num}'
+        form[f'question_{question_num}_options[]'] = [f'Answer {option_num}' for option_num in range(1, 5)]
+        form[f'correct_option_{question_num}'] = '1'
+    return form
+
+
+def search(player):
+    return 'GET', '/search?' + urllib.parse.urlencode({'search_term': player.rng.choice(player.seeded.terms)}), None
+
+
+def view_set(player):
+    return 'GET', f'/play_set/{player.pick_set()}', None
+
+
+def play_set(player):
+    set_id = player.pick_set()
+    return 'POST', f'/play_set/{set_id}', _answers(player, set_id)
+
+
+def view_guest_set(player):
+    return 'GET', f'/guest_play_set/{player.pick_set()}', None
+
+
+def play_guest_set(player):
+    set_id = player.pick_set()
+    return 'POST', f'/guest_play_set/{set_id}', _answers(player, set_id)
+
+
+def submit_set(player):
+    set_id = player.pick_set()
+    return 'POST', f'/submit_trivia_set/{player.trivia_set_ids[set_id]}', _answers(player, set_id, 'answer_')
+
+
+def dashboard(player):
+    return 'GET', '/dashboard', None
+
+
+def create_set(player):
+    return 'POST', '/create_trivia_set', _create_form(player)
+
+
+ACTIONS = (
+    ('search', 20, search),
+    ('play_set GET', 15, view_set),
+    ('play_set POST', 15, play_set),
+    ('guest_play_set GET', 15, view_guest_set),
+    ('guest_play_set POST', 5, play_guest_set),
+    ('submit_trivia_set', 5, submit_set),
+    ('dashboard', 20, dashboard),
+    ('create_trivia_set', 5, create_set),
+)
+
+
+class Player:
+    def __init__(self, player_num, session, seeded, answer_keys, rng):
+        self.player_num = player_num
+        self.session = session
+        self.seeded = seeded
+        self.answer_keys = answer_keys
+        self.trivia_set_ids = dict(zip(seeded.set_ids, seeded.trivia_set_ids))
+        self.rng = rng
+
+    def pick_set(self):
+        # Skewed towards a few popular sets, like real traffic
+        index = min(int(self.rng.paretovariate(1.2)) - 1, len(self.seeded.set_ids) - 1)
+        return self.seeded.set_ids[index]
+
+    def login(self):
+        credentials = user_credentials(self.player_num % len(self.seeded.user_ids))
+        self.session.request('POST', '/login', credentials)
+
+
+# Running
+#--------------------------------------------------------------------------------------
+def run(args):
+    trivia_app = load_app()
+    app = trivia_app.app
+    with app.app_context():
+        seeded = seed(trivia_app, args.users, args.sets, args.questions, args.options, args.scores, args.seed)
+        answer_keys = {set_id: trivia_app.get_answer_key(set_id).correct_options() for set_id in seeded.set_ids}
+    trivia_app.answer_key_cache.clear()
+
+    server = None
+    if args.driver == 'wsgi':
+        server, base_url = start_server(app)
+        make_session = lambda: HTTPSession(base_url)
+    else:
+        make_session = lambda: TestClientSession(app)
+
+    labels = [label for label, _, _ in ACTIONS]
+    weights = [weight for _, weight, _ in ACTIONS]
+    builders = {label: build for label, _, build in ACTIONS}
+    samples = []
+    lock = threading.Lock()
+    start_line = threading.Barrier(args.players)
+    clock = {}
+
+    def play(player_num):
+        player = Player(player_num, make_session(), seeded, answer_keys, random.Random(args.seed + player_num))
+        player.login()
+        recorded = []
+        for request_num in range(args.warmup + args.requests):
+            if request_num == args.warmup:
+                start_line.wait()
+                clock.setdefault('started', time.perf_counter())
+            label = player.rng.choices(labels, weights)[0]
+            method, url, form = builders[label](player)
+            started = time.perf_counter()
+            try:
+                status, server_timing = player.session.request(method, url, form)
+            except Exception as error:
+                status, server_timing = repr(error), ''
+            elapsed = (time.perf_counter() - started) * 1000
+            if request_num >= args.warmup:
+                queries = _QUERIES.search(server_timing)
+                recorded.append((label, elapsed, status, int(queries.group(1)) if queries else None))
+        with lock:
+            samples.extend(recorded)
+
+    workers = [threading.Thread(target=play, args=(player_num,)) for player_num in range(args.players)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - clock['started']
+    if server is not None:
+        server.shutdown()
+
+    return {
+        'config': {name: getattr(args, name) for name in ('driver', 'players', 'requests', 'warmup', 'users', 'sets',
+                                                          'questions', 'options', 'scores', 'seed')},
+        'environment': {'python': platform.python_version(), 'platform': platform.platform()},
+        'elapsed_s': elapsed,
+        'routes': {label: summarize_samples([sample for sample in samples if sample[0] == label], elapsed)
+                   for label in labels},
+        'total': summarize_samples(samples, elapsed),
+    }
+
+
+def summarize_samples(samples, elapsed):
+    if not samples:
+        return {'requests': 0}
+    latencies = [sample[1] for sample in samples]
+    queries = [sample[3] for sample in samples if sample[3] is not None]
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for sample in samples if not isinstance(sample[2], int) or sample[2] >= 500),
+        'throughput_per_s': len(samples) / elapsed,
+        'mean_ms': sum(latencies) / len(latencies),
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'queries_per_request': sum(queries) / len(queries) if queries else None,
+    }
+
+
+# Reporting and baselines
+#--------------------------------------------------------------------------------------
+def print_results(results):
+    config = results['config']
+    print(f"{config['players']} players x {config['requests']} requests via {config['driver']}, "
+          f"{config['users']} users / {config['sets']} sets seeded")
+    print(f"{'route':>20} | {'requests':>8} | {'req/s':>8} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8} | "
+          f"{'queries':>7} | {'errors':>6}")
+    for label, result in list(results['routes'].items()) + [('total', results['total'])]:
+        if not result['requests']:
+            continue
+        queries = result['queries_per_request']
+        print(f"{label:>20} | {result['requests']:>8} | {result['throughput_per_s']:>8.1f} | {result['p50_ms']:>8.2f} | "
+              f"{result['p95_ms']:>8.2f} | {result['p99_ms']:>8.2f} | "
+              f"{'-' if queries is None else f'{queries:.1f}':>7} | {result['errors']:>6}")
+
+
+def compare(results, baseline, latency_tolerance, query_tolerance):
+    # Latency is noisy, so it gets a relative tolerance plus a 1ms floor; queries per
+    # request are deterministic for a given seed and only get a small absolute slack
+    regressions = []
+    for label, base in list(baseline['routes'].items()) + [('total', baseline['total'])]:
+        current = results['total'] if label == 'total' else results['routes'].get(label)
+        if not current or not current.get('requests') or not base.get('requests'):
+            continue
+        if current['p99_ms'] > base['p99_ms'] * (1 + latency_tolerance) + 1:
+            regressions.append(f"{label}: p99 {base['p99_ms']:.2f} -> {current['p99_ms']:.2f} ms")
+        if current['throughput_per_s'] < base['throughput_per_s'] / (1 + latency_tolerance):
+            regressions.append(f"{label}: throughput {base['throughput_per_s']:.1f} -> "
+                               f"{current['throughput_per_s']:.1f} req/s")
+        if (base.get('queries_per_request') is not None and current.get('queries_per_request') is not None
+                and current['queries_per_request'] > base['queries_per_request'] + query_tolerance):
+            regressions.append(f"{label}: queries/request {base['queries_per_request']:.1f} -> "
+                               f"{current['queries_per_request']:.1f}")
+        if current['errors'] > base['errors']:
+            regressions.append(f"{label}: errors {base['errors']} -> {current['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end load test of the main routes')
+    parser.add_argument('--driver', choices=('client', 'wsgi'), default='client',
+                        help='Flask test client in process, or HTTP against a local WSGI server')
+    parser.add_argument('--players', type=int, default=8, help='concurrent simulated players')
+    parser.add_argument('--requests', type=int, default=200, help='recorded requests per player')
+    parser.add_argument('--warmup', type=int, default=20, help='unrecorded requests per player')
+    add_seed_arguments(parser)
+    parser.add_argument('--save', metavar='PATH', help='write the results as JSON')
+    parser.add_argument('--compare', metavar='PATH', nargs='?', const=DEFAULT_BASELINE,
+                        help=f'compare with a saved baseline (default {DEFAULT_BASELINE}), exit 1 on regression')
+    parser.add_argument('--latency-tolerance', type=float, default=0.5, help='allowed relative p99/throughput change')
+    parser.add_argument('--query-tolerance', type=float, default=0.5, help='allowed extra queries per request')
+    args = parser.parse_args()
+
+    results = run(args)
+    print_results(results)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'saved {args.save}')
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline['config'] != results['config']:
+            print(f"warning: baseline was recorded with {baseline['config']}")
+        regressions = compare(results, baseline, args.latency_tolerance, args.query_tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+        print(f'no regressions against {args.compare}')
+
+
+if __name__ == '__main__':
+    main()
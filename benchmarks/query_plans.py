@@ -0,0 +1,213 @@
+# benchmarks/query_plans.py
+#
+# Query-plan regression check. Drives every route through the test client, runs
+# EXPLAIN QUERY PLAN on each statement the route sent and exits non-zero if any of
+# them scans a whole table, or if a route fails. Run it in CI next to the benchmarks:
+#   python -m benchmarks.query_plans
+import contextlib
+import io
+import json
+import re
+import sys
+
+from sqlalchemy import event
+
+from benchmarks.common import load_app
+
+# Scans that are expected, by (route, table) -> reason
+ALLOWED_SCANS = {
+    ('print_database', 'trivia_set'): 'dumps every set',
+    ('global_leaderboard', 'user_total_score'): 'counts the players, one row each',
+}
+
+SCAN = re.compile(r'^SCAN (\S+)')
+IGNORED = ('VIRTUAL TABLE', 'CONSTANT ROW', 'subquery', 'CO-ROUTINE')
+
+
+class StatementRecorder:
+    def __init__(self):
+        self.label = None
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if self.label and not executemany and statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'WITH')):
+            self.statements.append((self.label, statement, parameters))
+
+
+def seed(trivia_app, client):
+    client.post('/register', data={'email': 'plans@example.com', 'username': 'plans', 'password': 'plans'})
+    client.get('/logout')
+    client.post('/register', data={'email': 'other@example.com', 'username': 'other', 'password': 'other'})
+    client.get('/logout')
+
+    with trivia_app.app.app_context():
+        owner = trivia_app.User.query.filter_by(username='plans').first()
+        other = trivia_app.User.query.filter_by(username='other').first()
+        sets = [{
+            'set_title': f'Plan set {set_num}', 'category': 'Plans', 'difficulty': 'easy',
+            'questions': [{'question_text': f'Question {question_num}', 'options': ['a', 'b', 'c', 'd'],
+                           'correct_option': 1} for question_num in range(5)],
+        } for set_num in range(20)]
+        created = trivia_app.import_trivia_sets(sets, owner.id)
+        trivia_app.similarity_index.build(trivia_app.set_documents)
+        trivia_app.trivia_sets_changed(trivia_set.id for trivia_set in created)
+        for trivia_set in created:
+            trivia_app.record_score(other.id, trivia_set.id, 3)
+        return created
+
+
+def routes(trivia_app, created):
+    # (route label, method, url, test client keyword arguments) in the order they are
+    # exercised. The live room is opened here so its code is known; the event stream
+    # never ends and doesn't touch the database, so it isn't driven.
+    first, second, last = created[0], created[1], created[-1]
+    with trivia_app.app.app_context():
+        key = trivia_app.get_answer_key(first.id)
+        answers = {str(question_id): str(option_id) for question_id, option_id in key.correct_options().items()}
+        owner = trivia_app.User.query.filter_by(username='plans').first()
+        snapshot = trivia_app.get_set_snapshot(second.id)
+        room = trivia_app.live_rooms.create(snapshot, trivia_app.get_answer_key(second.id), owner.id)
+        room_question = snapshot.questions[0]
+
+    edit_form = {'set_title': 'Edited', 'category': 'Plans', 'difficulty': 'hard'}
+    update_form = dict(edit_form)
+    for question_num in range(1, 6):
+        update_form[f'question_{question_num}'] = f'Updated {question_num}'
+        update_form[f'question_{question_num}_options[]'] = [f'Option {option_num}' for option_num in range(1, 5)]
+        update_form[f'correct_option_{question_num}'] = '1'
+
+    imported = json.dumps({
+        'trivia_set_id': 'plans-import', 'set_title': 'Imported plan set', 'category': 'Plans', 'difficulty': 'easy',
+        'questions': [{'question_text': 'Imported question', 'options': ['a', 'b'], 'correct_option': 1}],
+    }).encode() + b'\n'
+
+    return [
+        ('register', 'GET', '/register', None),
+        ('register', 'POST', '/register', {'data': {'email': 'new@example.com', 'username': 'new', 'password': 'new'}}),
+        ('logout', 'GET', '/logout', None),
+        ('login', 'POST', '/login', {'data': {'email': 'plans@example.com', 'username': 'plans', 'password': 'plans'}}),
+        ('home', 'GET', '/', None),
+        ('dashboard', 'GET', '/dashboard', None),
+        ('search', 'POST', '/search', {'data': {'search_term': 'plan'}}),
+        ('search', 'GET', '/search?search_term=plan', None),
+        ('play_set', 'GET', f'/play_set/{first.id}', None),
+        ('play_set', 'POST', f'/play_set/{first.id}', {'data': answers}),
+        ('guest_play_set', 'GET', f'/guest_play_set/{second.id}', None),
+        ('guest_play_set', 'POST', f'/guest_play_set/{second.id}', {'data': answers}),
+        ('results', 'GET', f'/results/{first.id}/5', None),
+        ('submit_trivia_set', 'POST', f'/submit_trivia_set/{first.trivia_set_id}',
+         {'data': {f'answer_{question_id}': option_id for question_id, option_id in answers.items()}}),
+        ('api_trivia_set', 'GET', f'/api/sets/{first.id}', None),
+        ('api_start', 'POST', f'/api/sets/{first.id}/start', None),
+        ('api_answer', 'POST', f'/api/sets/{first.id}/answers', {'json': {'answers': answers}}),
+        ('api_finish', 'POST', f'/api/sets/{first.id}/finish', None),
+        ('set_leaderboard', 'GET', f'/api/leaderboards/{first.id}', None),
+        ('set_leaderboard_user', 'GET', f'/api/leaderboards/{first.id}/users/1', None),
+        ('global_leaderboard', 'GET', '/api/leaderboards/global', None),
+        ('global_leaderboard_user', 'GET', '/api/leaderboards/global/users/1', None),
+        ('similar_sets', 'GET', f'/api/sets/{first.id}/similar', None),
+        ('recommendations', 'GET', '/api/recommendations', None),
+        ('create_trivia_set', 'GET', '/create_trivia_set', None),
+        ('edit_trivia_set', 'GET', f'/edit_trivia_set/{first.trivia_set_id}', None),
+        ('edit_trivia_set', 'POST', f'/edit_trivia_set/{first.trivia_set_id}', {'data': edit_form}),
+        ('update_trivia_set', 'POST', f'/update_trivia_set/{second.trivia_set_id}', {'data': update_form}),
+        ('print_database', 'GET', '/print_database', None),
+        ('open_room', 'POST', '/rooms', {'data': {'set_id': str(second.id)}}),
+        ('live_room', 'GET', f'/rooms/{room.code}', None),
+        ('join_room', 'POST', f'/rooms/{room.code}/join', {'json': {}}),
+        ('host_room', 'GET', f'/rooms/{room.code}/host', None),
+        ('start_room', 'POST', f'/rooms/{room.code}/start', None),
+        ('room_answer', 'POST', f'/rooms/{room.code}/answer',
+         {'json': {'question_id': room_question.id, 'option_id': room_question.options[0].id}}),
+        ('room_state', 'GET', f'/rooms/{room.code}/state', None),
+        ('advance_room', 'POST', f'/rooms/{room.code}/next', None),
+        ('cache_stats', 'GET', '/cache_stats', None),
+        ('metrics', 'GET', '/metrics', None),
+        ('export_sets', 'GET', '/export/sets.ndjson', None),
+        ('import_sets', 'POST', '/import/sets', {'data': imported, 'content_type': 'application/x-ndjson'}),
+        ('delete_trivia_set', 'POST', f'/delete_trivia_set/{last.trivia_set_id}', None),
+        ('delete_trivia_sets_route', 'POST', '/delete_trivia_sets', {'data': {'category': 'No such category'}}),
+        ('logout', 'GET', '/logout', None),
+    ]
+
+
+def explain(connection, statement, parameters):
+    cursor = connection.cursor()
+    try:
+        cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+        return [row[-1] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def bounded_walk(statement, plan, detail):
+    # An index read in the ORDER BY's order (no temp b-tree to sort) stops after LIMIT
+    # rows, e.g. the top of a ranking
+    return (' USING ' in detail and 'INDEX' in detail and re.search(r'\bLIMIT\b', statement)
+            and not any('TEMP B-TREE' in line for line in plan))
+
+
+def table_scans(statement, plan):
+    for detail in plan:
+        match = SCAN.match(detail)
+        if match and not any(ignored in detail for ignored in IGNORED) and not bounded_walk(statement, plan, detail):
+            yield match.group(1), detail
+
+
+def main():
+    trivia_app = load_app()
+    trivia_app.app.config['TESTING'] = True
+    client = trivia_app.app.test_client()
+    created = seed(trivia_app, client)
+
+    recorder = StatementRecorder()
+    with trivia_app.app.app_context():
+        engine = trivia_app.db.engine
+    event.listen(engine, 'before_cursor_execute', recorder)
+
+    # A route that raises or answers outside 2xx/3xx fails the check, otherwise a broken
+    # route would pass with whatever statements it sent before failing
+    failures = []
+    for label, method, url, options in routes(trivia_app, created):
+        recorder.label = label
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                response = client.open(url, method=method, **(options or {}))
+                # Streamed bodies (the export) only run their queries as they are read
+                response.get_data()
+                response.close()
+            status = response.status_code
+        except Exception as error:
+            status = f'error: {error!r}'
+        recorder.label = None
+        print(f'{method:>4} {url} -> {status}')
+        if not isinstance(status, int) or not 200 <= status < 400:
+            failures.append(f'{label}: {method} {url} -> {status}')
+
+    event.remove(engine, 'before_cursor_execute', recorder)
+
+    connection = engine.raw_connection()
+    seen = set()
+    try:
+        for label, statement, parameters in recorder.statements:
+            if (label, statement) in seen:
+                continue
+            seen.add((label, statement))
+            for table, detail in table_scans(statement, explain(connection, statement, parameters)):
+                if (label, table) in ALLOWED_SCANS:
+                    continue
+                failures.append(f'{label}: {detail}\n    {" ".join(statement.split())}')
+    finally:
+        connection.close()
+
+    print(f'\nchecked {len(seen)} distinct statements')
+    if failures:
+        print(f'{len(failures)} problem(s):')
+        for failure in failures:
+            print(f'  {failure}')
+        sys.exit(1)
+    print('no table scans')
+
+
+if __name__ == '__main__':
+    main()
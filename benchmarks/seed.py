@@ -0,0 +1,102 @@
+# benchmarks/seed.py
+#
+# Fills a database with synthetic users, sets, questions, options and scores using the
+# app's own models and bulk paths. Deterministic for a given --seed.
+import argparse
+import random
+from collections import namedtuple
+
+from sqlalchemy import insert
+
+from benchmarks.bench_search import CATEGORIES, WORDS
+
+Seeded = namedtuple('Seeded', ['user_ids', 'set_ids', 'trivia_set_ids', 'terms'])
+
+PASSWORD = 'bench'
+
+
+def user_credentials(user_num):
+    return {'email': f'player{user_num}@example.com', 'username': f'player{user_num}', 'password': PASSWORD}
+
+
+def synthetic_sets(count, num_questions, num_options, rng):
+    for set_num in range(count):
+        yield {
+            'set_title': ' '.join(rng.sample(WORDS, 3)) + f' {set_num}',
+            'category': rng.choice(CATEGORIES),
+            'difficulty': rng.choice(('easy', 'medium', 'hard')),
+            'questions': [
+                {
+                    'question_text': ' '.join(rng.sample(WORDS, 5)) + '?',
+                    'options': [{'text': f'{rng.choice(WORDS)} {option_num}', 'is_correct': option_num == 0}
+                                for option_num in range(num_options)],
+                }
+                for _ in range(num_questions)
+            ],
+        }
+
+
+def seed(trivia_app, users=50, sets=500, questions=10, options=4, scores=2000, random_seed=42):
+    rng = random.Random(random_seed)
+    db = trivia_app.db
+
+    # Everyone shares the password, so one hash will do
+    password_hash = trivia_app.password_hasher.hash(PASSWORD)
+    new_users = []
+    for user_num in range(users):
+        credentials = user_credentials(user_num)
+        new_users.append(trivia_app.User(username=credentials['username'], email=credentials['email'],
+                                         password=password_hash))
+    db.session.add_all(new_users)
+    db.session.commit()
+    user_ids = [user.id for user in new_users]
+
+    # Spread the sets over the users in batches, one owner per batch
+    created = []
+    specs = list(synthetic_sets(sets, questions, options, rng))
+    per_owner = max(1, sets // max(1, users))
+    for start in range(0, len(specs), per_owner):
+        owner = user_ids[(start // per_owner) % len(user_ids)]
+        created.extend(trivia_app.create_trivia_sets(specs[start:start + per_owner], owner, commit=False))
+    db.session.commit()
+
+    pairs = set()
+    while created and len(pairs) < min(scores, users * len(created)):
+        pairs.add((rng.choice(user_ids), rng.choice(created).id))
+    if pairs:
+        db.session.execute(insert(trivia_app.UserScore),
+                           [{'user_id': user_id, 'trivia_set_id': set_id, 'score': rng.randint(0, questions)}
+                            for user_id, set_id in sorted(pairs)])
+        trivia_app.refresh_user_totals(user_ids)
+        db.session.commit()
+
+    trivia_app.rebuild_search_index()
+    return Seeded(user_ids, [created_set.id for created_set in created],
+                  [created_set.trivia_set_id for created_set in created], WORDS)
+
+
+def main():
+    from benchmarks.common import load_app
+
+    parser = argparse.ArgumentParser(description='Seed a database with synthetic trivia data')
+    parser.add_argument('database', help='SQLite file to create or extend')
+    add_seed_arguments(parser)
+    args = parser.parse_args()
+
+    trivia_app = load_app(args.database)
+    with trivia_app.app.app_context():
+        seeded = seed(trivia_app, args.users, args.sets, args.questions, args.options, args.scores, args.seed)
+    print(f'seeded {len(seeded.user_ids)} users and {len(seeded.set_ids)} sets into {args.database}')
+
+
+def add_seed_arguments(parser):
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--sets', type=int, default=500)
+    parser.add_argument('--questions', type=int, default=10, help='per set')
+    parser.add_argument('--options', type=int, default=4, help='per question')
+    parser.add_argument('--scores', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=42)
+
+
+if __name__ == '__main__':
+    main()
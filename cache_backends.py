@@ -0,0 +1,182 @@
+# cache_backends.py
+import itertools
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from flask_caching.backends.base import BaseCache
+
+
+class SQLiteCache(BaseCache):
+    # Cache shared by every worker process on one host, stored in an SQLite file.
+    # Select it with CACHE_TYPE='cache_backends.SQLiteCache'; the file defaults to
+    # instance/cache.sqlite and can be moved with CACHE_SQLITE_PATH.
+    # threshold is checked every prune_interval writes of a process, so the file can go
+    # over it by that many entries per worker before it is pruned back.
+    def __init__(self, path, default_timeout=300, threshold=10000, prune_interval=100):
+        super().__init__(default_timeout=default_timeout)
+        self.path = path
+        self.threshold = threshold
+        self.prune_interval = max(1, prune_interval)
+        self._writes = itertools.count(1)
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+                         'expires REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_cache_expires ON cache (expires)')
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        path = config.get('CACHE_SQLITE_PATH') or os.path.join(app.instance_path, 'cache.sqlite')
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        kwargs.setdefault('threshold', config.get('CACHE_THRESHOLD', 10000))
+        return cls(path, *args, **kwargs)
+
+    def _connection(self):
+        # One connection per thread; WAL lets readers in other workers run during writes
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _expires(self, timeout):
+        timeout = self._normalize_timeout(timeout)
+        return time.time() + timeout if timeout > 0 else 0
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value FROM cache WHERE key = ? AND (expires = 0 OR expires > ?)', (key, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        try:
+            return pickle.loads(row[0])
+        except (pickle.PickleError, EOFError, AttributeError, ImportError):
+            return None
+
+    def has(self, key):
+        return self._connection().execute(
+            'SELECT 1 FROM cache WHERE key = ? AND (expires = 0 OR expires > ?)', (key, time.time())
+        ).fetchone() is not None
+
+    def set(self, key, value, timeout=None):
+        conn = self._connection()
+        conn.execute('INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                     (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._expires(timeout)))
+        self._prune(conn)
+        return True
+
+    def add(self, key, value, timeout=None):
+        conn = self._connection()
+        conn.execute('DELETE FROM cache WHERE key = ? AND expires != 0 AND expires <= ?', (key, time.time()))
+        cursor = conn.execute('INSERT OR IGNORE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                              (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._expires(timeout)))
+        return cursor.rowcount == 1
+
+    def delete(self, key):
+        return self._connection().execute('DELETE FROM cache WHERE key = ?', (key,)).rowcount == 1
+
+    def delete_many(self, *keys):
+        conn = self._connection()
+        conn.executemany('DELETE FROM cache WHERE key = ?', [(key,) for key in keys])
+        return list(keys)
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache')
+        return True
+
+    def _prune(self, conn):
+        # Counting the rows reads the whole key index, so only every prune_interval
+        # writes; real work only once the threshold is crossed
+        if self.threshold <= 0 or next(self._writes) % self.prune_interval:
+            return
+        count = conn.execute('SELECT count(*) FROM cache').fetchone()[0]
+        if count <= self.threshold:
+            return
+        conn.execute('DELETE FROM cache WHERE expires != 0 AND expires <= ?', (time.time(),))
+        conn.execute('DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires = 0, expires LIMIT ?)',
+                     (max(0, count - self.threshold),))
+
+    def size(self):
+        return self._connection().execute(
+            'SELECT count(*), COALESCE(sum(length(value)), 0) FROM cache'
+        ).fetchone()
+
+
+class CountingCache:
+    # Wraps whatever backend Flask-Caching built and counts hits, misses and writes.
+    # Counters are per process; entries/bytes come from the backend when it can tell.
+    # listeners are called with True/False for every hit/miss (see metrics.py).
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.deletes = 0
+        self.listeners = []
+
+    def _count(self, value):
+        hit = value is not None
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        for listener in self.listeners:
+            listener(hit)
+
+    def get(self, key):
+        value = self.backend.get(key)
+        self._count(value)
+        return value
+
+    def get_many(self, *keys):
+        values = self.backend.get_many(*keys)
+        for value in values:
+            self._count(value)
+        return values
+
+    def set(self, key, value, timeout=None):
+        self.sets += 1
+        return self.backend.set(key, value, timeout)
+
+    def set_many(self, mapping, timeout=None):
+        self.sets += len(mapping)
+        return self.backend.set_many(mapping, timeout)
+
+    def delete(self, key):
+        self.deletes += 1
+        return self.backend.delete(key)
+
+    def delete_many(self, *keys):
+        self.deletes += len(keys)
+        return self.backend.delete_many(*keys)
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def stats(self):
+        stats = {
+            'backend': type(self.backend).__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'sets': self.sets,
+            'deletes': self.deletes,
+        }
+        if hasattr(self.backend, 'size'):
+            stats['entries'], stats['bytes'] = self.backend.size()
+        elif hasattr(self.backend, '_cache'):
+            stats['entries'] = len(self.backend._cache)
+        return stats
+
+
+def install_cache_stats(cache, app):
+    # Put a CountingCache between a flask_caching.Cache and its backend
+    backends = app.extensions['cache']
+    if not isinstance(backends[cache], CountingCache):
+        backends[cache] = CountingCache(backends[cache])
+    return backends[cache]
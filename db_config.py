@@ -0,0 +1,63 @@
+# db_config.py
+import os
+
+from sqlalchemy import event
+
+
+# Applied to every new SQLite connection when SQLITE_TUNING is on.
+# WAL lets readers run alongside the single writer, synchronous=NORMAL is safe
+# with WAL and only fsyncs at checkpoints, and busy_timeout makes writers wait
+# for the lock instead of failing with "database is locked".
+def sqlite_pragmas(environ=os.environ):
+    return {
+        'journal_mode': environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': int(environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        'cache_size': -int(environ.get('SQLITE_CACHE_SIZE_KB', 64 * 1024)),   # negative = KiB
+        'mmap_size': int(environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        'temp_store': 'MEMORY',
+    }
+
+
+def database_uri(environ=os.environ):
+    uri = environ.get('DATABASE_URL', 'sqlite:///db.sqlite')
+    # Hosted Postgres usually hands out postgres://, which SQLAlchemy doesn't accept
+    if uri.startswith('postgres://'):
+        uri = 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
+def engine_options(uri, environ=os.environ):
+    if uri.startswith('sqlite'):
+        connect_args = {'check_same_thread': False,
+                        'timeout': int(environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)) / 1000}
+        if uri in ('sqlite://', 'sqlite:///:memory:'):
+            # In-memory databases live on a single static connection
+            return {'connect_args': connect_args}
+        # SQLite has one writer; a small pool of long-lived connections is enough
+        return {
+            'pool_size': int(environ.get('DB_POOL_SIZE', 5)),
+            'max_overflow': int(environ.get('DB_MAX_OVERFLOW', 10)),
+            'connect_args': connect_args,
+        }
+    return {
+        'pool_size': int(environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(environ.get('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': int(environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True,
+    }
+
+
+def install_sqlite_pragmas(engine, pragmas):
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
@@ -0,0 +1,84 @@
+# http_caching.py
+import hashlib
+import os
+from collections import namedtuple
+
+from flask import make_response, request
+from werkzeug.http import is_resource_modified
+
+
+# Conditional GET for the read-only pages. A page's weak ETag is a digest of what it
+# is built from: the set's trivia_set_id (unique even when SQLite reuses a deleted
+# row id) and version, bumped by every edit, plus whatever else it shows. Validators
+# are checked before rendering, so revalidating an unchanged page answers 304 from
+# the cached set snapshot, without the ORM or a template.
+# Guest pages are public: a reverse proxy may serve them for HTTP_CACHE_SHARED_MAX_AGE
+# seconds, then revalidates. Browsers always revalidate, and pages for logged-in
+# users are private.
+Validators = namedtuple('Validators', ['etag', 'last_modified', 'public'])
+
+
+def page_validators(*parts, last_modified=None, public=True):
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+    return Validators(digest, last_modified, public)
+
+
+def release_digest(app):
+    # Templates and the static build change what every page looks like, so they are
+    # part of each ETag; a deploy that changes them makes old copies stale
+    digest = hashlib.blake2b(digest_size=6)
+    paths = [os.path.join(app.static_folder, 'dist', 'manifest.json')]
+    for root, _, files in os.walk(os.path.join(app.root_path, app.template_folder)):
+        paths += [os.path.join(root, name) for name in files]
+    for path in sorted(paths):
+        try:
+            with open(path, 'rb') as f:
+                digest.update(path.encode() + f.read())
+        except FileNotFoundError:
+            continue
+    return digest.hexdigest()
+
+
+class HttpCaching:
+    def __init__(self):
+        self.enabled = True
+        self.shared_max_age = 30
+        self.release = ''
+        self.not_modified = 0
+        self.rendered = 0
+
+    def init_app(self, app):
+        self.enabled = app.config.get('HTTP_CACHING', True)
+        self.shared_max_age = app.config.get('HTTP_CACHE_SHARED_MAX_AGE', self.shared_max_age)
+        self.release = release_digest(app)
+
+    def page(self, validators, render):
+        # 304 when the client's copy is current, otherwise render() with validators
+        if not self.enabled:
+            return render()
+        etag = f'{self.release}-{validators.etag}'
+        if not is_resource_modified(request.environ, etag=etag, last_modified=validators.last_modified):
+            self.not_modified += 1
+            response = make_response('', 304)
+        else:
+            self.rendered += 1
+            response = make_response(render())
+        response.set_etag(etag, weak=True)
+        if validators.last_modified is not None:
+            response.last_modified = validators.last_modified
+        if validators.public:
+            response.cache_control.public = True
+            response.cache_control.max_age = 0
+            if self.shared_max_age:
+                response.cache_control.s_maxage = self.shared_max_age
+        else:
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+        return response
+
+    def stats(self):
+        # In the cache stats shape: a hit is a 304
+        return {'hits': self.not_modified, 'misses': self.rendered}
+
+
+http_caching = HttpCaching()
@@ -0,0 +1,214 @@
+# leaderboards.py
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+
+from sqlalchemy import delete, exists, func, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, UserScore, UserTotalScore
+
+
+def refresh_user_totals(user_ids):
+    # Rewrites the players' rows in user_total_score from their scores, in the caller's
+    # transaction (not committed). Summed again rather than adjusted by a delta, so two
+    # writes for the same player can't leave a total that is off; it is one index range
+    # per player. Players left without scores drop out of the ranking.
+    user_ids = sorted(set(user_ids))
+    if not user_ids:
+        return
+    insert = postgresql_insert if db.engine.dialect.name == 'postgresql' else sqlite_insert
+    statement = insert(UserTotalScore).from_select(
+        ['user_id', 'total'],
+        select(UserScore.user_id, func.sum(UserScore.score))
+        .where(UserScore.user_id.in_(user_ids))
+        .group_by(UserScore.user_id)
+    )
+    db.session.execute(statement.on_conflict_do_update(index_elements=['user_id'],
+                                                       set_={'total': statement.excluded.total}))
+    db.session.execute(
+        delete(UserTotalScore)
+        .where(UserTotalScore.user_id.in_(user_ids),
+               ~exists().where(UserScore.user_id == UserTotalScore.user_id))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def ranked(top):
+    # (user_id, score) best first -> (rank, user_id, score); ties share a rank
+    entries = []
+    for position, (user_id, score) in enumerate(top, start=1):
+        rank = entries[-1][0] if entries and entries[-1][2] == score else position
+        entries.append((rank, user_id, score))
+    return entries
+
+
+class Leaderboard:
+    # Scores kept in a sorted list of (-score, user_id) next to a user -> score dict.
+    # top/rank/percentile are binary searches. An update removes and inserts into the
+    # list, which moves the entries after it, fine for the players of one set.
+    __slots__ = ('scores', 'ranking', 'loaded_at')
+
+    def __init__(self, scores=()):
+        self.scores = dict(scores)
+        self.ranking = sorted((-score, user_id) for user_id, score in self.scores.items())
+        self.loaded_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.ranking)
+
+    def update(self, user_id, score):
+        old = self.scores.get(user_id)
+        if old == score:
+            return
+        if old is not None:
+            del self.ranking[bisect_left(self.ranking, (-old, user_id))]
+        self.scores[user_id] = score
+        insort(self.ranking, (-score, user_id))
+
+    def add(self, user_id, delta):
+        self.update(user_id, self.scores.get(user_id, 0) + delta)
+
+    def remove(self, user_id):
+        old = self.scores.pop(user_id, None)
+        if old is not None:
+            del self.ranking[bisect_left(self.ranking, (-old, user_id))]
+
+    def top(self, limit=10):
+        return [(user_id, -negative_score) for negative_score, user_id in self.ranking[:limit]]
+
+    def rank(self, user_id):
+        # 1-based, players with the same score share a rank
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        return bisect_left(self.ranking, (-score, float('-inf'))) + 1
+
+    def percentile(self, user_id):
+        # Share of players with a strictly lower score
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        below = len(self.ranking) - bisect_right(self.ranking, (-score, float('inf')))
+        return round(100.0 * below / len(self.ranking), 1)
+
+    def standing(self, user_id):
+        return {
+            'user_id': user_id,
+            'score': self.scores.get(user_id),
+            'rank': self.rank(user_id),
+            'percentile': self.percentile(user_id),
+            'players': len(self),
+        }
+
+
+class GlobalLeaderboard:
+    # Players ranked by the sum of their set scores, read from user_total_score on each
+    # call rather than held in memory. The top is a walk of the (total, user_id) index
+    # that stops at limit. A standing counts the index entries above, below and level
+    # with the player's total: index-only range counts, but together they touch every
+    # player, so it costs O(players) reads rather than a lookup. len() is a count too.
+    # Every worker sees a write as soon as it is committed.
+    def __len__(self):
+        return db.session.scalar(select(func.count()).select_from(UserTotalScore))
+
+    def top(self, limit=10):
+        return [tuple(row) for row in db.session.execute(
+            select(UserTotalScore.user_id, UserTotalScore.total)
+            .order_by(UserTotalScore.total.desc(), UserTotalScore.user_id)
+            .limit(limit)
+        )]
+
+    def standing(self, user_id):
+        other = db.aliased(UserTotalScore)
+
+        def count(condition):
+            return select(func.count()).where(condition).scalar_subquery()
+
+        row = db.session.execute(
+            select(UserTotalScore.total,
+                   count(other.total > UserTotalScore.total),
+                   count(other.total < UserTotalScore.total),
+                   count(other.total == UserTotalScore.total))
+            .where(UserTotalScore.user_id == user_id)
+        ).first()
+        if row is None:
+            return {'user_id': user_id, 'score': None, 'rank': None, 'percentile': None, 'players': len(self)}
+        total, above, below, level = row
+        players = above + below + level
+        return {
+            'user_id': user_id,
+            'score': total,
+            'rank': above + 1,
+            'percentile': round(100.0 * below / players, 1),
+            'players': players,
+        }
+
+    def rank(self, user_id):
+        return self.standing(user_id)['rank']
+
+    def percentile(self, user_id):
+        return self.standing(user_id)['percentile']
+
+
+class LeaderboardRegistry:
+    # Per-set boards are loaded on first use (one grouped query) and then updated
+    # incrementally from record(). Boards older than max_age seconds are reloaded so
+    # that scores written by other worker processes show up eventually.
+    # The global board is GlobalLeaderboard, kept in the database.
+    def __init__(self, max_sets=1024, max_age=60):
+        self.max_sets = max_sets
+        self.max_age = max_age
+        self._sets = {}
+        self._global = GlobalLeaderboard()
+        self._lock = threading.RLock()
+
+    def configure(self, max_sets, max_age):
+        self.max_sets = max_sets
+        self.max_age = max_age
+
+    def _fresh(self, board):
+        return board is not None and time.monotonic() - board.loaded_at < self.max_age
+
+    def for_set(self, trivia_set_id):
+        with self._lock:
+            board = self._sets.get(trivia_set_id)
+            if self._fresh(board):
+                # Touch for LRU order
+                self._sets[trivia_set_id] = self._sets.pop(trivia_set_id)
+                return board
+
+        rows = db.session.execute(
+            select(UserScore.user_id, func.max(UserScore.score))
+            .where(UserScore.trivia_set_id == trivia_set_id)
+            .group_by(UserScore.user_id)
+        ).all()
+        board = Leaderboard(rows)
+        with self._lock:
+            self._sets.pop(trivia_set_id, None)
+            self._sets[trivia_set_id] = board
+            while len(self._sets) > self.max_sets:
+                self._sets.pop(next(iter(self._sets)))
+        return board
+
+    def global_board(self):
+        return self._global
+
+    def record(self, user_id, trivia_set_id, score):
+        # The global board needs nothing here, its totals were written with the score
+        with self._lock:
+            board = self._sets.get(trivia_set_id)
+            if board is not None:
+                board.update(user_id, score)
+
+    def drop_set(self, trivia_set_id):
+        with self._lock:
+            self._sets.pop(trivia_set_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._sets.clear()
+
+
+leaderboards = LeaderboardRegistry()
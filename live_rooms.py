@@ -0,0 +1,455 @@
+# live_rooms.py
+import itertools
+import json
+import os
+import secrets
+import threading
+import time
+from collections import deque
+
+
+# Hosted live rounds. A room plays one trivia set for everyone at once: the server owns
+# the clock, pushes each question with its deadline over server-sent events and scores
+# answers as they arrive. Rooms live in the memory of the process that created them.
+#
+# Fan-out: every event is serialized once into an append-only log and all subscribers
+# wake on one Condition and copy the bytes they haven't sent yet. Per-player changes
+# (joins, answer counts) are coalesced into at most one 'progress' event per
+# progress_interval instead of an event per player, so a round with N players costs O(N)
+# writes per question, not O(N^2).
+#
+# Each open stream holds a server thread (or a greenlet under gevent) blocked on that
+# Condition; there is no event loop of our own. The manager caps open streams per process
+# and per room so viewers can't take every worker thread, and refuses more beyond that.
+LOBBY, QUESTION, REVEAL, FINISHED = 'lobby', 'question', 'reveal', 'finished'
+
+CODE_ALPHABET = 'ABCDEFGHJKLMNPQRSTUVWXYZ23456789'   # no 0/O or 1/I
+CODE_LENGTH = 5
+STANDINGS_SHOWN = 10
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def encode_event(seq, event_type, data):
+    payload = json.dumps(data, separators=(',', ':'))
+    return f'id: {seq}\nevent: {event_type}\ndata: {payload}\n\n'.encode()
+
+
+class LivePlayer:
+    __slots__ = ('player_id', 'name', 'user_id', 'score', 'answer_ms', 'answers')
+
+    def __init__(self, player_id, name, user_id=None):
+        self.player_id = player_id
+        self.name = name
+        self.user_id = user_id
+        self.score = 0
+        self.answer_ms = 0      # total time taken on correct answers, breaks ties
+        self.answers = {}       # question id -> option id or typed answer
+
+
+class Room:
+    def __init__(self, code, trivia_set, answer_key, host_id, seconds=20, reveal_seconds=5, max_players=5000,
+                 progress_interval=1.0, event_log=256):
+        self.code = code
+        self.trivia_set_id = trivia_set.id
+        self.title = trivia_set.set_title
+        self.questions = trivia_set.questions
+        self.answer_key = answer_key
+        self.correct_options = answer_key.correct_options()
+        self.host_id = host_id
+        self.seconds = seconds
+        self.reveal_seconds = reveal_seconds
+        self.max_players = max_players
+        self.progress_interval = progress_interval
+        self.state = LOBBY
+        self.question_index = -1
+        self.started_at = None      # epoch ms the current question went out
+        self.deadline = None        # epoch ms the current question or reveal ends
+        self.players = {}
+        self.by_user = {}
+        self.subscribers = 0
+        self.updated = time.time()
+        self._player_ids = itertools.count(1)
+        self._answered = 0
+        self._dirty = False
+        self._last_progress = 0
+        self._finished = False
+        self._events = deque(maxlen=event_log)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    # Events
+    #----------------------------------------------------------------------------------
+    def _publish(self, event_type, data):
+        # Caller holds the lock
+        self._seq += 1
+        self._events.append(encode_event(self._seq, event_type, data))
+        self.updated = time.time()
+        self._changed.notify_all()
+
+    def _question_data(self):
+        question = self.questions[self.question_index]
+        return {
+            'index': self.question_index,
+            'total': len(self.questions),
+            'id': question.id,
+            'question_text': question.question_text,
+            'question_type': question.question_type,
+            # An open-ended question's options are its accepted answers
+            'options': [] if question.question_type == 'open_ended' else
+                       [{'id': option.id, 'text': option.text} for option in question.options],
+            'started': self.started_at,
+            'deadline': self.deadline,
+        }
+
+    def _standings(self, limit=STANDINGS_SHOWN):
+        ranked = sorted(self.players.values(), key=lambda player: (-player.score, player.answer_ms, player.player_id))
+        return [{'rank': rank, 'name': player.name, 'score': player.score}
+                for rank, player in enumerate(ranked[:limit], start=1)]
+
+    def _state_data(self, player_id=None):
+        data = {
+            'code': self.code,
+            'title': self.title,
+            'state': self.state,
+            'players': len(self.players),
+            'answered': self._answered,
+            'total': len(self.questions),
+            'server_time': _now_ms(),
+            'deadline': self.deadline,
+            'standings': self._standings(),
+        }
+        if self.state in (QUESTION, REVEAL):
+            data['question'] = self._question_data()
+        if self.state == REVEAL:
+            question_id = self.questions[self.question_index].id
+            data['correct_option_id'] = self.correct_options.get(question_id)
+            data['answer'] = self.answer_key.accepted_answer(question_id)
+        player = self.players.get(player_id)
+        if player is not None:
+            data['you'] = {'player_id': player.player_id, 'name': player.name, 'score': player.score}
+        return data
+
+    def snapshot(self, player_id=None):
+        with self._lock:
+            return self._state_data(player_id)
+
+    # Round
+    #----------------------------------------------------------------------------------
+    def join(self, name, user_id=None):
+        # Returns the player id; a logged-in user rejoining gets their old seat back
+        with self._lock:
+            if user_id is not None and user_id in self.by_user:
+                return self.by_user[user_id]
+            if self.state == FINISHED:
+                raise ValueError('This room has finished')
+            if len(self.players) >= self.max_players:
+                raise ValueError('This room is full')
+            name = (name or '').strip()[:40] or f'Player {len(self.players) + 1}'
+            player = LivePlayer(next(self._player_ids), name, user_id)
+            self.players[player.player_id] = player
+            if user_id is not None:
+                self.by_user[user_id] = player.player_id
+            self._dirty = True
+            return player.player_id
+
+    def start(self):
+        with self._lock:
+            if self.state != LOBBY:
+                raise ValueError('The round has already started')
+            self._next_question()
+
+    def advance(self):
+        # Host skips ahead: closes the open question, or moves on from the reveal
+        with self._lock:
+            if self.state == QUESTION:
+                self._reveal()
+            elif self.state in (LOBBY, REVEAL):
+                self._next_question()
+
+    def answer(self, player_id, question_id, option_id):
+        # First answer per question counts, and only before the deadline
+        with self._lock:
+            player = self.players.get(player_id)
+            if player is None:
+                raise ValueError('Join the room first')
+            if self.state != QUESTION or self.questions[self.question_index].id != question_id:
+                raise ValueError('This question is closed')
+            now = _now_ms()
+            if now > self.deadline:
+                raise ValueError('Time is up')
+            if question_id in player.answers:
+                raise ValueError('Already answered')
+
+            player.answers[question_id] = option_id
+            correct = self.answer_key.is_correct(question_id, option_id)
+            if correct:
+                player.score += 1
+                player.answer_ms += now - self.started_at
+            self._answered += 1
+            self._dirty = True
+            if self._answered >= len(self.players):
+                self._reveal()
+            return {'correct': correct, 'score': player.score}
+
+    def _next_question(self):
+        if self.question_index + 1 >= len(self.questions):
+            self._finish()
+            return
+        self.question_index += 1
+        self.state = QUESTION
+        self._answered = 0
+        self.started_at = _now_ms()
+        self.deadline = self.started_at + self.seconds * 1000
+        self._publish('question', self._question_data())
+
+    def _reveal(self):
+        self.state = REVEAL
+        self.deadline = _now_ms() + self.reveal_seconds * 1000
+        question_id = self.questions[self.question_index].id
+        self._publish('reveal', {
+            'question_id': question_id,
+            'correct_option_id': self.correct_options.get(question_id),
+            'answer': self.answer_key.accepted_answer(question_id),
+            'answered': self._answered,
+            'players': len(self.players),
+            'deadline': self.deadline,
+            'standings': self._standings(),
+        })
+        self._dirty = False
+
+    def _finish(self):
+        self.state = FINISHED
+        self.deadline = None
+        self._finished = True
+        self._publish('finished', {'standings': self._standings(), 'players': len(self.players)})
+
+    def tick(self, now_ms):
+        # Called by the manager: runs the clock and flushes coalesced progress
+        with self._lock:
+            if self.state == QUESTION and now_ms >= self.deadline:
+                self._reveal()
+            elif self.state == REVEAL and now_ms >= self.deadline:
+                self._next_question()
+            if self._dirty and now_ms - self._last_progress >= self.progress_interval * 1000:
+                self._dirty = False
+                self._last_progress = now_ms
+                self._publish('progress', {'players': len(self.players), 'answered': self._answered})
+
+    def take_finished(self):
+        # True once, after the round ends
+        with self._lock:
+            finished, self._finished = self._finished, False
+            return finished
+
+    def results(self):
+        # (user_id, score) for the logged-in players
+        with self._lock:
+            return [(player.user_id, player.score) for player in self.players.values() if player.user_id is not None]
+
+    def close(self):
+        with self._lock:
+            if self.state != FINISHED:
+                self.state = FINISHED
+                self._publish('closed', {})
+
+    # Subscribers
+    #----------------------------------------------------------------------------------
+    def stream(self, player_id=None, last_event_id=None, keepalive=15):
+        # Server-sent events for one client. A reconnect with Last-Event-ID replays what
+        # it missed while that is still in the log; otherwise it starts from a snapshot.
+        with self._lock:
+            self.subscribers += 1
+            first = self._seq - len(self._events) + 1
+            if last_event_id is not None and first <= last_event_id + 1 <= self._seq + 1:
+                cursor = last_event_id
+                chunk = b''
+            else:
+                cursor = self._seq
+                chunk = encode_event(self._seq, 'state', self._state_data(player_id))
+        try:
+            yield b'retry: 2000\n\n' + chunk
+            while True:
+                with self._changed:
+                    if self._seq == cursor and self.state != FINISHED:
+                        self._changed.wait(keepalive)
+                    if self._seq == cursor:
+                        if self.state == FINISHED:
+                            return
+                        chunk = b': keepalive\n\n'
+                    else:
+                        first = self._seq - len(self._events) + 1
+                        if cursor + 1 < first:
+                            # Fell behind further than the log goes back
+                            chunk = encode_event(self._seq, 'state', self._state_data(player_id))
+                        else:
+                            chunk = b''.join(itertools.islice(self._events, cursor + 1 - first, None))
+                        cursor = self._seq
+                yield chunk
+        finally:
+            with self._lock:
+                self.subscribers -= 1
+
+
+class CountedStream:
+    # Event stream that gives its slot back when the server closes it. A generator that
+    # was never started would skip its finally block, so this is what the WSGI server
+    # gets, and close() is called whether or not a chunk was ever sent.
+    def __init__(self, chunks, release):
+        self._chunks = chunks
+        self._release = release
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._chunks)
+
+    def close(self):
+        self._chunks.close()
+        if self._release is not None:
+            self._release()
+            self._release = None
+
+
+class RoomManager:
+    # Keeps the rooms of this process and runs their clocks from one daemon thread,
+    # started lazily like the other background jobs. on_finished(room) is called from
+    # that thread, inside an app context, once per finished round.
+    def __init__(self, seconds=20, reveal_seconds=5, max_players=5000, max_rooms=1000, ttl=3600, tick=0.1,
+                 progress_interval=1.0, max_streams=256, max_room_streams=0):
+        self.seconds = seconds
+        self.reveal_seconds = reveal_seconds
+        self.max_players = max_players
+        self.max_rooms = max_rooms
+        self.ttl = ttl
+        self.tick_interval = tick
+        self.progress_interval = progress_interval
+        self.max_streams = max_streams              # open event streams in this process, 0 = no limit
+        self.max_room_streams = max_room_streams    # per room, 0 = only the process limit
+        self.streams_refused = 0
+        self.on_finished = None
+        self.rounds_finished = 0
+        self._app = None
+        self._rooms = {}
+        self._streams = {}                          # room code -> open streams
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+
+    def init_app(self, app, on_finished=None):
+        self._app = app
+        self.on_finished = on_finished
+        self.seconds = app.config.get('LIVE_ROOM_SECONDS', self.seconds)
+        self.reveal_seconds = app.config.get('LIVE_ROOM_REVEAL_SECONDS', self.reveal_seconds)
+        self.max_players = app.config.get('LIVE_ROOM_MAX_PLAYERS', self.max_players)
+        self.max_rooms = app.config.get('LIVE_ROOM_MAX_ROOMS', self.max_rooms)
+        self.ttl = app.config.get('LIVE_ROOM_TTL', self.ttl)
+        self.progress_interval = app.config.get('LIVE_ROOM_PROGRESS_INTERVAL', self.progress_interval)
+        self.max_streams = app.config.get('LIVE_ROOM_MAX_STREAMS', self.max_streams)
+        self.max_room_streams = app.config.get('LIVE_ROOM_MAX_ROOM_STREAMS', self.max_room_streams)
+
+    def create(self, trivia_set, answer_key, host_id, seconds=None):
+        self._ensure_started()
+        seconds = max(5, min(seconds or self.seconds, 120))
+        with self._lock:
+            if len(self._rooms) >= self.max_rooms:
+                raise ValueError('Too many live rooms, try again later')
+            code = self._new_code()
+            room = Room(code, trivia_set, answer_key, host_id, seconds=seconds, reveal_seconds=self.reveal_seconds,
+                        max_players=self.max_players, progress_interval=self.progress_interval)
+            self._rooms[code] = room
+        return room
+
+    def open_stream(self, room, player_id=None, last_event_id=None):
+        # Room.stream counted against the stream limits; ValueError when they're reached
+        with self._lock:
+            in_room = self._streams.get(room.code, 0)
+            if ((self.max_streams and sum(self._streams.values()) >= self.max_streams)
+                    or (self.max_room_streams and in_room >= self.max_room_streams)):
+                self.streams_refused += 1
+                raise ValueError('Too many live viewers right now, try again in a moment')
+            self._streams[room.code] = in_room + 1
+        return CountedStream(room.stream(player_id, last_event_id), lambda: self._close_stream(room.code))
+
+    def _close_stream(self, code):
+        with self._lock:
+            left = self._streams.get(code, 0) - 1
+            if left > 0:
+                self._streams[code] = left
+            else:
+                self._streams.pop(code, None)
+
+    def _new_code(self):
+        while True:
+            code = ''.join(secrets.choice(CODE_ALPHABET) for _ in range(CODE_LENGTH))
+            if code not in self._rooms:
+                return code
+
+    def get(self, code):
+        return self._rooms.get((code or '').upper())
+
+    def _ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='live-rooms', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.tick_interval):
+            try:
+                self.tick_once()
+            except Exception:
+                if self._app is not None:
+                    self._app.logger.exception('Live room tick failed')
+
+    def tick_once(self):
+        now_ms = _now_ms()
+        expired_before = time.time() - self.ttl
+        with self._lock:
+            rooms = list(self._rooms.values())
+        for room in rooms:
+            room.tick(now_ms)
+            if room.take_finished():
+                self.rounds_finished += 1
+                self._round_finished(room)
+            if room.updated < expired_before:
+                room.close()
+                with self._lock:
+                    self._rooms.pop(room.code, None)
+
+    def _round_finished(self, room):
+        if self.on_finished is None:
+            return
+        with self._app.app_context():
+            try:
+                self.on_finished(room)
+            except Exception:
+                self._app.logger.exception('Recording results of live room %s failed', room.code)
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._lock:
+            rooms = list(self._rooms.values())
+        return {
+            'rooms': len(rooms),
+            'players': sum(len(room.players) for room in rooms),
+            'subscribers': sum(room.subscribers for room in rooms),
+            'streams': sum(self._streams.values()),
+            'streams_refused': self.streams_refused,
+            'rounds_finished': self.rounds_finished,
+        }
+
+
+live_rooms = RoomManager()
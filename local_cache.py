@@ -0,0 +1,103 @@
+# local_cache.py
+import threading
+import time
+from collections import OrderedDict
+
+
+class BoundedLRUCache:
+    # In-process LRU bounded both by entry count and by an approximate memory cap.
+    # sizeof(value) is used to account for memory; values must not change size
+    # while they are cached. With ttl (seconds) entries also expire, for values other
+    # workers can change without telling this one.
+    def __init__(self, max_entries=1024, max_bytes=8 * 1024 * 1024, sizeof=None, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: 0)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def resize(self, max_entries, max_bytes, ttl=None):
+        with self._lock:
+            self.max_entries = max_entries
+            self.max_bytes = max_bytes
+            self.ttl = ttl if ttl is not None else self.ttl
+            self._evict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] <= time.monotonic():
+                del self._entries[key]
+                self._bytes -= entry[1]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            # Never keep something that could not fit on its own
+            if size > self.max_bytes:
+                return
+            expires = time.monotonic() + self.ttl if self.ttl else None
+            self._entries[key] = (value, size, expires)
+            self._bytes += size
+            self._evict()
+
+    def get_or_load(self, key, loader):
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            if value is not None:
+                self.set(key, value)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, size, _) = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+            }
@@ -0,0 +1,267 @@
+# metrics.py
+import bisect
+import cProfile
+import ipaddress
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+# Literals and IN lists are folded so that "the same query with different ids" counts as
+# one statement when looking for N+1 patterns
+_WHITESPACE = re.compile(r'\s+')
+_IN_LIST = re.compile(r'\(\s*(?:\?|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|:\w+))*\s*\)')
+_NUMBER = re.compile(r'\b\d+\b')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+
+
+def normalize_statement(statement):
+    statement = _STRING.sub('?', statement)
+    statement = _NUMBER.sub('?', statement)
+    statement = _IN_LIST.sub('(?)', statement)
+    return _WHITESPACE.sub(' ', statement).strip()
+
+
+class Histogram:
+    # Cumulative Prometheus-style histogram with fixed upper bounds
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+
+class RequestMetrics:
+    # Per-route latency, SQL and cache counters for the whole process.
+    # Everything a request does is collected in flask.g and folded into the totals in
+    # teardown_request, so the counters only need the lock for that one step.
+    def __init__(self):
+        self.n_plus_one_threshold = 5
+        self.profile_dir = None
+        self.token = None
+        self.allowed_networks = ()
+        self._lock = threading.Lock()
+        self._latency = {}                 # (endpoint, method) -> Histogram
+        self._queries = {}                 # endpoint -> Histogram of queries per request
+        self._requests = Counter()         # (endpoint, method, status)
+        self._sql_count = Counter()        # endpoint
+        self._sql_seconds = Counter()      # endpoint
+        self._cache = Counter()            # (endpoint, 'hit' | 'miss')
+        self._n_plus_one = Counter()       # endpoint
+        self._cache_sources = {}           # name -> callable returning BoundedLRUCache-style stats
+
+    def init_app(self, app, engine, shared_cache=None):
+        self.n_plus_one_threshold = app.config.get('METRICS_N_PLUS_ONE_THRESHOLD', self.n_plus_one_threshold)
+        self.token = app.config.get('METRICS_TOKEN')
+        self.allowed_networks = tuple(ipaddress.ip_network(network.strip(), strict=False)
+                                      for network in app.config.get('METRICS_ALLOWED_IPS', '').split(',')
+                                      if network.strip())
+        if app.config.get('PROFILE_REQUESTS'):
+            self.profile_dir = app.config.get('PROFILE_DIR') or os.path.join(app.instance_path, 'profiles')
+
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        if shared_cache is not None:
+            shared_cache.listeners.append(self._cache_access)
+            self.add_cache('shared', shared_cache.stats)
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def add_cache(self, name, stats):
+        self._cache_sources[name] = stats
+
+    def may_scrape(self):
+        # /metrics answers the allowed addresses, and anyone with the token when one is set
+        if self.token and request.headers.get('Authorization') == f'Bearer {self.token}':
+            return True
+        try:
+            address = ipaddress.ip_address(request.remote_addr or '')
+        except ValueError:
+            return False
+        return any(address in network for network in self.allowed_networks)
+
+    # Request hooks
+    def _before_request(self):
+        g.metrics_started = time.perf_counter()
+        g.metrics_sql_count = 0
+        g.metrics_sql_seconds = 0.0
+        g.metrics_statements = Counter()
+        g.metrics_cache = Counter()
+        g.metrics_profiler = None
+        # Profiling is for whoever may scrape /metrics, not for any visitor
+        if self.profile_dir and request.args.get('profile') == '1' and self.may_scrape():
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiler is already running in this process
+                return
+            g.metrics_profiler = profiler
+
+    def _after_request(self, response):
+        started = g.get('metrics_started')
+        if started is None:
+            return response
+        g.metrics_status = response.status_code
+
+        profiler = g.pop('metrics_profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            path = self._dump_profile(profiler, request.endpoint or 'unmatched')
+            response.headers['X-Profile'] = os.path.basename(path)
+
+        elapsed = time.perf_counter() - started
+        response.headers['Server-Timing'] = (f'app;dur={elapsed * 1000:.1f}, '
+                                             f'db;desc="{g.metrics_sql_count} queries";dur={g.metrics_sql_seconds * 1000:.1f}')
+        return response
+
+    def _teardown_request(self, error=None):
+        # Counted here rather than in after_request, which is skipped when an exception
+        # escapes the view or another after_request hook, so 500s are counted too
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        endpoint = request.endpoint or 'unmatched'
+        status = g.pop('metrics_status', 500 if error is not None else 200)
+
+        profiler = g.pop('metrics_profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            self._dump_profile(profiler, endpoint)
+
+        repeated = [(statement, count) for statement, count in g.metrics_statements.items()
+                    if count >= self.n_plus_one_threshold]
+        for statement, count in repeated:
+            current_app.logger.warning('Possible N+1 in %s: %d x %s', endpoint, count, statement[:200])
+
+        with self._lock:
+            key = (endpoint, request.method)
+            if key not in self._latency:
+                self._latency[key] = Histogram(LATENCY_BUCKETS)
+            self._latency[key].observe(elapsed)
+            if endpoint not in self._queries:
+                self._queries[endpoint] = Histogram(QUERY_COUNT_BUCKETS)
+            self._queries[endpoint].observe(g.metrics_sql_count)
+            self._requests[(endpoint, request.method, status)] += 1
+            self._sql_count[endpoint] += g.metrics_sql_count
+            self._sql_seconds[endpoint] += g.metrics_sql_seconds
+            for result, count in g.metrics_cache.items():
+                self._cache[(endpoint, result)] += count
+            if repeated:
+                self._n_plus_one[endpoint] += 1
+
+    def _dump_profile(self, profiler, endpoint):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = os.path.join(self.profile_dir, f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{endpoint}.prof')
+        profiler.dump_stats(path)
+        return path
+
+    # SQLAlchemy and cache hooks, they only count inside a request
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'metrics_started' in g:
+            conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('metrics_query_start')
+        if not starts or not has_request_context() or 'metrics_started' not in g:
+            return
+        g.metrics_sql_seconds += time.perf_counter() - starts.pop()
+        g.metrics_sql_count += 1
+        # N+1 is a read pattern; bulk inserts with RETURNING can legitimately run per row,
+        # and statements with IN lists are already batched
+        if statement.lstrip()[:6].upper() == 'SELECT' and not _IN_LIST.search(statement):
+            g.metrics_statements[normalize_statement(statement)] += 1
+
+    def _cache_access(self, hit):
+        if has_request_context() and 'metrics_started' in g:
+            g.metrics_cache['hit' if hit else 'miss'] += 1
+
+    # Exposition
+    def render(self):
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        def histogram(name, labels, histogram):
+            for bound, total in histogram.cumulative():
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{name}_bucket{{{labels},le="{le}"}} {total}')
+            lines.append(f'{name}_sum{{{labels}}} {histogram.sum:g}')
+            lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+
+        with self._lock:
+            family('trivia_requests_total', 'counter', 'Requests by endpoint, method and status.')
+            for (endpoint, method, status), count in sorted(self._requests.items()):
+                lines.append(f'trivia_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}')
+
+            family('trivia_request_duration_seconds', 'histogram', 'Request latency by endpoint and method.')
+            for (endpoint, method), latency in sorted(self._latency.items()):
+                histogram('trivia_request_duration_seconds', f'endpoint="{endpoint}",method="{method}"', latency)
+
+            family('trivia_sql_queries_per_request', 'histogram', 'SQL statements executed per request.')
+            for endpoint, queries in sorted(self._queries.items()):
+                histogram('trivia_sql_queries_per_request', f'endpoint="{endpoint}"', queries)
+
+            family('trivia_sql_queries_total', 'counter', 'SQL statements executed by endpoint.')
+            for endpoint, count in sorted(self._sql_count.items()):
+                lines.append(f'trivia_sql_queries_total{{endpoint="{endpoint}"}} {count}')
+
+            family('trivia_sql_duration_seconds_total', 'counter', 'Time spent executing SQL by endpoint.')
+            for endpoint, seconds in sorted(self._sql_seconds.items()):
+                lines.append(f'trivia_sql_duration_seconds_total{{endpoint="{endpoint}"}} {seconds:.6f}')
+
+            family('trivia_request_cache_total', 'counter', 'Shared cache (cache.memoize) lookups by endpoint.')
+            for (endpoint, result), count in sorted(self._cache.items()):
+                lines.append(f'trivia_request_cache_total{{endpoint="{endpoint}",result="{result}"}} {count}')
+
+            family('trivia_n_plus_one_total', 'counter',
+                   'Requests that repeated one statement at least the N+1 threshold times.')
+            for endpoint, count in sorted(self._n_plus_one.items()):
+                lines.append(f'trivia_n_plus_one_total{{endpoint="{endpoint}"}} {count}')
+
+        cache_stats = {name: stats() for name, stats in sorted(self._cache_sources.items())}
+        for result in ('hits', 'misses'):
+            family(f'trivia_cache_{result}_total', 'counter', f'Cache {result} by cache.')
+            for name, stats in cache_stats.items():
+                lines.append(f'trivia_cache_{result}_total{{cache="{name}"}} {stats[result]}')
+
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._latency.clear()
+            self._queries.clear()
+            self._requests.clear()
+            self._sql_count.clear()
+            self._sql_seconds.clear()
+            self._cache.clear()
+            self._n_plus_one.clear()
+
+
+request_metrics = RequestMetrics()
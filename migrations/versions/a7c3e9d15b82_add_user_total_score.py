@@ -0,0 +1,38 @@
+"""add user total score
+
+Revision ID: a7c3e9d15b82
+Revises: f2b8d4c61a93
+Create Date: 2026-10-18 21:14:36.508217
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c3e9d15b82'
+down_revision = 'f2b8d4c61a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_total_score',
+    sa.Column('user_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('total', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    with op.batch_alter_table('user_total_score', schema=None) as batch_op:
+        batch_op.create_index('ix_user_total_score_total_user_id', ['total', 'user_id'], unique=False)
+
+    # Totals of existing players, kept up to date by the app from here on
+    op.execute('INSERT INTO user_total_score (user_id, total) '
+               'SELECT user_id, SUM(score) FROM user_score GROUP BY user_id')
+
+
+def downgrade():
+    with op.batch_alter_table('user_total_score', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_total_score_total_user_id')
+
+    op.drop_table('user_total_score')
@@ -0,0 +1,52 @@
+"""add indexes for hot lookups
+
+Revision ID: b7e4c1d2a9f3
+Revises: dcf072edb71f
+Create Date: 2026-10-18 10:12:41.204318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e4c1d2a9f3'
+down_revision = 'dcf072edb71f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keep only the latest score per user and set before making the pair unique
+    op.execute(
+        "DELETE FROM user_score WHERE id NOT IN "
+        "(SELECT max(id) FROM user_score GROUP BY user_id, trivia_set_id)"
+    )
+
+    with op.batch_alter_table('trivia_set', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_trivia_set_user_id'), ['user_id'], unique=False)
+
+    with op.batch_alter_table('question', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_question_trivia_set_id'), ['trivia_set_id'], unique=False)
+
+    with op.batch_alter_table('option', schema=None) as batch_op:
+        batch_op.create_index('ix_option_question_id_is_correct', ['question_id', 'is_correct'], unique=False)
+
+    with op.batch_alter_table('user_score', schema=None) as batch_op:
+        batch_op.create_index('uq_user_score_user_id_trivia_set_id', ['user_id', 'trivia_set_id'], unique=True)
+        batch_op.create_index('ix_user_score_trivia_set_id_user_id_score', ['trivia_set_id', 'user_id', 'score'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user_score', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_score_trivia_set_id_user_id_score')
+        batch_op.drop_index('uq_user_score_user_id_trivia_set_id')
+
+    with op.batch_alter_table('option', schema=None) as batch_op:
+        batch_op.drop_index('ix_option_question_id_is_correct')
+
+    with op.batch_alter_table('question', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_question_trivia_set_id'))
+
+    with op.batch_alter_table('trivia_set', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_trivia_set_user_id'))
@@ -0,0 +1,30 @@
+"""widen user password for hashes
+
+Revision ID: c4a9e2f17d05
+Revises: b7e4c1d2a9f3
+Create Date: 2026-10-18 14:05:12.318842
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4a9e2f17d05'
+down_revision = 'b7e4c1d2a9f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # scrypt hashes are about 160 characters; existing plain passwords are hashed by
+    # `flask hash-passwords` or on each user's next login
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('password', existing_type=sa.String(length=120), type_=sa.String(length=255),
+                              existing_nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('password', existing_type=sa.String(length=255), type_=sa.String(length=120),
+                              existing_nullable=False)
@@ -0,0 +1,52 @@
+"""add question signatures
+
+Revision ID: e81f3b6a2c47
+Revises: c4a9e2f17d05
+Create Date: 2026-10-18 16:40:27.551930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e81f3b6a2c47'
+down_revision = 'c4a9e2f17d05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filled for existing questions by `flask dedup-questions`
+    op.create_table('question_signature',
+    sa.Column('question_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('trivia_set_id', sa.Integer(), nullable=False),
+    sa.Column('signature', sa.LargeBinary(), nullable=False),
+    sa.Column('duplicate_of', sa.Integer(), nullable=True),
+    sa.Column('similarity', sa.Float(), nullable=True),
+    sa.ForeignKeyConstraint(['question_id'], ['question.id'], ),
+    sa.PrimaryKeyConstraint('question_id')
+    )
+    with op.batch_alter_table('question_signature', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_question_signature_duplicate_of'), ['duplicate_of'], unique=False)
+        batch_op.create_index(batch_op.f('ix_question_signature_trivia_set_id'), ['trivia_set_id'], unique=False)
+
+    op.create_table('question_band',
+    sa.Column('band_key', sa.BigInteger(), autoincrement=False, nullable=False),
+    sa.Column('question_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.PrimaryKeyConstraint('band_key', 'question_id')
+    )
+    with op.batch_alter_table('question_band', schema=None) as batch_op:
+        batch_op.create_index('ix_question_band_question_id', ['question_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('question_band', schema=None) as batch_op:
+        batch_op.drop_index('ix_question_band_question_id')
+
+    op.drop_table('question_band')
+    with op.batch_alter_table('question_signature', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_question_signature_trivia_set_id'))
+        batch_op.drop_index(batch_op.f('ix_question_signature_duplicate_of'))
+
+    op.drop_table('question_signature')
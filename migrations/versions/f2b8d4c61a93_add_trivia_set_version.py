@@ -0,0 +1,31 @@
+"""add trivia set version
+
+Revision ID: f2b8d4c61a93
+Revises: e81f3b6a2c47
+Create Date: 2026-10-18 18:05:12.204417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b8d4c61a93'
+down_revision = 'e81f3b6a2c47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing sets start at version 1, last modified now. SQLite can't ADD COLUMN with a
+    # CURRENT_TIMESTAMP default, so the table is copied instead.
+    with op.batch_alter_table('trivia_set', schema=None, recreate='always') as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), server_default=sa.func.current_timestamp(),
+                                      nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('trivia_set', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
+        batch_op.drop_column('version')
@@ -0,0 +1,126 @@
+# models.py
+from datetime import datetime, timezone
+
+from flask_sqlalchemy import SQLAlchemy
+from flask_login import UserMixin
+
+db = SQLAlchemy()
+
+
+def utcnow():
+    # Naive UTC, the way SQLite's CURRENT_TIMESTAMP stores it
+    return datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+
+
+# Models
+#--------------------------------------------------------------------------------------
+class User(db.Model, UserMixin):
+    id = db.Column(db.Integer, primary_key=True)
+    email = db.Column(db.String(120), unique=True, nullable=False)
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    password = db.Column(db.String(length=255), nullable=False)
+    is_active = db.Column(db.Boolean, default=True, nullable=False)
+
+    def get_id(self):
+        return str(self.id)
+
+    def __init__(self, username, email, password):
+        self.username = username
+        self.email = email
+        self.password = password
+
+class TriviaSet(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    set_title = db.Column(db.String(100), nullable=False)
+    category = db.Column(db.String(50), nullable=False)
+    difficulty = db.Column(db.String(50), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    trivia_set_id = db.Column(db.String(50), unique=True, nullable=False)
+    # Bumped with every edit, so cached pages and HTTP validators can tell the set changed
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow,
+                           server_default=db.func.current_timestamp())
+
+    questions = db.relationship('Question', backref='trivia_set', lazy='dynamic')
+
+    def __init__(self, set_title, category, difficulty, user_id, trivia_set_id):
+        self.set_title = set_title
+        self.category = category
+        self.difficulty = difficulty
+        self.user_id = user_id
+        self.trivia_set_id = trivia_set_id
+
+
+class Question(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    question_text = db.Column(db.String(255), nullable=False)
+    question_type = db.Column(db.Enum('multiple_choice', 'open_ended', name='question_type'), nullable=False)
+    trivia_set_id = db.Column(db.Integer, db.ForeignKey('trivia_set.id'), nullable=False, index=True)
+
+    options = db.relationship('Option', backref='question', lazy='dynamic')
+
+    def __init__(self, question_text, question_type, trivia_set_id):
+        self.question_text = question_text
+        self.question_type = question_type
+        self.trivia_set_id = trivia_set_id
+
+
+class Option(db.Model):
+    # Covers the answer key lookup (question -> option id, is_correct)
+    __table_args__ = (db.Index('ix_option_question_id_is_correct', 'question_id', 'is_correct'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    text = db.Column(db.String(255), nullable=False)
+    is_correct = db.Column(db.Boolean, default=False, nullable=False)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), nullable=False)
+
+    def __init__(self, text, question_id, is_correct=False):
+        self.text = text
+        self.is_correct = is_correct
+        self.question_id = question_id
+
+
+class UserScore(db.Model):
+    # One score per user and set; the second index covers per-set leaderboards
+    __table_args__ = (
+        db.Index('uq_user_score_user_id_trivia_set_id', 'user_id', 'trivia_set_id', unique=True),
+        db.Index('ix_user_score_trivia_set_id_user_id_score', 'trivia_set_id', 'user_id', 'score'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    trivia_set_id = db.Column(db.Integer, db.ForeignKey('trivia_set.id'), nullable=False)
+    score = db.Column(db.Integer, nullable=False)
+
+    def __init__(self, user_id, trivia_set_id, score):
+        self.user_id = user_id
+        self.trivia_set_id = trivia_set_id
+        self.score = score
+
+
+class UserTotalScore(db.Model):
+    # Sum of a player's set scores, rewritten with every score write and set delete
+    # (leaderboards.refresh_user_totals). The index is the global ranking.
+    __table_args__ = (db.Index('ix_user_total_score_total_user_id', 'total', 'user_id'),)
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True, autoincrement=False)
+    total = db.Column(db.Integer, nullable=False)
+
+
+class QuestionSignature(db.Model):
+    # MinHash signature of a question's normalized text and options (question_dedup.py).
+    # duplicate_of is the original this question nearly duplicates; None for originals.
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), primary_key=True, autoincrement=False)
+    trivia_set_id = db.Column(db.Integer, nullable=False, index=True)
+    signature = db.Column(db.LargeBinary, nullable=False)
+    duplicate_of = db.Column(db.Integer, index=True)
+    similarity = db.Column(db.Float)
+
+
+class QuestionBand(db.Model):
+    # LSH buckets, one row per band of each original's signature: questions sharing a
+    # band_key are candidate duplicates. The second index serves deletes by question.
+    __table_args__ = (db.Index('ix_question_band_question_id', 'question_id'),)
+
+    band_key = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    question_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
@@ -0,0 +1,151 @@
+# passwords.py
+import hmac
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+# Hashes are werkzeug's "method$salt$hash" strings, so the cost is stored with every
+# hash and a changed PASSWORD_HASH_METHOD is picked up by rehashing on the next login.
+# Accounts created before hashing hold the plain password; those still verify (in
+# constant time) and are upgraded the same way.
+HASH_PREFIXES = ('scrypt:', 'pbkdf2:')
+
+
+def is_hashed(stored):
+    return stored.startswith(HASH_PREFIXES) and stored.count('$') == 2
+
+
+def hash_method(stored):
+    return stored.split('$', 1)[0] if is_hashed(stored) else None
+
+
+class HasherBusy(Exception):
+    # More hashing work is waiting than the pool accepts
+    pass
+
+
+class PasswordHasher:
+    # Runs hashing on a small bounded pool. Hashing is CPU bound and a login costs tens
+    # of milliseconds on purpose; with the pool, at most max_workers hashes run at once
+    # whatever the number of request threads, so a burst of logins can't take every
+    # core from play traffic. Up to max_pending more wait their turn, beyond that
+    # callers get HasherBusy straight away instead of queueing without bound.
+    def __init__(self, method='scrypt:32768:8:1', max_workers=2, max_pending=32, timeout=10):
+        self.method = method
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.rejected = 0
+        self.rehashed = 0
+        self._pool = None
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._dummy = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.method = app.config.get('PASSWORD_HASH_METHOD', self.method)
+        self.max_workers = app.config.get('PASSWORD_HASH_WORKERS', self.max_workers)
+        self.max_pending = app.config.get('PASSWORD_HASH_QUEUE', self.max_pending)
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_pending)
+        self._pool = None
+        self._dummy = None
+
+    def _executor(self):
+        # Created on first use so each forked worker gets its own threads
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='password-hash')
+        return self._pool
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HasherBusy()
+        try:
+            return self._executor().submit(fn, *args).result(timeout=self.timeout)
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, stored, password):
+        # Returns (matches, needs_rehash). stored=None still does the work of a real
+        # check so a missing account takes as long as a wrong password.
+        if stored is None:
+            if self._dummy is None:
+                self._dummy = generate_password_hash('', self.method)
+            self._run(check_password_hash, self._dummy, password)
+            return False, False
+        if not is_hashed(stored):
+            return hmac.compare_digest(stored.encode(), password.encode()), True
+        matches = self._run(check_password_hash, stored, password)
+        return matches, matches and hash_method(stored) != self.method
+
+    def stats(self):
+        return {'method': self.method, 'workers': self.max_workers, 'rejected': self.rejected,
+                'rehashed': self.rehashed}
+
+
+class RateLimiter:
+    # Generic cell rate algorithm: `limit` attempts per `period` seconds per key, with
+    # bursts up to `limit`. The whole state of a key is one float, the time at which
+    # its allowance is fully restored, so a few hundred thousand keys fit in a few MB.
+    # Keys whose time has passed carry no information and are swept once the table
+    # reaches max_keys.
+    def __init__(self, limit, period, max_keys=100000):
+        self.limit = limit
+        self.period = period
+        self.max_keys = max_keys
+        self.limited = 0
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    @property
+    def interval(self):
+        return self.period / self.limit
+
+    def retry_after(self, key, now=None):
+        # Seconds until key may try again, 0 if it may now. Doesn't count an attempt.
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            restored_at = self._keys.get(key, now)
+        return max(0.0, restored_at - now - self.period + self.interval)
+
+    def hit(self, key, now=None):
+        # Counts an attempt; returns 0 if it was allowed, otherwise the seconds to wait
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            restored_at = max(self._keys.get(key, now), now)
+            wait = restored_at - now - self.period + self.interval
+            if wait > 0:
+                self.limited += 1
+                return wait
+            if key not in self._keys and len(self._keys) >= self.max_keys:
+                self._sweep(now)
+            self._keys[key] = restored_at + self.interval
+            return 0.0
+
+    def reset(self, key):
+        with self._lock:
+            self._keys.pop(key, None)
+
+    def _sweep(self, now):
+        for key in [key for key, restored_at in self._keys.items() if restored_at <= now]:
+            del self._keys[key]
+        # Still full of live keys: forget the earliest added tenth rather than sweeping
+        # again on every new key
+        if len(self._keys) >= self.max_keys:
+            for key in list(itertools.islice(self._keys, max(1, self.max_keys // 10))):
+                del self._keys[key]
+
+    def __len__(self):
+        return len(self._keys)
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,260 @@
+# question_dedup.py
+import hashlib
+import unicodedata
+from collections import namedtuple
+from itertools import groupby
+
+import numpy as np
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import aliased
+
+from models import db, Question, Option, QuestionSignature, QuestionBand
+from set_similarity import feature_hash, words
+
+
+# Near-duplicate questions, found with MinHash and locality sensitive hashing. A
+# question is the set of words and word pairs of its normalized text plus its
+# normalized options; NUM_PERM hash minimums estimate the Jaccard similarity of two
+# such sets. Signatures are cut into BANDS bands of ROWS values, and any two questions
+# with an identical band are candidates, so a new question is only compared with the
+# few questions sharing one of its band keys instead of with every question. Only
+# originals are banded, so a question copied a thousand times is still one candidate. With
+# 16 bands of 4, pairs above ~0.5 similarity are very likely to become candidates;
+# candidates at or above the threshold (0.8 by default) are flagged.
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+PRIME = 4294967291              # largest prime below 2**32
+INDEX_CHUNK = 500               # sets per pass
+KEY_CHUNK = 5000                # band keys per lookup
+
+# Fixed seed: signatures stored by one process are compared in every other
+_permutations = np.random.RandomState(20231023)
+PERM_A = _permutations.randint(1, 2 ** 32 - 1, NUM_PERM, dtype=np.uint64)[:, np.newaxis]
+PERM_B = _permutations.randint(0, 2 ** 32 - 1, NUM_PERM, dtype=np.uint64)[:, np.newaxis]
+
+DuplicateReport = namedtuple('DuplicateReport', ['indexed', 'duplicates', 'originals', 'question_bytes',
+                                                 'options', 'option_bytes'])
+
+
+def normalize(text):
+    # Case, accents, punctuation and filler words don't make a question different
+    text = unicodedata.normalize('NFKD', text or '')
+    return ' '.join(words(''.join(char for char in text if not unicodedata.combining(char))))
+
+
+def shingles(question_text, options):
+    text_words = normalize(question_text).split()
+    features = {'q:' + word for word in text_words}
+    features.update('q:' + ' '.join(pair) for pair in zip(text_words, text_words[1:]))
+    features.update('o:' + normalize(option) for option in options)
+    if not text_words:
+        features.add('q:' + (question_text or '').strip().lower())
+    return features
+
+
+def signature(features):
+    # min over features of (a * x + b) mod PRIME, for each of the NUM_PERM (a, b)
+    hashes = np.fromiter((feature_hash(feature) & 0xffffffff for feature in features), np.uint64, len(features))
+    return ((PERM_A * hashes + PERM_B) % np.uint64(PRIME)).min(axis=1).astype(np.uint32)
+
+
+def band_keys(signature):
+    # Band number in the top bits so equal bands in different positions don't match
+    keys = []
+    for band in range(BANDS):
+        digest = hashlib.blake2b(signature[band * ROWS:(band + 1) * ROWS].tobytes(), digest_size=6).digest()
+        keys.append((band << 48) | int.from_bytes(digest, 'little'))
+    return keys
+
+
+def similarity(signature, other):
+    return float(np.count_nonzero(signature == other)) / NUM_PERM
+
+
+def _questions(set_ids):
+    # (question id, set id, text, [option texts]) in question id order, one query
+    rows = db.session.execute(
+        select(Question.id, Question.trivia_set_id, Question.question_text, Option.text)
+        .outerjoin(Option, Option.question_id == Question.id)
+        .where(Question.trivia_set_id.in_(set_ids))
+        .order_by(Question.id)
+    )
+    for (question_id, set_id, question_text), options in groupby(rows, key=lambda row: row[:3]):
+        yield question_id, set_id, question_text, [row[3] for row in options if row[3] is not None]
+
+
+def forget_sets(set_ids):
+    # Drops the signatures of the sets' questions; doesn't commit
+    _forget(lambda signatures: signatures.trivia_set_id.in_(set_ids))
+
+
+def forget_questions(question_ids):
+    # Same for single questions, e.g. orphans removed by compaction; returns how many
+    # signatures went
+    return _forget(lambda signatures: signatures.question_id.in_(question_ids))
+
+
+def _forget(condition):
+    # Only originals have band keys, so a duplicate whose original goes is promoted:
+    # per original, its oldest remaining duplicate takes its place and the others are
+    # re-pointed at that one. `condition` picks rows of the QuestionSignature alias given.
+    gone = aliased(QuestionSignature)
+    gone_ids = select(gone.question_id).where(condition(gone))
+    orphans = db.session.execute(
+        select(QuestionSignature.duplicate_of, QuestionSignature.question_id, QuestionSignature.signature)
+        .where(QuestionSignature.duplicate_of.in_(gone_ids), ~condition(QuestionSignature))
+        .order_by(QuestionSignature.duplicate_of, QuestionSignature.question_id)
+    ).all()
+    db.session.execute(delete(QuestionBand).where(QuestionBand.question_id.in_(gone_ids))
+                       .execution_options(synchronize_session=False))
+    removed = db.session.execute(delete(QuestionSignature).where(QuestionSignature.question_id.in_(gone_ids))
+                                 .execution_options(synchronize_session=False)).rowcount
+
+    updates, band_rows = [], []
+    for _, group in groupby(orphans, key=lambda row: row[0]):
+        (_, original, stored), *rest = group
+        original_signature = np.frombuffer(stored, np.uint32)
+        updates.append({'question_id': original, 'duplicate_of': None, 'similarity': None})
+        band_rows.extend({'band_key': key, 'question_id': original} for key in band_keys(original_signature))
+        updates.extend({'question_id': question_id, 'duplicate_of': original,
+                        'similarity': similarity(np.frombuffer(other, np.uint32), original_signature)}
+                       for _, question_id, other in rest)
+    if updates:
+        db.session.execute(update(QuestionSignature), updates)
+        db.session.execute(insert(QuestionBand), band_rows)
+    return removed
+
+
+def index_questions(set_ids, threshold=0.8):
+    # (Re)computes the signatures of the sets' questions after they were created or
+    # edited, and flags each question that is a near duplicate of an indexed one.
+    # Returns the number of questions flagged.
+    set_ids = list(set_ids)
+    flagged = 0
+    for start in range(0, len(set_ids), INDEX_CHUNK):
+        chunk = set_ids[start:start + INDEX_CHUNK]
+        forget_sets(chunk)
+        flagged += _index_chunk(list(_questions(chunk)), threshold)
+    db.session.commit()
+    return flagged
+
+
+def _index_chunk(questions, threshold):
+    if not questions:
+        return 0
+    signatures = {question_id: signature(shingles(text, options)) for question_id, _, text, options in questions}
+    keys = {question_id: band_keys(question_signature) for question_id, question_signature in signatures.items()}
+
+    # Every original already indexed that shares a band with this chunk, in two queries
+    buckets = {}
+    all_keys = sorted({key for question_keys in keys.values() for key in question_keys})
+    for start in range(0, len(all_keys), KEY_CHUNK):
+        for band_key, question_id in db.session.execute(
+            select(QuestionBand.band_key, QuestionBand.question_id)
+            .where(QuestionBand.band_key.in_(all_keys[start:start + KEY_CHUNK]))
+        ):
+            buckets.setdefault(band_key, []).append(question_id)
+    known = {}
+    candidates = sorted({question_id for bucket in buckets.values() for question_id in bucket})
+    for start in range(0, len(candidates), KEY_CHUNK):
+        for question_id, stored in db.session.execute(
+            select(QuestionSignature.question_id, QuestionSignature.signature)
+            .where(QuestionSignature.question_id.in_(candidates[start:start + KEY_CHUNK]))
+        ):
+            known[question_id] = np.frombuffer(stored, np.uint32)
+
+    signature_rows, band_rows = [], []
+    flagged = 0
+    for question_id, set_id, _, _ in questions:
+        question_signature = signatures[question_id]
+        best, best_similarity = None, 0.0
+        for candidate in sorted({other for key in keys[question_id] for other in buckets.get(key, ())}):
+            if candidate not in known or candidate == question_id:
+                continue
+            score = similarity(question_signature, known[candidate])
+            if score > best_similarity:
+                best, best_similarity = candidate, score
+        duplicate_of = best if best_similarity >= threshold else None
+        flagged += duplicate_of is not None
+
+        signature_rows.append({'question_id': question_id, 'trivia_set_id': set_id,
+                               'signature': question_signature.tobytes(), 'duplicate_of': duplicate_of,
+                               'similarity': best_similarity if duplicate_of else None})
+        if duplicate_of is None:
+            band_rows.extend({'band_key': key, 'question_id': question_id} for key in keys[question_id])
+            # Later questions of this chunk are compared with this one as well
+            known[question_id] = question_signature
+            for key in keys[question_id]:
+                buckets.setdefault(key, []).append(question_id)
+
+    db.session.execute(insert(QuestionSignature), signature_rows)
+    if band_rows:
+        db.session.execute(insert(QuestionBand), band_rows)
+    return flagged
+
+
+def clear_signatures():
+    # Doesn't commit
+    db.session.execute(delete(QuestionBand))
+    db.session.execute(delete(QuestionSignature))
+
+
+def unindexed_set_ids():
+    # Sets with questions that have no signature yet, e.g. created before this existed
+    return list(db.session.scalars(
+        select(Question.trivia_set_id)
+        .outerjoin(QuestionSignature, QuestionSignature.question_id == Question.id)
+        .where(QuestionSignature.question_id.is_(None))
+        .distinct()
+        .order_by(Question.trivia_set_id)
+    ))
+
+
+def prune_signatures():
+    # Signatures of questions that no longer exist; returns how many were removed
+    removed = _forget(lambda signatures: ~signatures.question_id.in_(select(Question.id)))
+    db.session.commit()
+    return removed
+
+
+def duplicate_report():
+    # What removing the flagged questions and their options would save, in rows and text
+    duplicates = select(QuestionSignature.question_id).where(QuestionSignature.duplicate_of.is_not(None))
+    indexed, flagged, originals = db.session.execute(
+        select(func.count(), func.count(QuestionSignature.duplicate_of),
+               func.count(QuestionSignature.duplicate_of.distinct()))
+    ).one()
+    question_bytes = db.session.scalar(
+        select(func.coalesce(func.sum(func.length(Question.question_text)), 0)).where(Question.id.in_(duplicates))
+    )
+    options, option_bytes = db.session.execute(
+        select(func.count(), func.coalesce(func.sum(func.length(Option.text)), 0))
+        .where(Option.question_id.in_(duplicates))
+    ).one()
+    return DuplicateReport(indexed, flagged, originals, question_bytes, options, option_bytes)
+
+
+def duplicates_within_sets():
+    # Flagged questions whose original is in the same set: {set id: [question ids]}
+    original = aliased(QuestionSignature)
+    rows = db.session.execute(
+        select(QuestionSignature.trivia_set_id, QuestionSignature.question_id)
+        .join(original, original.question_id == QuestionSignature.duplicate_of)
+        .where(original.trivia_set_id == QuestionSignature.trivia_set_id)
+        .order_by(QuestionSignature.trivia_set_id)
+    )
+    return {set_id: [row[1] for row in group] for set_id, group in groupby(rows, key=lambda row: row[0])}
+
+
+def merge_within_sets():
+    # Deletes questions repeated inside their own set, with their options. Copies in
+    # different sets stay: each set owns its questions and is edited on its own.
+    # Returns {set id: [deleted question ids]}; doesn't commit.
+    repeated = duplicates_within_sets()
+    question_ids = [question_id for ids in repeated.values() for question_id in ids]
+    for start in range(0, len(question_ids), KEY_CHUNK):
+        chunk = question_ids[start:start + KEY_CHUNK]
+        for column in (QuestionBand.question_id, QuestionSignature.question_id, Option.question_id, Question.id):
+            db.session.execute(delete(column.class_).where(column.in_(chunk)).execution_options(synchronize_session=False))
+    return repeated
@@ -0,0 +1,194 @@
+# score_writer.py
+import atexit
+import os
+import queue
+import threading
+import time
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from leaderboards import refresh_user_totals
+from models import db, UserScore
+
+
+def upsert_scores(latest):
+    # (user_id, trivia_set_id) -> score, inserted or updated in place on the unique
+    # (user_id, trivia_set_id) index, so two first scores for the same user and set
+    # can't both try to insert. The players' totals are rewritten in the same
+    # transaction. Not committed.
+    insert = postgresql_insert if db.engine.dialect.name == 'postgresql' else sqlite_insert
+    statement = insert(UserScore)
+    db.session.execute(
+        statement.on_conflict_do_update(index_elements=['user_id', 'trivia_set_id'],
+                                        set_={'score': statement.excluded.score}),
+        [{'user_id': user_id, 'trivia_set_id': trivia_set_id, 'score': score}
+         for (user_id, trivia_set_id), score in latest.items()],
+    )
+    refresh_user_totals(user_id for user_id, _ in latest)
+
+
+class ScoreWriter:
+    # Optional write-behind for UserScore. Requests put (user, set, score) on a
+    # bounded queue and return; one background thread collects whatever arrives
+    # within flush_interval (up to batch_size records), keeps the last score per
+    # user and set, and upserts the batch in a single transaction.
+    # submit() returns False when the queue stays full for put_timeout seconds,
+    # the caller is then expected to write synchronously (backpressure). Scores of a
+    # batch whose transaction fails are logged and counted in `failed`.
+    def __init__(self, max_queue=10000, batch_size=500, flush_interval=0.005, put_timeout=0.05):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.on_written = None
+        self.batches = 0
+        self.written = 0
+        self.rejected = 0
+        self.failed = 0
+        self._app = None
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stopping = False
+
+    def init_app(self, app, on_written=None):
+        # on_written(batch) runs in the writer thread after each commit, with
+        # batch a list of (user_id, trivia_set_id, score, previous score or None)
+        self._app = app
+        self.on_written = on_written
+        self.max_queue = app.config.get('SCORE_WRITE_QUEUE_SIZE', self.max_queue)
+        self.batch_size = app.config.get('SCORE_WRITE_BATCH_SIZE', self.batch_size)
+        self.flush_interval = app.config.get('SCORE_WRITE_FLUSH_INTERVAL', self.flush_interval)
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        atexit.register(self.stop)
+
+    def _ensure_started(self):
+        # Started lazily so forked workers each get their own thread
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='score-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, user_id, trivia_set_id, score):
+        self._ensure_started()
+        with self._lock:
+            self._pending[(user_id, trivia_set_id)] = score
+        try:
+            self._queue.put((user_id, trivia_set_id, score), timeout=self.put_timeout)
+        except queue.Full:
+            with self._lock:
+                if self._pending.get((user_id, trivia_set_id)) == score:
+                    del self._pending[(user_id, trivia_set_id)]
+            self.rejected += 1
+            return False
+        return True
+
+    def pending(self, user_id, trivia_set_id):
+        # Score accepted but not committed yet, so a redirect can show it right away
+        with self._lock:
+            return self._pending.get((user_id, trivia_set_id))
+
+    def write(self, records):
+        # Synchronous batched upsert of (user_id, trivia_set_id, score) records, for
+        # callers that have many scores at once (a finished live round)
+        records = list(records)
+        for start in range(0, len(records), self.batch_size):
+            self._write(records[start:start + self.batch_size])
+
+    def flush(self):
+        # Block until everything queued so far is committed
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+
+    def stop(self):
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self.flush()
+        self._stopping = True
+        self._thread.join(timeout=5)
+
+    def _run(self):
+        while not self._stopping:
+            try:
+                first = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            records = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(records) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    records.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                self._write(records)
+            except Exception:
+                if self._app is not None:
+                    self._app.logger.exception('Failed to write %d queued scores', len(records))
+            finally:
+                for _ in records:
+                    self._queue.task_done()
+
+    def _write(self, records):
+        # Last score per user and set wins, like record_score
+        latest = {}
+        for user_id, trivia_set_id, score in records:
+            latest[(user_id, trivia_set_id)] = score
+
+        try:
+            with self._app.app_context():
+                try:
+                    previous = dict(
+                        ((user_id, trivia_set_id), score) for user_id, trivia_set_id, score in db.session.execute(
+                            select(UserScore.user_id, UserScore.trivia_set_id, UserScore.score)
+                            .where(tuple_(UserScore.user_id, UserScore.trivia_set_id).in_(list(latest)))
+                        )
+                    )
+                    upsert_scores(latest)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    self.failed += len(latest)
+                    raise
+
+                batch = [(user_id, trivia_set_id, score, previous.get((user_id, trivia_set_id)))
+                         for (user_id, trivia_set_id), score in latest.items()]
+                if self.on_written is not None:
+                    self.on_written(batch)
+                db.session.remove()
+        finally:
+            # Written or lost, these scores are no longer pending; a newer score
+            # submitted meanwhile for the same user and set stays
+            with self._lock:
+                for key, score in latest.items():
+                    if self._pending.get(key) == score:
+                        del self._pending[key]
+        self.batches += 1
+        self.written += len(latest)
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'pending': len(self._pending),
+            'batches': self.batches,
+            'written': self.written,
+            'rejected': self.rejected,
+            'failed': self.failed,
+        }
+
+
+score_writer = ScoreWriter()
@@ -0,0 +1,134 @@
+# scoring.py
+import sys
+from array import array
+from bisect import bisect_left
+
+from sqlalchemy import case, select
+
+from answer_matching import MAX_ANSWER_LENGTH, AnswerMatcher
+from local_cache import BoundedLRUCache
+from models import db, TriviaSet, Question, Option
+
+
+# Answer keys
+#--------------------------------------------------------------------------------------
+class AnswerKey:
+    # Compiled, read-only answer key for one trivia set.
+    # Three parallel arrays sorted by option id: the option, the question it belongs
+    # to and whether it is correct. Options from other sets or other questions are
+    # rejected because their (question, option) pair isn't in the key.
+    # Open-ended questions are graded by an AnswerMatcher over their accepted answers
+    # instead; the answer is text there, and option ids don't count.
+    __slots__ = ('trivia_set_id', 'option_ids', 'question_ids', 'correct', 'matchers')
+
+    def __init__(self, trivia_set_id, rows, accepted=None):
+        # accepted: question id -> accepted answer texts, for open-ended questions
+        rows = sorted(rows, key=lambda row: row[1])
+        self.trivia_set_id = trivia_set_id
+        self.option_ids = array('q', (option_id for _, option_id, _ in rows))
+        self.question_ids = array('q', (question_id for question_id, _, _ in rows))
+        self.correct = bytes(bool(is_correct) for _, _, is_correct in rows)
+        self.matchers = {question_id: AnswerMatcher(texts) for question_id, texts in (accepted or {}).items()}
+
+    def is_correct(self, question_id, option_id):
+        matcher = self.matchers.get(question_id)
+        if matcher is not None:
+            return matcher.matches(option_id)
+        if not isinstance(option_id, int):
+            return False
+        index = bisect_left(self.option_ids, option_id)
+        return (index < len(self.option_ids)
+                and self.option_ids[index] == option_id
+                and self.question_ids[index] == question_id
+                and self.correct[index] == 1)
+
+    def score(self, answers):
+        # answers maps question id -> selected option id (or typed answer), one answer
+        # per question
+        return sum(1 for question_id, option_id in answers.items()
+                   if self.is_correct(question_id, option_id))
+
+    def grade(self, answers):
+        # question id -> whether the answer is right, for a whole submission at once
+        return {question_id: self.is_correct(question_id, option_id) for question_id, option_id in answers.items()}
+
+    def correct_options(self):
+        # question id -> correct option id
+        return {question_id: option_id
+                for option_id, question_id, is_correct in zip(self.option_ids, self.question_ids, self.correct)
+                if is_correct}
+
+    def accepted_answer(self, question_id):
+        # Shown once an open-ended question is answered; None for the others
+        matcher = self.matchers.get(question_id)
+        return matcher.answer if matcher is not None else None
+
+    @property
+    def nbytes(self):
+        return (sys.getsizeof(self) + sys.getsizeof(self.option_ids)
+                + sys.getsizeof(self.question_ids) + sys.getsizeof(self.correct) + sys.getsizeof(self.matchers)
+                + sum(matcher.nbytes for matcher in self.matchers.values()))
+
+
+def load_answer_key(trivia_set_id):
+    # One query for the whole set. The outer joins keep a row for sets without
+    # questions, so "no rows" means the set doesn't exist. Option text is only read
+    # for the accepted answers of open-ended questions.
+    rows = db.session.execute(
+        select(Option.question_id, Option.id, Option.is_correct,
+               case((Question.question_type == 'open_ended', Option.text)).label('accepted'))
+        .select_from(TriviaSet)
+        .outerjoin(Question, Question.trivia_set_id == TriviaSet.id)
+        .outerjoin(Option, Option.question_id == Question.id)
+        .where(TriviaSet.id == trivia_set_id)
+    ).all()
+    if not rows:
+        return None
+    accepted = {}
+    for row in rows:
+        if row.accepted is not None and row.is_correct:
+            accepted.setdefault(row.question_id, []).append(row.accepted)
+    return AnswerKey(trivia_set_id, [row[:3] for row in rows if row.id is not None], accepted)
+
+
+answer_key_cache = BoundedLRUCache(sizeof=lambda answer_key: answer_key.nbytes)
+
+
+def get_answer_key(trivia_set_id):
+    return answer_key_cache.get_or_load(trivia_set_id, lambda: load_answer_key(trivia_set_id))
+
+
+def invalidate_answer_key(trivia_set_id):
+    answer_key_cache.invalidate(trivia_set_id)
+
+
+# Submissions
+#--------------------------------------------------------------------------------------
+def parse_answers(form, prefix=''):
+    # Turn submitted fields ("<prefix><question id>" -> "<option id>") into ints,
+    # silently dropping anything that isn't a question/option pair. Other non-empty
+    # values are kept as text, the typed answers to open-ended questions.
+    answers = {}
+    for name, value in form.items():
+        name = str(name)
+        if prefix:
+            if not name.startswith(prefix):
+                continue
+            name = name[len(prefix):]
+        try:
+            question_id = int(name)
+        except (TypeError, ValueError):
+            continue
+        try:
+            answers[question_id] = int(value)
+        except (TypeError, ValueError):
+            if isinstance(value, str) and value.strip():
+                answers[question_id] = value.strip()[:MAX_ANSWER_LENGTH]
+    return answers
+
+
+def score_submission(trivia_set_id, answers):
+    answer_key = get_answer_key(trivia_set_id)
+    if answer_key is None:
+        return 0
+    return answer_key.score(answers)
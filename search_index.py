@@ -0,0 +1,210 @@
+# search_index.py
+import re
+from collections import namedtuple
+
+from sqlalchemy import or_, select, text
+
+from models import db, TriviaSet
+
+
+# SQLite FTS5 index over set title, category, difficulty and question text.
+# rowid is TriviaSet.id. Other databases fall back to ILIKE filtering.
+SEARCH_TABLE = 'trivia_set_search'
+
+# bm25 column weights: title, category, difficulty, questions
+RANK_WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+
+_CHUNK = 500
+
+# What a results page shows of each set; version feeds the page's ETag
+SearchResult = namedtuple('SearchResult', ['id', 'set_title', 'category', 'difficulty', 'version'])
+RESULT_COLUMNS = (TriviaSet.id, TriviaSet.set_title, TriviaSet.category, TriviaSet.difficulty, TriviaSet.version)
+
+_index_ready = False
+
+
+def is_search_table(name):
+    # FTS5 keeps its data in shadow tables named after the virtual table
+    return name == SEARCH_TABLE or name.startswith(SEARCH_TABLE + '_')
+
+
+def fts_enabled():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def ensure_search_index():
+    # Created lazily once per process; a freshly created index is filled from the tables
+    global _index_ready
+    if _index_ready or not fts_enabled():
+        return
+    exists = db.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': SEARCH_TABLE}
+    ).first()
+    if not exists:
+        db.session.execute(text(
+            f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+            "set_title, category, difficulty, questions, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        ))
+        _fill(None)
+        db.session.commit()
+    _index_ready = True
+
+
+def _fill(set_ids):
+    # Questions are folded into one column per set. Grouping them in one pass keeps
+    # a full rebuild linear instead of one question lookup per set.
+    id_filter = ''
+    params = {}
+    if set_ids is not None:
+        id_filter = 'WHERE {column} IN (SELECT value FROM json_each(:ids))'
+        params['ids'] = _json_ids(set_ids)
+    db.session.execute(text(
+        f"INSERT INTO {SEARCH_TABLE} (rowid, set_title, category, difficulty, questions) "
+        "SELECT t.id, t.set_title, t.category, t.difficulty, COALESCE(q.questions, '') "
+        "FROM trivia_set t LEFT JOIN ("
+        "  SELECT trivia_set_id, group_concat(question_text, ' ') AS questions FROM question "
+        f"  {id_filter.format(column='trivia_set_id')} GROUP BY trivia_set_id"
+        f") q ON q.trivia_set_id = t.id {id_filter.format(column='t.id')}"
+    ), params)
+
+
+def _json_ids(set_ids):
+    return '[' + ','.join(str(int(set_id)) for set_id in set_ids) + ']'
+
+
+def index_trivia_sets(set_ids):
+    # (Re)index the given sets after they were created or edited
+    set_ids = list(set_ids)
+    if not set_ids or not fts_enabled():
+        return
+    ensure_search_index()
+    for start in range(0, len(set_ids), _CHUNK):
+        chunk = set_ids[start:start + _CHUNK]
+        _delete(chunk)
+        _fill(chunk)
+    db.session.commit()
+
+
+def remove_trivia_sets(set_ids):
+    set_ids = list(set_ids)
+    if not set_ids or not fts_enabled():
+        return
+    ensure_search_index()
+    for start in range(0, len(set_ids), _CHUNK):
+        _delete(set_ids[start:start + _CHUNK])
+    db.session.commit()
+
+
+def prune_search_index():
+    # Drops entries whose set no longer exists; returns how many were removed
+    if not fts_enabled():
+        return 0
+    ensure_search_index()
+    removed = db.session.execute(text(
+        f"DELETE FROM {SEARCH_TABLE} WHERE rowid NOT IN (SELECT id FROM trivia_set)"
+    )).rowcount
+    db.session.commit()
+    return removed
+
+
+def _delete(set_ids):
+    db.session.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN (SELECT value FROM json_each(:ids))"),
+                       {'ids': _json_ids(set_ids)})
+
+
+def rebuild_search_index():
+    if not fts_enabled():
+        return
+    ensure_search_index()
+    db.session.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+    _fill(None)
+    db.session.execute(text(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')"))
+    db.session.commit()
+
+
+# Queries
+#--------------------------------------------------------------------------------------
+def match_expression(search_term):
+    # Every word has to match, the last one as a prefix so results show up while typing.
+    # Words are quoted so user input can't inject FTS5 syntax.
+    words = re.findall(r'\w+', search_term.lower())
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def encode_cursor(rank, set_id):
+    return f'{rank!r}:{set_id}'
+
+
+def decode_cursor(cursor):
+    try:
+        rank, set_id = cursor.rsplit(':', 1)
+        return float(rank), int(set_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def search_trivia_sets(search_term, limit=20, after=None):
+    # Returns (SearchResults in rank order, cursor for the next page or None).
+    # Pages are keyset-paginated on (rank, id) so deep pages cost the same as the first.
+    search_term = (search_term or '').strip()
+    if not search_term:
+        return [], None
+    if not fts_enabled():
+        return _search_ilike(search_term, limit, after)
+
+    expression = match_expression(search_term)
+    if expression is None:
+        return [], None
+    ensure_search_index()
+
+    params = {'expression': expression, 'limit': limit + 1}
+    page_filter = ''
+    cursor = decode_cursor(after)
+    if cursor is not None:
+        params['after_rank'], params['after_id'] = cursor
+        page_filter = 'WHERE relevance > :after_rank OR (relevance = :after_rank AND id > :after_id)'
+
+    weights = ', '.join(str(weight) for weight in RANK_WEIGHTS)
+    rows = db.session.execute(text(
+        f"SELECT id, relevance FROM ("
+        f"  SELECT rowid AS id, bm25({SEARCH_TABLE}, {weights}) AS relevance"
+        f"  FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :expression"
+        f") {page_filter} ORDER BY relevance, id LIMIT :limit"
+    ), params).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].relevance, rows[-1].id)
+
+    return _load_in_order([row.id for row in rows]), next_cursor
+
+
+def _search_ilike(search_term, limit, after):
+    # Unranked fallback for databases without FTS5, keyset-paginated on id
+    query = select(*RESULT_COLUMNS).where(or_(
+        TriviaSet.set_title.ilike(f"%{search_term}%"), TriviaSet.category.ilike(f"%{search_term}%")
+    ))
+    cursor = decode_cursor(after)
+    if cursor is not None:
+        query = query.where(TriviaSet.id > cursor[1])
+    trivia_sets = [SearchResult(*row) for row in db.session.execute(query.order_by(TriviaSet.id).limit(limit + 1))]
+
+    next_cursor = None
+    if len(trivia_sets) > limit:
+        trivia_sets = trivia_sets[:limit]
+        next_cursor = encode_cursor(0.0, trivia_sets[-1].id)
+    return trivia_sets, next_cursor
+
+
+def _load_in_order(set_ids):
+    if not set_ids:
+        return []
+    trivia_sets = {row.id: SearchResult(*row)
+                   for row in db.session.execute(select(*RESULT_COLUMNS).where(TriviaSet.id.in_(set_ids)))}
+    return [trivia_sets[set_id] for set_id in set_ids if set_id in trivia_sets]
@@ -0,0 +1,54 @@
+# session_users.py
+import sys
+
+from flask_login import UserMixin
+from sqlalchemy import select
+
+from local_cache import BoundedLRUCache
+from models import db, User
+
+
+class SessionUser(UserMixin):
+    # What a request needs to know about the logged-in user, without the password or
+    # a live ORM instance. Code that has to change the user loads the model itself.
+    __slots__ = ('id', 'username', 'email', 'active')
+
+    def __init__(self, id, username, email, active):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.active = active
+
+    @property
+    def is_active(self):
+        return self.active
+
+
+def load_session_user(user_id):
+    row = db.session.execute(
+        select(User.id, User.username, User.email, User.is_active).where(User.id == user_id)
+    ).first()
+    return SessionUser(*row) if row is not None else None
+
+
+def session_user_nbytes(user):
+    return sys.getsizeof(user) + sys.getsizeof(user.username) + sys.getsizeof(user.email)
+
+
+# Slim user records for the login manager, per worker. Changes made in this worker
+# invalidate them right away; the TTL bounds how long a change made by another worker
+# (or a deactivation) takes to be seen.
+session_user_cache = BoundedLRUCache(max_entries=10000, max_bytes=4 * 1024 * 1024, sizeof=session_user_nbytes,
+                                     ttl=30)
+
+
+def get_session_user(user_id):
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    return session_user_cache.get_or_load(user_id, lambda: load_session_user(user_id))
+
+
+def invalidate_session_user(user_id):
+    session_user_cache.invalidate(int(user_id))
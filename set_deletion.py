@@ -0,0 +1,212 @@
+# set_deletion.py
+import os
+import threading
+import time
+from collections import namedtuple
+
+from sqlalchemy import delete, select, text
+
+from leaderboards import refresh_user_totals
+from models import db, TriviaSet, Question, Option, UserScore, QuestionSignature
+from question_dedup import forget_questions, forget_sets
+
+
+# Sets are deleted with explicit set-based DELETEs, children first (options, questions,
+# scores, then the sets), rather than ON DELETE CASCADE: SQLite only honours cascades with
+# PRAGMA foreign_keys on, and existing databases were created without them.
+DELETE_CHUNK = 500
+
+DeletedSets = namedtuple('DeletedSets', ['set_ids', 'user_ids', 'questions', 'options', 'scores'])
+Compaction = namedtuple('Compaction', ['options', 'questions', 'scores', 'signatures'], defaults=(0,))
+
+
+def set_ids_for(user_id=None, category=None):
+    query = select(TriviaSet.id).order_by(TriviaSet.id)
+    if user_id is not None:
+        query = query.where(TriviaSet.user_id == user_id)
+    if category is not None:
+        query = query.where(TriviaSet.category == category)
+    return list(db.session.scalars(query))
+
+
+def delete_trivia_sets(set_ids, chunk_size=DELETE_CHUNK):
+    # Deletes the sets and everything hanging off them in one transaction, a chunk of
+    # sets per statement. user_ids are the players whose scores were removed, so their
+    # cached top scores can be dropped.
+    set_ids = list(set_ids)
+    user_ids = set()
+    questions = options = scores = 0
+    try:
+        for start in range(0, len(set_ids), chunk_size):
+            chunk = set_ids[start:start + chunk_size]
+            set_questions = select(Question.id).where(Question.trivia_set_id.in_(chunk))
+            user_ids.update(db.session.scalars(
+                select(UserScore.user_id).where(UserScore.trivia_set_id.in_(chunk)).distinct()
+            ))
+            forget_sets(chunk)
+            options += db.session.execute(
+                delete(Option).where(Option.question_id.in_(set_questions)).execution_options(synchronize_session=False)
+            ).rowcount
+            questions += db.session.execute(
+                delete(Question).where(Question.trivia_set_id.in_(chunk)).execution_options(synchronize_session=False)
+            ).rowcount
+            scores += db.session.execute(
+                delete(UserScore).where(UserScore.trivia_set_id.in_(chunk)).execution_options(synchronize_session=False)
+            ).rowcount
+            db.session.execute(
+                delete(TriviaSet).where(TriviaSet.id.in_(chunk)).execution_options(synchronize_session=False)
+            )
+        refresh_user_totals(user_ids)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    # Anything of these sets still held by the session is gone from the database
+    db.session.expire_all()
+    return DeletedSets(set_ids, sorted(user_ids), questions, options, scores)
+
+
+# Compaction
+#--------------------------------------------------------------------------------------
+# Rows orphaned by the old one-question-at-a-time delete: options whose question is gone,
+# questions whose set is gone and scores for deleted sets. Removed in small batches, each
+# its own transaction, so a large cleanup never holds the write lock for long. Removed
+# questions take their duplicate signatures with them.
+def _orphans(model, parent_column, parent_model, limit):
+    return (select(model.id)
+            .outerjoin(parent_model, parent_column == parent_model.id)
+            .where(parent_model.id.is_(None))
+            .limit(limit))
+
+
+def count_orphans():
+    def count(query):
+        return db.session.execute(select(db.func.count()).select_from(query.subquery())).scalar()
+    # Options of orphaned questions are counted too, compact() removes them as well
+    options = (select(Option.id)
+               .outerjoin(Question, Option.question_id == Question.id)
+               .outerjoin(TriviaSet, Question.trivia_set_id == TriviaSet.id)
+               .where((Question.id.is_(None)) | (TriviaSet.id.is_(None))))
+    # Signatures of orphaned questions, and of questions already gone, which compact-db
+    # prunes afterwards
+    live_questions = select(Question.id).join(TriviaSet, Question.trivia_set_id == TriviaSet.id)
+    signatures = select(QuestionSignature.question_id).where(~QuestionSignature.question_id.in_(live_questions))
+    return Compaction(count(options),
+                      count(_orphans(Question, Question.trivia_set_id, TriviaSet, None)),
+                      count(_orphans(UserScore, UserScore.trivia_set_id, TriviaSet, None)),
+                      count(signatures))
+
+
+def compact(batch_size=5000):
+    # Questions go before options so options of orphaned questions are picked up too
+    removed = {'signatures': 0}
+    for name, model, parent_column, parent_model in (
+        ('questions', Question, Question.trivia_set_id, TriviaSet),
+        ('options', Option, Option.question_id, Question),
+        ('scores', UserScore, UserScore.trivia_set_id, TriviaSet),
+    ):
+        removed[name] = 0
+        while True:
+            ids = list(db.session.scalars(_orphans(model, parent_column, parent_model, batch_size)))
+            if not ids:
+                break
+            user_ids = (db.session.scalars(select(UserScore.user_id).where(UserScore.id.in_(ids))).all()
+                        if model is UserScore else ())
+            if model is Question:
+                removed['signatures'] += forget_questions(ids)
+            db.session.execute(delete(model).where(model.id.in_(ids)).execution_options(synchronize_session=False))
+            refresh_user_totals(user_ids)
+            db.session.commit()
+            removed[name] += len(ids)
+    return Compaction(**removed)
+
+
+def vacuum():
+    # Hands freed pages back to the filesystem. VACUUM rewrites the whole file and can't
+    # run inside a transaction, so it is left to the CLI rather than the background job.
+    engine = db.engine
+    if engine.dialect.name == 'sqlite':
+        statement = 'VACUUM'
+    elif engine.dialect.name == 'postgresql':
+        statement = 'VACUUM ANALYZE'
+    else:
+        return False
+    db.session.remove()
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.execute(text(statement))
+    return True
+
+
+class CompactionJob:
+    # Runs compact() every interval seconds on a daemon thread, started lazily from the
+    # first request so each forked worker gets its own. on_compacted(result) is called
+    # after a run that removed something.
+    def __init__(self, interval=0, batch_size=5000):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.runs = 0
+        self.last_run = None
+        self.last_result = None
+        self.on_compacted = None
+        self._app = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def init_app(self, app, on_compacted=None):
+        self._app = app
+        self.on_compacted = on_compacted
+        self.interval = app.config.get('COMPACTION_INTERVAL', self.interval)
+        self.batch_size = app.config.get('COMPACTION_BATCH_SIZE', self.batch_size)
+        if self.interval > 0:
+            app.before_request(self._ensure_started)
+
+    def _ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='set-compaction', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def run_once(self):
+        with self._app.app_context():
+            try:
+                result = compact(self.batch_size)
+            except Exception:
+                db.session.rollback()
+                self._app.logger.exception('Background compaction failed')
+                return None
+            finally:
+                db.session.remove()
+            self.runs += 1
+            self.last_run = time.time()
+            self.last_result = result
+            if any(result):
+                self._app.logger.info('Compaction removed %d options, %d questions, %d scores and %d duplicate '
+                                      'signatures', *result)
+                if self.on_compacted is not None:
+                    self.on_compacted(result)
+        return result
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {
+            'interval': self.interval,
+            'runs': self.runs,
+            'last_run': self.last_run,
+            'last_result': self.last_result._asdict() if self.last_result else None,
+        }
+
+
+compaction_job = CompactionJob()
@@ -0,0 +1,238 @@
+# set_editor.py
+import re
+from collections import namedtuple
+
+from sqlalchemy import delete, insert, select, update
+
+from models import db, TriviaSet, Question, Option, utcnow
+from question_dedup import forget_questions
+from trivia_sets import QUESTION_TYPES
+
+
+# Editable view of a set's questions, unlike the play snapshots it carries is_correct
+EditOption = namedtuple('EditOption', ['id', 'text', 'is_correct'])
+EditQuestion = namedtuple('EditQuestion', ['id', 'question_text', 'question_type', 'options'])
+
+SetEdit = namedtuple('SetEdit', ['updated', 'inserted', 'deleted'])
+
+
+def load_questions(set_id):
+    # Every question and option of the set in one query, in id order
+    rows = db.session.execute(
+        select(Question.id, Question.question_text, Question.question_type,
+               Option.id.label('option_id'), Option.text.label('option_text'), Option.is_correct)
+        .outerjoin(Option, Option.question_id == Question.id)
+        .where(Question.trivia_set_id == set_id)
+        .order_by(Question.id, Option.id)
+    ).all()
+
+    questions = []
+    for row in rows:
+        if not questions or questions[-1].id != row.id:
+            questions.append(EditQuestion(row.id, row.question_text, row.question_type, []))
+        if row.option_id is not None:
+            questions[-1].options.append(EditOption(row.option_id, row.option_text, bool(row.is_correct)))
+    return questions
+
+
+# Edit forms
+#--------------------------------------------------------------------------------------
+# An edit spec is a set spec (see trivia_sets.normalize_set) where questions and options
+# may carry the "id" of the row they replace. Rows without an id are new, existing rows
+# that are not mentioned are deleted. When no question has an id, questions and options
+# are matched to the existing ones by position instead. A spec without "questions"
+# only edits the set's own fields.
+_EDIT_QUESTION_FIELD = re.compile(r'^questions_(\d+)_text$')
+_EDIT_OPTION_FIELD = re.compile(r'^options_(\d+)_(\d+)_text$')
+_UPDATE_QUESTION_FIELD = re.compile(r'^question_(\d+)$')
+
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def edit_from_form(form):
+    # Accepts both the edit page (questions_<i>_text, options_<i>_<j>_text, hidden ids,
+    # correct_option_<i>[] checkboxes) and the older update page (question_<n>,
+    # question_<n>_options[], a 1-based correct_option_<n> radio)
+    spec = {'set_title': form.get('set_title'), 'category': form.get('category'), 'difficulty': form.get('difficulty')}
+
+    question_nums = sorted(int(match.group(1)) for match in map(_EDIT_QUESTION_FIELD.match, form.keys()) if match)
+    if question_nums:
+        option_nums = {}
+        for match in map(_EDIT_OPTION_FIELD.match, form.keys()):
+            if match:
+                option_nums.setdefault(int(match.group(1)), []).append(int(match.group(2)))
+
+        questions = []
+        for question_num in question_nums:
+            if form.get(f'questions_{question_num}_delete'):
+                continue
+            correct = set(form.getlist(f'correct_option_{question_num}[]'))
+            correct.update(form.getlist(f'correct_option_{question_num}'))
+            questions.append({
+                'id': _int_or_none(form.get(f'questions_{question_num}_id')),
+                'question_text': form.get(f'questions_{question_num}_text'),
+                'question_type': form.get(f'questions_{question_num}_type'),
+                'options': [
+                    {
+                        'id': _int_or_none(form.get(f'options_{question_num}_{option_num}_id')),
+                        'text': form.get(f'options_{question_num}_{option_num}_text'),
+                        'is_correct': str(option_num) in correct,
+                    }
+                    for option_num in sorted(option_nums.get(question_num, []))
+                ],
+            })
+        spec['questions'] = questions
+        return spec
+
+    question_nums = sorted(int(match.group(1)) for match in map(_UPDATE_QUESTION_FIELD.match, form.keys()) if match)
+    if not question_nums:
+        return spec
+    spec['questions'] = [
+        {
+            'question_text': form.get(f'question_{question_num}'),
+            'options': [
+                {'text': text, 'is_correct': str(option_num) == form.get(f'correct_option_{question_num}')}
+                for option_num, text in enumerate(form.getlist(f'question_{question_num}_options[]'), start=1)
+            ],
+        }
+        for question_num in question_nums
+    ]
+    return spec
+
+
+def _validate(spec):
+    for field in ('set_title', 'category', 'difficulty'):
+        if not spec.get(field):
+            raise ValueError(f"Trivia set is missing '{field}'")
+
+    questions = []
+    for question_num, question in enumerate(spec.get('questions') or [], start=1):
+        if not question.get('question_text'):
+            # A blank trailing slot on the edit page is how a question is *not* added
+            if not question.get('id') and not any(option.get('text') for option in question.get('options') or []):
+                continue
+            raise ValueError(f"Question {question_num} has no text")
+        question_type = question.get('question_type')
+        if question_type and question_type not in QUESTION_TYPES:
+            raise ValueError(f"Question {question_num} has unknown type '{question_type}'")
+        questions.append({
+            'id': question.get('id'),
+            'question_text': question['question_text'],
+            'question_type': question_type,
+            # Blank options are dropped, which deletes them if they existed
+            'options': [{'id': option.get('id'), 'text': option['text'], 'is_correct': bool(option.get('is_correct'))}
+                        for option in question.get('options') or [] if option.get('text')],
+        })
+    return questions
+
+
+# Applying edits
+#--------------------------------------------------------------------------------------
+def _match(existing, submitted, by_position):
+    # Pairs each submitted row with the existing row it replaces (or None).
+    # Ids that don't belong to this set are treated as new rows.
+    if by_position:
+        return [(existing[index] if index < len(existing) else None, row) for index, row in enumerate(submitted)]
+    existing_by_id = {row.id: row for row in existing}
+    pairs = []
+    for row in submitted:
+        pairs.append((existing_by_id.pop(row['id'], None) if row.get('id') else None, row))
+    return pairs
+
+
+def bump_set_versions(set_ids):
+    # Marks the sets as changed in the current transaction; doesn't commit
+    db.session.execute(
+        update(TriviaSet).where(TriviaSet.id.in_(list(set_ids)))
+        .values(version=TriviaSet.version + 1, updated_at=utcnow())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def apply_set_edit(trivia_set, spec):
+    # Loads the set's questions once, diffs them against spec and writes only what
+    # changed: bulk UPDATEs by primary key, one INSERT per table for new rows and one
+    # DELETE per table for removed rows, all in a single transaction.
+    questions = _validate(spec)
+    updated = 0
+    for field in ('set_title', 'category', 'difficulty'):
+        if getattr(trivia_set, field) != spec[field]:
+            setattr(trivia_set, field, spec[field])
+            updated = 1
+    if 'questions' not in spec:
+        if updated:
+            bump_set_versions([trivia_set.id])
+        db.session.commit()
+        return SetEdit(updated, 0, 0)
+
+    existing = load_questions(trivia_set.id)
+    by_position = not any(question['id'] for question in questions)
+
+    question_updates, option_updates = [], []
+    new_questions, new_options = [], []
+    kept_question_ids, kept_option_ids = set(), set()
+    for old_question, question in _match(existing, questions, by_position):
+        question_type = question['question_type'] or (old_question.question_type if old_question else 'multiple_choice')
+        if old_question is None:
+            new_questions.append(({'question_text': question['question_text'], 'question_type': question_type,
+                                   'trivia_set_id': trivia_set.id}, question['options']))
+            continue
+
+        kept_question_ids.add(old_question.id)
+        if (old_question.question_text, old_question.question_type) != (question['question_text'], question_type):
+            question_updates.append({'id': old_question.id, 'question_text': question['question_text'],
+                                     'question_type': question_type})
+
+        for old_option, option in _match(old_question.options, question['options'], by_position):
+            if old_option is None:
+                new_options.append({'text': option['text'], 'is_correct': option['is_correct'],
+                                    'question_id': old_question.id})
+                continue
+            kept_option_ids.add(old_option.id)
+            if (old_option.text, old_option.is_correct) != (option['text'], option['is_correct']):
+                option_updates.append({'id': old_option.id, 'text': option['text'], 'is_correct': option['is_correct']})
+
+    removed_question_ids = [question.id for question in existing if question.id not in kept_question_ids]
+    removed_option_ids = [option.id for question in existing for option in question.options
+                          if option.id not in kept_option_ids]
+
+    try:
+        if removed_option_ids:
+            db.session.execute(delete(Option).where(Option.id.in_(removed_option_ids))
+                               .execution_options(synchronize_session=False))
+        if removed_question_ids:
+            # Signatures reference the questions, and duplicates of a removed original
+            # are promoted before it goes
+            forget_questions(removed_question_ids)
+            db.session.execute(delete(Question).where(Question.id.in_(removed_question_ids))
+                               .execution_options(synchronize_session=False))
+        if question_updates:
+            db.session.execute(update(Question), question_updates)
+        if option_updates:
+            db.session.execute(update(Option), option_updates)
+        if new_questions:
+            question_ids = db.session.scalars(
+                insert(Question).returning(Question.id, sort_by_parameter_order=True),
+                [row for row, _ in new_questions],
+            ).all()
+            for question_id, (_, options) in zip(question_ids, new_questions):
+                new_options.extend({'text': option['text'], 'is_correct': option['is_correct'],
+                                    'question_id': question_id} for option in options)
+        if new_options:
+            db.session.execute(insert(Option), new_options)
+        if (updated or question_updates or option_updates or new_questions or new_options or removed_question_ids
+                or removed_option_ids):
+            bump_set_versions([trivia_set.id])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    inserted = len(new_questions) + len(new_options)
+    deleted = len(removed_question_ids) + len(removed_option_ids)
+    return SetEdit(updated + len(question_updates) + len(option_updates), inserted, deleted)
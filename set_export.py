@@ -0,0 +1,170 @@
+# set_export.py
+import gzip
+import io
+import json
+import os
+import zlib
+from itertools import islice
+
+from sqlalchemy import select
+
+from models import db, TriviaSet, Question, Option
+from trivia_sets import create_trivia_sets, normalize_set
+
+
+EXPORT_CHUNK_SIZE = 1000      # rows fetched per round trip while exporting
+GZIP_FLUSH_BYTES = 64 * 1024  # compressed output is handed out in chunks of about this size
+
+
+# Export
+#--------------------------------------------------------------------------------------
+def export_trivia_sets(user_id=None, chunk_size=EXPORT_CHUNK_SIZE):
+    # Yields one set spec (see trivia_sets.normalize_set) per trivia set, in id order.
+    # A single ordered join is streamed with yield_per, so memory stays at one chunk of
+    # rows plus the set being assembled no matter how big the bank is.
+    query = (
+        select(TriviaSet.id, TriviaSet.trivia_set_id, TriviaSet.set_title, TriviaSet.category,
+               TriviaSet.difficulty, Question.id.label('question_id'), Question.question_text,
+               Question.question_type, Option.text.label('option_text'), Option.is_correct)
+        .outerjoin(Question, Question.trivia_set_id == TriviaSet.id)
+        .outerjoin(Option, Option.question_id == Question.id)
+        .order_by(TriviaSet.id, Question.id, Option.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    if user_id is not None:
+        query = query.where(TriviaSet.user_id == user_id)
+
+    current = None
+    current_id = current_question_id = None
+    for row in db.session.execute(query):
+        if row.id != current_id:
+            if current is not None:
+                yield current
+            current_id, current_question_id = row.id, None
+            current = {
+                'trivia_set_id': row.trivia_set_id,
+                'set_title': row.set_title,
+                'category': row.category,
+                'difficulty': row.difficulty,
+                'questions': [],
+            }
+        if row.question_id is None:
+            continue
+        if row.question_id != current_question_id:
+            current_question_id = row.question_id
+            current['questions'].append({'question_text': row.question_text, 'question_type': row.question_type,
+                                         'options': []})
+        if row.option_text is not None:
+            current['questions'][-1]['options'].append({'text': row.option_text, 'is_correct': row.is_correct})
+    if current is not None:
+        yield current
+
+
+def ndjson_lines(sets):
+    for data in sets:
+        yield json.dumps(data, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+def gzip_chunks(lines):
+    # Streaming gzip, output is buffered so the response isn't a flood of tiny writes
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    buffer = []
+    buffered = 0
+    for line in lines:
+        data = compressor.compress(line.encode('utf-8'))
+        if data:
+            buffer.append(data)
+            buffered += len(data)
+            if buffered >= GZIP_FLUSH_BYTES:
+                yield b''.join(buffer)
+                buffer, buffered = [], 0
+    buffer.append(compressor.flush())
+    yield b''.join(buffer)
+
+
+def write_export(path, sets):
+    # .gz paths are compressed; returns the number of sets written
+    count = 0
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'wt', encoding='utf-8') as f:
+        for line in ndjson_lines(sets):
+            f.write(line)
+            count += 1
+    return count
+
+
+# Import
+#--------------------------------------------------------------------------------------
+def read_ndjson_lines(stream):
+    # stream is a binary file object, gzip is detected from the magic bytes
+    if not hasattr(stream, 'peek'):
+        stream = io.BufferedReader(stream)
+    if stream.peek(2)[:2] == b'\x1f\x8b':
+        stream = gzip.GzipFile(fileobj=stream)
+    for line_num, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_num, json.loads(line)
+        except ValueError:
+            raise ValueError(f'Line {line_num} is not valid JSON')
+
+
+def import_trivia_set_stream(lines, user_id, batch_size=500, start_line=0, on_batch=None):
+    # Imports (line number, set spec) pairs in batches, committing each batch so that an
+    # interrupted import can continue from the last committed line. Sets whose
+    # trivia_set_id already exists, or came earlier in the same batch, are skipped,
+    # which also makes re-running safe. on_batch(created, last_line) runs after every
+    # commit.
+    imported = skipped = 0
+    lines = ((line_num, data) for line_num, data in lines if line_num > start_line)
+    while True:
+        batch = list(islice(lines, batch_size))
+        if not batch:
+            break
+        last_line = batch[-1][0]
+
+        specs = []
+        for line_num, data in batch:
+            try:
+                specs.append(normalize_set(data))
+            except ValueError as error:
+                raise ValueError(f'Line {line_num}: {error}')
+        existing = set(db.session.scalars(
+            select(TriviaSet.trivia_set_id).where(TriviaSet.trivia_set_id.in_([spec['trivia_set_id'] for spec in specs]))
+        ))
+        new_specs = []
+        for spec in specs:
+            if spec['trivia_set_id'] not in existing:
+                existing.add(spec['trivia_set_id'])
+                new_specs.append(spec)
+        skipped += len(specs) - len(new_specs)
+
+        try:
+            created = create_trivia_sets(new_specs, user_id)
+        except Exception:
+            db.session.rollback()
+            raise
+        imported += len(created)
+        if on_batch is not None:
+            on_batch(created, last_line)
+    return imported, skipped
+
+
+# Checkpoints
+#--------------------------------------------------------------------------------------
+def read_checkpoint(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return int(f.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def write_checkpoint(path, line_num):
+    # Written to a temp file and renamed so a crash never leaves a torn checkpoint
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(str(line_num))
+    os.replace(tmp_path, path)
@@ -0,0 +1,413 @@
+# set_similarity.py
+import hashlib
+import math
+import os
+import re
+import shutil
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from itertools import groupby
+
+import numpy as np
+from sqlalchemy import func, select
+
+from models import db, TriviaSet, Question, UserScore
+
+try:
+    import fcntl
+except ImportError:     # no cross-process lock on Windows, run a single worker there
+    fcntl = None
+
+
+# "Similar sets" and "recommended for you" over set titles, categories and question
+# text. Each set is a bag of words and word pairs weighted by TF-IDF, signed-hashed
+# into a small dense vector (each feature adds to HASHES of the dim slots), so no
+# vocabulary has to be kept and a new set is vectorized on its own. Vectors are L2
+# normalized and the cosine similarity is one matrix product.
+#
+# The index is a directory of .npy files opened with mmap, so every worker shares
+# the same pages through the OS cache instead of each loading its own copy:
+#   CURRENT              name of the live generation
+#   <generation>/header  count, documents, dim
+#   <generation>/ids     set ids, sorted, `capacity` slots
+#   <generation>/vectors float32 [capacity, dim]
+#   <generation>/df      document frequency per hashed feature, from the last build
+# New and edited sets are written into the live generation under a file lock: new ids
+# are appended (set ids only grow), edited sets overwrite their row, deleted sets get
+# a zero vector. A full build, or running out of slots, writes a new generation and
+# switches CURRENT; readers notice on their next query.
+HASHES = 4
+DF_BUCKETS = 1 << 20
+TITLE_WEIGHT = 3.0
+CATEGORY_WEIGHT = 2.0
+QUESTION_WEIGHT = 1.0
+HISTORY_LIMIT = 200          # best scores of a user that make up their profile
+CHUNK_ROWS = 65536           # rows scored per matrix product
+
+WORD = re.compile(r'\w+')
+STOP_WORDS = frozenset(
+    'a an and are as at be by can did do does for from has have how if in into is it its of on or so that the their '
+    'them then there these they this to was were what when where which who whom whose why will with you your'.split()
+)
+
+
+def words(text):
+    return [word for word in WORD.findall((text or '').lower()) if len(word) > 1 and word not in STOP_WORDS]
+
+
+def document_features(title, category, questions):
+    # Weighted term counts: words and adjacent word pairs of the title and questions,
+    # and the category as one term
+    features = Counter()
+    for text, weight in ((title, TITLE_WEIGHT), (questions, QUESTION_WEIGHT)):
+        text_words = words(text)
+        for word in text_words:
+            features[word] += weight
+        for pair in zip(text_words, text_words[1:]):
+            features[' '.join(pair)] += weight
+    if category:
+        features['category:' + category.strip().lower()] += CATEGORY_WEIGHT
+    return features
+
+
+@lru_cache(maxsize=1 << 18)
+def feature_hash(feature):
+    # Stable across processes, unlike hash()
+    return int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), 'little')
+
+
+def feature_hashes(features):
+    return np.fromiter((feature_hash(feature) for feature in features), np.uint64, len(features))
+
+
+class Vectorizer:
+    def __init__(self, dim, df, documents):
+        if dim & (dim - 1):
+            raise ValueError('SIMILARITY_DIM must be a power of two')
+        self.dim = dim
+        self.bits = dim.bit_length() - 1
+        self.df = df
+        self.documents = documents
+
+    def vector(self, features):
+        vector = np.zeros(self.dim, np.float32)
+        if not features:
+            return vector
+        hashes = feature_hashes(features)
+        df = self.df[(hashes % np.uint64(DF_BUCKETS)).astype(np.intp)]
+        weights = np.log1p(np.fromiter(features.values(), np.float32, len(features)))
+        weights *= np.log((1 + self.documents) / (1 + df)).astype(np.float32) + 1
+        for hash_num in range(HASHES):
+            slots = (hashes >> np.uint64(hash_num * self.bits)) & np.uint64(self.dim - 1)
+            negative = (hashes >> np.uint64(63 - hash_num)) & np.uint64(1)
+            vector += np.bincount(slots.astype(np.intp), np.where(negative, -weights, weights), self.dim)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+def top_k(vectors, queries, k, exclude_rows=()):
+    # Rows of `vectors` with the highest dot product for each query (best first) and
+    # their scores, in chunks so the score matrix stays CHUNK_ROWS x len(queries).
+    exclude_rows = np.asarray(sorted(exclude_rows), dtype=np.intp)
+    found_rows, found_scores = [], []
+    for start in range(0, len(vectors), CHUNK_ROWS):
+        scores = vectors[start:start + CHUNK_ROWS] @ queries.T
+        excluded = exclude_rows[(exclude_rows >= start) & (exclude_rows < start + len(scores))]
+        scores[excluded - start] = -np.inf
+        take = min(k, len(scores))
+        rows = np.argpartition(-scores, take - 1, axis=0)[:take]
+        found_rows.append(rows + start)
+        found_scores.append(np.take_along_axis(scores, rows, axis=0))
+    if not found_rows:
+        return np.empty((len(queries), 0), np.intp), np.empty((len(queries), 0), np.float32)
+    rows, scores = np.concatenate(found_rows), np.concatenate(found_scores)
+    order = np.argsort(-scores, axis=0, kind='stable')[:k]
+    return np.take_along_axis(rows, order, axis=0).T, np.take_along_axis(scores, order, axis=0).T
+
+
+def set_documents(set_ids=None):
+    # Yields (id, title, category, question text) in id order. Sets and questions are
+    # two streamed queries merged here, both walking an index in id order.
+    sets = select(TriviaSet.id, TriviaSet.set_title, TriviaSet.category).order_by(TriviaSet.id)
+    questions = select(Question.trivia_set_id, Question.question_text).order_by(Question.trivia_set_id)
+    if set_ids is not None:
+        set_ids = list(set_ids)
+        sets = sets.where(TriviaSet.id.in_(set_ids))
+        questions = questions.where(Question.trivia_set_id.in_(set_ids))
+    question_rows = groupby(db.session.execute(questions.execution_options(yield_per=2000)), key=lambda row: row[0])
+    pending = next(question_rows, None)
+    for set_id, title, category in db.session.execute(sets.execution_options(yield_per=2000)):
+        while pending is not None and pending[0] < set_id:
+            pending = next(question_rows, None)
+        text = ''
+        if pending is not None and pending[0] == set_id:
+            text = ' '.join(row[1] or '' for row in pending[1])
+            pending = next(question_rows, None)
+        yield set_id, title, category, text
+
+
+class SimilarityIndex:
+    def __init__(self, path=None, dim=256):
+        self.path = path
+        self.dim = dim
+        self.queries = 0
+        self.updates = 0
+        self._current = None        # (inode, mtime) of the CURRENT the arrays were opened for
+        self._arrays = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.path = app.config.get('SIMILARITY_INDEX_PATH') or os.path.join(app.instance_path, 'similarity')
+        self.dim = app.config.get('SIMILARITY_DIM', self.dim)
+        self._current = self._arrays = None
+
+    # Files
+    #----------------------------------------------------------------------------------
+    def _current_file(self):
+        return os.path.join(self.path, 'CURRENT')
+
+    def exists(self):
+        return os.path.exists(self._current_file())
+
+    def _open(self, mode='r'):
+        # The live generation's arrays; read-only ones are cached and reopened when
+        # CURRENT changes, writable ones are opened per write
+        for attempt in range(3):
+            try:
+                stat = os.stat(self._current_file())
+                version = (stat.st_ino, stat.st_mtime_ns)
+                if mode == 'r' and self._current == version:
+                    return self._arrays
+                with open(self._current_file()) as f:
+                    generation = f.read().strip()
+                directory = os.path.join(self.path, generation)
+                arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mode)
+                          for name in ('header', 'ids', 'vectors', 'df')}
+            except FileNotFoundError:
+                # Not built, or a rebuild removed the generation between the two reads
+                if not self.exists():
+                    return None
+                continue
+            arrays['generation'] = generation
+            if mode == 'r':
+                self._current, self._arrays = version, arrays
+            return arrays
+        return None
+
+    def _locked(self):
+        return _FileLock(os.path.join(self.path, 'lock'), self._lock)
+
+    def _write_generation(self, ids, vectors, df, documents, capacity):
+        generation = f'{time.time_ns():x}'
+        directory = os.path.join(self.path, generation)
+        os.makedirs(directory)
+        count = len(ids)
+        np.save(os.path.join(directory, 'header.npy'), np.array([count, documents, self.dim], np.int64))
+        np.save(os.path.join(directory, 'df.npy'), df)
+        out_ids = np.lib.format.open_memmap(os.path.join(directory, 'ids.npy'), 'w+', np.int64, (capacity,))
+        out_ids[:count] = ids
+        out_vectors = np.lib.format.open_memmap(os.path.join(directory, 'vectors.npy'), 'w+', np.float32,
+                                                (capacity, self.dim))
+        out_vectors[:count] = vectors
+        out_ids.flush()
+        out_vectors.flush()
+        del out_ids, out_vectors
+
+        with open(self._current_file() + '.tmp', 'w') as f:
+            f.write(generation)
+        os.replace(self._current_file() + '.tmp', self._current_file())
+        for name in os.listdir(self.path):
+            if name != generation and os.path.isdir(os.path.join(self.path, name)):
+                # Workers still reading an old generation keep its pages until they reopen
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+        return generation
+
+    # Writes
+    #----------------------------------------------------------------------------------
+    def build(self, documents):
+        # documents: callable returning an iterable of (id, title, category, question
+        # text) in id order. Called twice, for the document frequencies and the vectors.
+        os.makedirs(self.path, exist_ok=True)
+        df = np.zeros(DF_BUCKETS, np.int32)
+        count = 0
+        for _, title, category, questions in documents():
+            buckets = feature_hashes(document_features(title, category, questions)) % np.uint64(DF_BUCKETS)
+            df[np.unique(buckets).astype(np.intp)] += 1
+            count += 1
+
+        vectorizer = Vectorizer(self.dim, df, count)
+        ids, vectors = [], []
+        for set_id, title, category, questions in documents():
+            ids.append(set_id)
+            vectors.append(vectorizer.vector(document_features(title, category, questions)))
+        ids = np.array(ids, np.int64)
+        vectors = np.array(vectors, np.float32).reshape(len(ids), self.dim)
+        with self._locked():
+            self._write_generation(ids, vectors, df, count, capacity=max(1024, int(len(ids) * 1.25)))
+        return len(ids)
+
+    def update(self, set_ids):
+        # Created or edited sets; a no-op until the index has been built
+        set_ids = sorted(set(set_ids))
+        if not set_ids or not self.exists():
+            return
+        documents = list(set_documents(set_ids))
+        with self._locked():
+            arrays = self._open('r+')
+            header, ids, vectors = arrays['header'], arrays['ids'], arrays['vectors']
+            vectorizer = Vectorizer(int(header[2]), arrays['df'], int(header[1]))
+            appended = []
+            for set_id, title, category, questions in documents:
+                vector = vectorizer.vector(document_features(title, category, questions))
+                count = int(header[0])
+                row = int(np.searchsorted(ids[:count], set_id))
+                if row < count and ids[row] == set_id:
+                    vectors[row] = vector
+                elif row == count and count < len(ids):
+                    # Vector first, count last, so readers never see a half-written row
+                    vectors[row] = vector
+                    ids[row] = set_id
+                    header[0] = count + 1
+                else:
+                    appended.append((set_id, vector))
+            if appended:
+                self._grow(arrays, appended)
+            self.updates += len(documents)
+
+    def remove(self, set_ids):
+        set_ids = list(set_ids)
+        if not set_ids or not self.exists():
+            return
+        with self._locked():
+            arrays = self._open('r+')
+            count = int(arrays['header'][0])
+            ids = arrays['ids'][:count]
+            arrays['vectors'][self._rows(ids, set_ids)] = 0
+
+    def _grow(self, arrays, extra):
+        # Out of slots, or an id older than the last row: a new generation with room
+        count = int(arrays['header'][0])
+        ids = np.concatenate([arrays['ids'][:count], np.array([set_id for set_id, _ in extra], np.int64)])
+        extra_vectors = np.array([vector for _, vector in extra], np.float32).reshape(len(extra), arrays['vectors'].shape[1])
+        vectors = np.concatenate([arrays['vectors'][:count], extra_vectors])
+        order = np.argsort(ids, kind='stable')
+        self._write_generation(ids[order], vectors[order], np.array(arrays['df']), int(arrays['header'][1]),
+                               capacity=max(1024, len(ids) * 2))
+
+    # Queries
+    #----------------------------------------------------------------------------------
+    def _live(self):
+        arrays = self._open()
+        if arrays is None:
+            return None, None, None
+        count = int(arrays['header'][0])
+        return arrays, arrays['ids'][:count], arrays['vectors'][:count]
+
+    def _rows(self, ids, set_ids):
+        set_ids = np.asarray(sorted(set_ids), np.int64)
+        rows = np.searchsorted(ids, set_ids)
+        found = rows < len(ids)
+        found[found] = ids[rows[found]] == set_ids[found]
+        return rows[found]
+
+    def similar(self, set_id, k=10):
+        # [(set id, similarity)] best first
+        arrays, ids, vectors = self._live()
+        if arrays is None:
+            return []
+        rows = self._rows(ids, [set_id])
+        if len(rows):
+            query = vectors[rows[0]]
+        else:
+            # Not indexed yet (or gone): vectorize it from the tables
+            documents = list(set_documents([set_id]))
+            if not documents:
+                return []
+            query = Vectorizer(int(arrays['header'][2]), arrays['df'], int(arrays['header'][1])).vector(
+                document_features(*documents[0][1:]))
+        return self._ranked(ids, vectors, query, k, rows)
+
+    def recommend(self, user_id, k=10):
+        # Sets close to the ones the user played, weighted towards those they scored
+        # well on; sets they played or made themselves are left out
+        questions = (select(func.count()).where(Question.trivia_set_id == UserScore.trivia_set_id)
+                     .correlate(UserScore).scalar_subquery())
+        history = db.session.execute(
+            select(UserScore.trivia_set_id, UserScore.score, questions)
+            .where(UserScore.user_id == user_id)
+            .order_by(UserScore.score.desc())
+            .limit(HISTORY_LIMIT)
+        ).all()
+        own = db.session.scalars(select(TriviaSet.id).where(TriviaSet.user_id == user_id)).all()
+        weights = {set_id: 0.25 + min(1.0, score / total) if total else 0.25 for set_id, score, total in history}
+        return self.recommend_for(weights, k, exclude=own)
+
+    def recommend_for(self, weights, k=10, exclude=()):
+        # weights: set id -> how much that set counts towards the profile
+        arrays, ids, vectors = self._live()
+        if arrays is None or not weights:
+            return []
+        rows = self._rows(ids, weights)
+        if not len(rows):
+            return []
+        profile = np.asarray([weights[int(set_id)] for set_id in ids[rows]], np.float32) @ vectors[rows]
+        norm = np.linalg.norm(profile)
+        if not norm:
+            return []
+        exclude_rows = np.concatenate([rows, self._rows(ids, exclude)]) if exclude else rows
+        return self._ranked(ids, vectors, profile / norm, k, exclude_rows)
+
+    def _ranked(self, ids, vectors, query, k, exclude_rows):
+        self.queries += 1
+        rows, scores = top_k(vectors, query[np.newaxis, :], k, exclude_rows)
+        return [(int(ids[row]), round(float(score), 4)) for row, score in zip(rows[0], scores[0])
+                if score > 0 and math.isfinite(score)]
+
+    def stats(self):
+        arrays = self._open()
+        if arrays is None:
+            return {'built': False, 'queries': self.queries, 'updates': self.updates}
+        return {'built': True, 'generation': arrays['generation'], 'sets': int(arrays['header'][0]),
+                'capacity': len(arrays['ids']), 'dim': int(arrays['header'][2]), 'queries': self.queries, 'updates': self.updates}
+
+
+class _FileLock:
+    # Serializes index writes between threads and, with fcntl, between worker processes
+    def __init__(self, path, thread_lock):
+        self.path = path
+        self.thread_lock = thread_lock
+        self.file = None
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        if fcntl is not None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.file = open(self.path, 'a+')
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self.file is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
+        self.thread_lock.release()
+
+
+def describe_sets(scored):
+    # [(set id, score)] -> dicts for the API, in the same order, skipping deleted sets
+    if not scored:
+        return []
+    rows = db.session.execute(
+        select(TriviaSet.id, TriviaSet.set_title, TriviaSet.category, TriviaSet.difficulty)
+        .where(TriviaSet.id.in_([set_id for set_id, _ in scored]))
+    ).all()
+    by_id = {row.id: row for row in rows}
+    return [{'id': set_id, 'set_title': by_id[set_id].set_title, 'category': by_id[set_id].category,
+             'difficulty': by_id[set_id].difficulty, 'similarity': score}
+            for set_id, score in scored if set_id in by_id]
+
+
+similarity_index = SimilarityIndex()
@@ -0,0 +1,75 @@
+# set_snapshots.py
+import sys
+from collections import namedtuple
+
+from sqlalchemy import select
+
+from local_cache import BoundedLRUCache
+from models import db, TriviaSet, Question, Option
+
+
+# Read-only snapshot of a trivia set with its questions and options, used to render
+# the play pages. Attribute names match the models so templates work with either.
+OptionView = namedtuple('OptionView', ['id', 'text'])
+QuestionView = namedtuple('QuestionView', ['id', 'question_text', 'question_type', 'options'])
+TriviaSetView = namedtuple('TriviaSetView', ['id', 'set_title', 'category', 'difficulty', 'user_id',
+                                             'trivia_set_id', 'questions', 'version', 'updated_at'])
+
+
+def load_set_snapshot(set_id):
+    # The whole set in one query, ordered so each question's options are contiguous
+    rows = db.session.execute(
+        select(TriviaSet.id, TriviaSet.set_title, TriviaSet.category, TriviaSet.difficulty, TriviaSet.user_id,
+               TriviaSet.trivia_set_id, TriviaSet.version, TriviaSet.updated_at, Question.id.label('question_id'),
+               Question.question_text, Question.question_type, Option.id.label('option_id'),
+               Option.text.label('option_text'))
+        .outerjoin(Question, Question.trivia_set_id == TriviaSet.id)
+        .outerjoin(Option, Option.question_id == Question.id)
+        .where(TriviaSet.id == set_id)
+        .order_by(Question.id, Option.id)
+    ).all()
+    if not rows:
+        return None
+
+    questions = []
+    current_id = None
+    for row in rows:
+        if row.question_id is None:
+            continue
+        if row.question_id != current_id:
+            current_id = row.question_id
+            questions.append(QuestionView(row.question_id, row.question_text, row.question_type, []))
+        if row.option_id is not None:
+            questions[-1].options.append(OptionView(row.option_id, row.option_text))
+
+    first = rows[0]
+    return TriviaSetView(first.id, first.set_title, first.category, first.difficulty, first.user_id,
+                         first.trivia_set_id,
+                         tuple(question._replace(options=tuple(question.options)) for question in questions),
+                         first.version, first.updated_at)
+
+
+def snapshot_nbytes(snapshot):
+    # Rough size: the containers plus every string they hold
+    size = sys.getsizeof(snapshot) + sum(sys.getsizeof(value) for value in snapshot[1:6])
+    for question in snapshot.questions:
+        size += sys.getsizeof(question) + sys.getsizeof(question.question_text) + sys.getsizeof(question.options)
+        for option in question.options:
+            size += sys.getsizeof(option) + sys.getsizeof(option.text)
+    return size
+
+
+snapshot_cache = BoundedLRUCache(sizeof=snapshot_nbytes)
+
+# Rendered guest play pages, keyed by set id, as (set version, page). Guest pages carry
+# nothing user specific, so one rendering serves every anonymous player.
+guest_page_cache = BoundedLRUCache(sizeof=lambda entry: sys.getsizeof(entry[1]))
+
+
+def get_set_snapshot(set_id):
+    return snapshot_cache.get_or_load(set_id, lambda: load_set_snapshot(set_id))
+
+
+def invalidate_set_snapshot(set_id):
+    snapshot_cache.invalidate(set_id)
+    guest_page_cache.invalidate(set_id)
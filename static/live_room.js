@@ -0,0 +1,255 @@
+// live_room.js
+//
+// Client for a live room, used by both the host and the player pages. Questions,
+// reveals and standings arrive over server-sent events from /rooms/<code>/events; the
+// countdown runs against the deadline the server sends, corrected for clock skew, so
+// every screen shows the same timer. EventSource reconnects on its own and the server
+// replays what was missed.
+
+const liveRoot = document.getElementById('live-root');
+const role = liveRoot.dataset.role;
+const code = liveRoot.dataset.code;
+
+const statusText = document.getElementById('status');
+const questionContainer = document.getElementById('question-container');
+const questionNumber = document.getElementById('question-number');
+const questionText = document.getElementById('question-text');
+const optionsContainer = document.getElementById('options-container');
+const timerElement = document.getElementById('timer');
+const standingsList = document.getElementById('standings');
+const scoreText = document.getElementById('score');
+
+let clockOffset = 0;     // server time - local time, in ms
+let deadline = null;
+let currentQuestionId = null;
+let answered = false;
+let timerInterval;
+
+
+function postJSON(url, body) {
+    return fetch(url, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        credentials: 'same-origin',
+        body: JSON.stringify(body || {}),
+    }).then((response) => response.json());
+}
+
+
+function startTimer(until) {
+    deadline = until;
+    clearInterval(timerInterval);
+    const update = () => {
+        const timeLeft = Math.max(0, Math.ceil((deadline - (Date.now() + clockOffset)) / 1000));
+        timerElement.textContent = timeLeft;
+        if (timeLeft <= 0) {
+            clearInterval(timerInterval);
+        }
+    };
+    update();
+    timerInterval = setInterval(update, 250);
+}
+
+
+function showStandings(standings) {
+    standingsList.innerHTML = '';
+    (standings || []).forEach((entry) => {
+        const item = document.createElement('li');
+        item.textContent = `${entry.name} - ${entry.score}`;
+        standingsList.appendChild(item);
+    });
+}
+
+
+function showQuestion(question) {
+    currentQuestionId = question.id;
+    answered = false;
+    statusText.textContent = '';
+    questionContainer.hidden = false;
+    questionNumber.textContent = `${question.index + 1} / ${question.total}`;
+    questionText.textContent = question.question_text;
+    optionsContainer.innerHTML = '';
+
+    if (question.question_type === 'open_ended') {
+        showAnswerInput(question);
+    }
+    question.options.forEach((option) => {
+        const optionButton = document.createElement('button');
+        optionButton.type = 'button';
+        optionButton.className = 'btn option-button';
+        optionButton.textContent = option.text;
+        optionButton.dataset.optionId = option.id;
+        if (role === 'host') {
+            optionButton.disabled = true;
+        } else {
+            optionButton.addEventListener('click', () => sendAnswer(question.id, { option_id: option.id }, optionButton));
+        }
+        optionsContainer.appendChild(optionButton);
+    });
+    startTimer(question.deadline);
+}
+
+
+// Open-ended questions are answered by typing; the server grades the text
+function showAnswerInput(question) {
+    const answerInput = document.createElement('input');
+    answerInput.type = 'text';
+    answerInput.className = 'answer-input';
+    answerInput.autocomplete = 'off';
+    const answerButton = document.createElement('button');
+    answerButton.type = 'button';
+    answerButton.className = 'btn option-button';
+    answerButton.textContent = 'Answer';
+    if (role === 'host') {
+        answerInput.disabled = true;
+        answerButton.disabled = true;
+    } else {
+        const submit = () => sendAnswer(question.id, { answer: answerInput.value }, answerButton);
+        answerButton.addEventListener('click', submit);
+        answerInput.addEventListener('keydown', (event) => {
+            if (event.key === 'Enter') {
+                event.preventDefault();
+                submit();
+            }
+        });
+    }
+    optionsContainer.append(answerInput, answerButton);
+}
+
+
+function sendAnswer(questionId, answer, chosenButton) {
+    if (answered || questionId !== currentQuestionId) {
+        return;
+    }
+    answered = true;
+    optionsContainer.querySelectorAll('button, input').forEach((element) => { element.disabled = true; });
+    chosenButton.classList.add('chosen');
+
+    postJSON(`/rooms/${code}/answer`, Object.assign({ question_id: questionId }, answer)).then((result) => {
+        if (result.error) {
+            statusText.textContent = result.error;
+            return;
+        }
+        scoreText.textContent = result.score;
+        chosenButton.classList.add(result.correct ? 'correct' : 'incorrect');
+    });
+}
+
+
+function showReveal(correctOptionId, standings, answer) {
+    clearInterval(timerInterval);
+    timerElement.textContent = 0;
+    optionsContainer.querySelectorAll('button, input').forEach((element) => {
+        element.disabled = true;
+        if (String(correctOptionId) === element.dataset.optionId) {
+            element.classList.add('correct');
+        }
+    });
+    if (answer) {
+        statusText.textContent = `Answer: ${answer}`;
+    }
+    showStandings(standings);
+}
+
+
+function showProgress(data) {
+    const players = document.getElementById('players');
+    if (players) {
+        players.textContent = data.players;
+        document.getElementById('answered').textContent = data.answered;
+    }
+}
+
+
+function showState(data) {
+    clockOffset = data.server_time - Date.now();
+    showProgress(data);
+    showStandings(data.standings);
+    if (data.you) {
+        scoreText.textContent = data.you.score;
+    }
+    if (data.question) {
+        showQuestion(data.question);
+        if (data.state === 'reveal') {
+            showReveal(data.correct_option_id, data.standings, data.answer);
+        }
+    }
+    showHostControls(data.state);
+    if (data.state === 'lobby') {
+        statusText.textContent = 'Waiting for the host to start';
+    } else if (data.state === 'finished') {
+        showFinished(data.standings);
+    }
+}
+
+
+function showFinished(standings) {
+    questionContainer.hidden = true;
+    statusText.textContent = 'Game Over';
+    showStandings(standings);
+    showHostControls('finished');
+}
+
+
+function showHostControls(state) {
+    if (role !== 'host') {
+        return;
+    }
+    document.getElementById('start-button').hidden = state !== 'lobby';
+    document.getElementById('next-button').hidden = state === 'lobby' || state === 'finished';
+}
+
+
+function listen() {
+    const events = new EventSource(`/rooms/${code}/events`);
+    events.addEventListener('state', (event) => showState(JSON.parse(event.data)));
+    events.addEventListener('progress', (event) => showProgress(JSON.parse(event.data)));
+    events.addEventListener('question', (event) => {
+        showQuestion(JSON.parse(event.data));
+        showHostControls('question');
+    });
+    events.addEventListener('reveal', (event) => {
+        const data = JSON.parse(event.data);
+        showProgress(data);
+        showReveal(data.correct_option_id, data.standings, data.answer);
+    });
+    events.addEventListener('finished', (event) => {
+        showFinished(JSON.parse(event.data).standings);
+        events.close();
+    });
+    events.addEventListener('closed', () => {
+        statusText.textContent = 'This room has closed';
+        events.close();
+    });
+    events.addEventListener('error', () => {
+        // A dropped stream reconnects by itself; a refused one (the server is at its
+        // stream limit) stays closed, so try again shortly
+        if (events.readyState === EventSource.CLOSED) {
+            statusText.textContent = 'Too many viewers right now, retrying...';
+            setTimeout(listen, 5000);
+        }
+    });
+}
+
+
+if (role === 'host') {
+    document.getElementById('start-button').addEventListener('click', () => postJSON(`/rooms/${code}/start`));
+    document.getElementById('next-button').addEventListener('click', () => postJSON(`/rooms/${code}/next`));
+    listen();
+} else if (liveRoot.dataset.joined === 'true') {
+    listen();
+} else {
+    const joinForm = document.getElementById('join-form');
+    joinForm.addEventListener('submit', (event) => {
+        event.preventDefault();
+        const nameInput = document.getElementById('player-name');
+        postJSON(`/rooms/${code}/join`, { name: nameInput ? nameInput.value : null }).then((result) => {
+            if (result.error) {
+                statusText.textContent = result.error;
+                return;
+            }
+            joinForm.hidden = true;
+            listen();
+        });
+    });
+}
@@ -1,23 +1,36 @@
 // play_set.js
-
+//
+// Plays a set one question at a time through the JSON API instead of posting the
+// whole form: the set is fetched once and a play started, each answer is posted as it
+// is picked and scored straight away, and a per-question timer moves on when time runs
+// out.
+// Without JavaScript the page falls back to the plain form.
+
+const playRoot = document.getElementById('play-root');
+const playForm = document.getElementById('play-form');
 const questionContainer = document.getElementById('question-container');
 const questionText = document.getElementById('question-text');
 const optionsContainer = document.getElementById('options-container');
-const answerForm = document.getElementById('answer-form');
-const submitButton = document.getElementById('submit-answer');
-const scoreContainer = document.getElementById('score-container');
 const scoreText = document.getElementById('score');
+const timerElement = document.getElementById('timer');
+
+const setId = playRoot.dataset.setId;
+const secondsPerQuestion = parseInt(playRoot.dataset.seconds || '10', 10);
 
+let questions = [];
 let currentQuestionIndex = 0;
-let score = 0;
+let timerInterval;
+let answering = false;
 
-// Define your questions and answers here based on Flask data
-const questions = "{{ questions }}";
-const questionAnswerDict = '{{ question_answer_dict }}';
 
-// Timer variables
-let timerInterval;
-const timerElement = document.getElementById('timer');
+function postJSON(url, body) {
+    return fetch(url, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        credentials: 'same-origin',
+        body: JSON.stringify(body || {}),
+    }).then((response) => response.json());
+}
 
 
 // Function to load and display the current question
@@ -28,66 +41,129 @@ function loadCurrentQuestion() {
     // Clear previous options
     optionsContainer.innerHTML = '';
 
-    // Create radio buttons for options
-    currentQuestion.options.forEach((option, index) => {
-        const optionRadio = document.createElement('input');
-        optionRadio.type = 'radio';
-        optionRadio.name = 'selected_option';
-        optionRadio.value = option;
-        optionRadio.id = `option${index + 1}`;
-
-        const optionLabel = document.createElement('label');
-        optionLabel.textContent = option;
-        optionLabel.htmlFor = `option${index + 1}`;
-
-        optionsContainer.appendChild(optionRadio);
-        optionsContainer.appendChild(optionLabel);
-        optionsContainer.appendChild(document.createElement('br'));
+    if (currentQuestion.question_type === 'open_ended') {
+        showAnswerInput();
+    }
+    currentQuestion.options.forEach((option) => {
+        const optionButton = document.createElement('button');
+        optionButton.type = 'button';
+        optionButton.className = 'btn option-button';
+        optionButton.textContent = option.text;
+        optionButton.dataset.optionId = option.id;
+        optionButton.addEventListener('click', () => checkAnswer({ option_id: option.id }));
+        optionsContainer.appendChild(optionButton);
     });
 
+    answering = true;
     startTimer();
 }
 
+
+// Open-ended questions are answered by typing; the server grades the text
+function showAnswerInput() {
+    const answerInput = document.createElement('input');
+    answerInput.type = 'text';
+    answerInput.className = 'answer-input';
+    answerInput.autocomplete = 'off';
+    const answerButton = document.createElement('button');
+    answerButton.type = 'button';
+    answerButton.className = 'btn option-button';
+    answerButton.textContent = 'Answer';
+    answerButton.dataset.typed = '1';
+    answerButton.addEventListener('click', () => checkAnswer({ answer: answerInput.value }));
+    answerInput.addEventListener('keydown', (event) => {
+        if (event.key === 'Enter') {
+            event.preventDefault();
+            checkAnswer({ answer: answerInput.value });
+        }
+    });
+    optionsContainer.append(answerInput, answerButton);
+    answerInput.focus();
+}
+
+
 // Function to start the timer for a question
 function startTimer() {
-    let timeLeft = 10; // 10 seconds
+    let timeLeft = secondsPerQuestion;
     timerElement.textContent = timeLeft;
 
+    clearInterval(timerInterval);
     timerInterval = setInterval(function () {
         timeLeft--;
         timerElement.textContent = timeLeft;
 
         if (timeLeft <= 0) {
-            clearInterval(timerInterval);
-            checkAnswer(); // Automatically check answer when the timer runs out
+            checkAnswer(null); // Time is up, the question counts as unanswered
         }
     }, 1000);
 }
 
 
-// Function to check the user's answer
-function checkAnswer() {
-    const selectedOption = document.querySelector('input[name="selected_option"]:checked');
-    if (selectedOption) {
-        const userAnswerValue = selectedOption.value;
-        const currentQuestion = questions[currentQuestionIndex];
-        const correctAnswers = questionAnswerDict[currentQuestion.id];
+// Function to check the user's answer with the server. answer is { option_id } or
+// { answer } for typed answers, null when time ran out.
+function checkAnswer(answer) {
+    if (!answering) {
+        return;
+    }
+    answering = false;
+    clearInterval(timerInterval);
 
-        if (correctAnswers.includes(userAnswerValue)) {
-            score++;
-            scoreText.textContent = score;
-        }
-        currentQuestionIndex++;
-        if (currentQuestionIndex < questions.length) {
-            loadCurrentQuestion();
-        } else {
-            questionContainer.innerHTML = '<h2>Game Over</h2>';
+    const currentQuestion = questions[currentQuestionIndex];
+    const checked = answer === null
+        ? Promise.resolve(null)
+        : postJSON(`/api/sets/${setId}/answers`, Object.assign({ question_id: currentQuestion.id }, answer));
+
+    checked.then((result) => {
+        let delay = 800;
+        if (result) {
+            scoreText.textContent = result.score;
+            const outcome = result.results[currentQuestion.id];
+            optionsContainer.querySelectorAll('button, input').forEach((element) => {
+                element.disabled = true;
+                if (element.dataset.typed) {
+                    element.classList.add(outcome && outcome.correct ? 'correct' : 'incorrect');
+                } else if (outcome && String(outcome.correct_option_id) === element.dataset.optionId) {
+                    element.classList.add('correct');
+                } else if (String(answer.option_id) === element.dataset.optionId) {
+                    element.classList.add('incorrect');
+                }
+            });
+            if (outcome && outcome.answer && !outcome.correct) {
+                const accepted = document.createElement('p');
+                accepted.textContent = `Answer: ${outcome.answer}`;
+                optionsContainer.appendChild(accepted);
+                delay = 2000;   // time to read the right answer
+            }
         }
+        setTimeout(nextQuestion, delay);
+    });
+}
+
+
+function nextQuestion() {
+    currentQuestionIndex++;
+    if (currentQuestionIndex < questions.length) {
+        loadCurrentQuestion();
+    } else {
+        questionContainer.innerHTML = '<h2>Game Over</h2>';
+        postJSON(`/api/sets/${setId}/finish`).then((result) => {
+            window.location.href = result.results_url;
+        });
     }
 }
 
-// Initial load
-loadCurrentQuestion();
 
-// Event listener for submit button
-submitButton.addEventListener('click', checkAnswer);
+// Initial load, starting a fresh play so answers from an abandoned one don't count
+Promise.all([
+    fetch(`/api/sets/${setId}`, { credentials: 'same-origin' }).then((response) => response.json()),
+    postJSON(`/api/sets/${setId}/start`),
+])
+    .then(([trivia_set]) => {
+        questions = trivia_set.questions;
+        if (!questions.length) {
+            return;
+        }
+        playForm.hidden = true;
+        questionContainer.hidden = false;
+        loadCurrentQuestion();
+    });
@@ -0,0 +1,255 @@
+# static_assets.py
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import re
+import time
+
+from flask import current_app, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+# `flask build-assets` copies static/ into static/dist/ under content-hashed names
+# (dashboard.css -> dashboard.3f9c0e1d2a4b.css) and writes manifest.json mapping one to
+# the other. A hashed file never changes, so it can be cached for a year; a new build
+# gives changed files new names and pages pick them up through url_for.
+# Next to each file the build leaves precompressed .gz (and .br with the brotli
+# package) variants of text assets, and with Pillow, resized background images and a
+# .webp variant of each image. The server picks a variant from Accept-Encoding/Accept.
+BUILD_DIR = 'dist'
+MANIFEST = 'manifest.json'
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.html')
+IMAGES = ('.png', '.jpg', '.jpeg', '.gif')
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def hashed_name(name, data):
+    stem, ext = os.path.splitext(name)
+    return f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+
+
+def variant_name(hashed, kind):
+    if kind == 'webp':
+        return os.path.splitext(hashed)[0] + '.webp'
+    return hashed + ('.gz' if kind == 'gzip' else '.br')
+
+
+def gzip_bytes(data):
+    # mtime=0 so the same input always gives the same bytes
+    out = io.BytesIO()
+    with gzip.GzipFile(fileobj=out, mode='wb', compresslevel=9, mtime=0) as f:
+        f.write(data)
+    return out.getvalue()
+
+
+def optimize_image(data, ext, max_width, quality):
+    # Returns (image bytes, webp bytes or None). Backgrounds wider than max_width are
+    # scaled down; animated GIFs keep their frames as they are.
+    if Image is None:
+        return data, None
+    image = Image.open(io.BytesIO(data))
+    animated = getattr(image, 'is_animated', False)
+    if not animated and image.width > max_width:
+        image = image.resize((max_width, round(image.height * max_width / image.width)), Image.LANCZOS)
+        out = io.BytesIO()
+        if ext == '.png':
+            image.save(out, 'PNG', optimize=True)
+        elif ext == '.gif':
+            image.save(out, 'GIF', optimize=True)
+        else:
+            image.convert('RGB').save(out, 'JPEG', quality=quality, optimize=True, progressive=True)
+        data = out.getvalue()
+    elif ext == '.png':
+        out = io.BytesIO()
+        image.save(out, 'PNG', optimize=True)
+        if out.tell() < len(data):
+            data = out.getvalue()
+
+    webp = io.BytesIO()
+    if animated:
+        image.save(webp, 'WEBP', save_all=True, quality=quality, method=4)
+    else:
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        image.save(webp, 'WEBP', quality=quality, method=6)
+    webp = webp.getvalue()
+    return data, webp if len(webp) < len(data) else None
+
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if not os.path.exists(path):
+        with open(path, 'wb') as f:
+            f.write(data)
+
+
+def missing_asset_packages():
+    missing = []
+    if Image is None:
+        missing.append('Pillow (resized images and WebP)')
+    if brotli is None:
+        missing.append('brotli (.br variants)')
+    return missing
+
+
+def build_assets(static_dir, max_width=2560, quality=80, clean=False):
+    # Returns the manifest. Images go first so stylesheets can point at their hashed
+    # names; url() references to files that don't exist are left alone.
+    out_dir = os.path.join(static_dir, BUILD_DIR)
+    names = []
+    for root, dirs, files in os.walk(static_dir):
+        if os.path.abspath(root) == os.path.abspath(static_dir) and BUILD_DIR in dirs:
+            dirs.remove(BUILD_DIR)
+        names += [os.path.relpath(os.path.join(root, name), static_dir).replace(os.sep, '/') for name in files]
+    names.sort(key=lambda name: (name.endswith('.css'), name))
+
+    files, variants, sizes = {}, {}, {'source': 0, 'built': 0}
+    for name in names:
+        with open(os.path.join(static_dir, name), 'rb') as f:
+            data = f.read()
+        sizes['source'] += len(data)
+        ext = os.path.splitext(name)[1].lower()
+        built = {}
+        webp = None
+
+        if ext == '.css':
+            directory = os.path.dirname(name)
+
+            def hashed_url(match):
+                target = os.path.normpath(os.path.join(directory, match.group(2))).replace(os.sep, '/')
+                if target not in files:
+                    return match.group(0)
+                return f'url({os.path.relpath(files[target], directory or ".").replace(os.sep, "/")})'
+
+            data = CSS_URL.sub(hashed_url, data.decode()).encode()
+        elif ext in IMAGES:
+            data, webp = optimize_image(data, ext, max_width, quality)
+
+        hashed = hashed_name(name, data)
+        files[name] = hashed
+        write_file(os.path.join(out_dir, hashed), data)
+        if ext in COMPRESSIBLE:
+            compressed = gzip_bytes(data)
+            if len(compressed) < len(data):
+                built['gzip'] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(data, quality=11)
+                if len(compressed) < len(data):
+                    built['br'] = compressed
+        if webp is not None:
+            built['webp'] = webp
+
+        for kind, variant in built.items():
+            write_file(os.path.join(out_dir, variant_name(hashed, kind)), variant)
+        if built:
+            variants[hashed] = sorted(built)
+        sizes['built'] += min([len(data)] + [len(variant) for variant in built.values()])
+
+    manifest = {'built': time.time(), 'files': files, 'variants': variants, 'sizes': sizes}
+    path = os.path.join(out_dir, MANIFEST)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+    if clean:
+        keep = {MANIFEST} | set(files.values())
+        keep |= {variant_name(hashed, kind) for hashed, kinds in variants.items() for kind in kinds}
+        for root, _, filenames in os.walk(out_dir):
+            for filename in filenames:
+                relative = os.path.relpath(os.path.join(root, filename), out_dir).replace(os.sep, '/')
+                if relative not in keep:
+                    os.remove(os.path.join(root, filename))
+    return manifest
+
+
+class StaticAssets:
+    # Serves the build: url_for('static', filename=...) gives the hashed name when the
+    # manifest has one, and hashed files go out with a year long immutable
+    # Cache-Control and the best variant the client accepts. Without a build, or for
+    # files changed since it, static files are served by Flask as before.
+    def __init__(self):
+        self.files = {}
+        self.hashed = set()
+        self.variants = {}
+        self.max_age = 365 * 24 * 3600
+        self.static_folder = None
+        self.served = {'identity': 0, 'gzip': 0, 'br': 0, 'webp': 0}
+
+    def init_app(self, app):
+        self.static_folder = app.static_folder
+        self.max_age = app.config.get('STATIC_ASSET_MAX_AGE', self.max_age)
+        self.files, self.hashed, self.variants = {}, set(), {}
+        if app.config.get('STATIC_ASSETS', True):
+            self.load(app)
+        app.url_defaults(self.hashed_url)
+        app.view_functions['static'] = self.send_static
+
+    def load(self, app):
+        path = os.path.join(self.static_folder, BUILD_DIR, MANIFEST)
+        try:
+            with open(path) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return
+        stale = [name for name in manifest['files']
+                 if not os.path.exists(os.path.join(self.static_folder, name))
+                 or os.path.getmtime(os.path.join(self.static_folder, name)) > manifest['built']]
+        if stale:
+            # A stylesheet pointing at an old image is harmless, an old stylesheet isn't
+            app.logger.warning('Static files changed since the last build-assets, serving them unhashed: %s',
+                               ', '.join(stale))
+        self.files = {name: f'{BUILD_DIR}/{hashed}' for name, hashed in manifest['files'].items() if name not in stale}
+        self.hashed = {f'{BUILD_DIR}/{hashed}' for hashed in manifest['files'].values()}
+        self.variants = {f'{BUILD_DIR}/{hashed}': set(kinds) for hashed, kinds in manifest['variants'].items()}
+
+    def hashed_url(self, endpoint, values):
+        if endpoint == 'static':
+            filename = values.get('filename')
+            if filename in self.files:
+                values['filename'] = self.files[filename]
+
+    def send_static(self, filename):
+        if filename not in self.hashed:
+            return current_app.send_static_file(filename)
+
+        kinds = self.variants.get(filename, ())
+        kind = self.pick_variant(kinds)
+        path = variant_name(filename, kind) if kind != 'identity' else filename
+        mimetype = 'image/webp' if kind == 'webp' else mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = send_from_directory(self.static_folder, path, max_age=self.max_age, mimetype=mimetype)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        if kind in ('gzip', 'br'):
+            response.headers['Content-Encoding'] = kind
+        if kinds:
+            response.vary.add('Accept' if 'webp' in kinds else 'Accept-Encoding')
+        self.served[kind] += 1
+        return response
+
+    def pick_variant(self, kinds):
+        if 'webp' in kinds and any(value == 'image/webp' and quality for value, quality in request.accept_mimetypes):
+            return 'webp'
+        encodings = request.accept_encodings
+        if 'br' in kinds and encodings['br']:
+            return 'br'
+        if 'gzip' in kinds and encodings['gzip']:
+            return 'gzip'
+        return 'identity'
+
+    def stats(self):
+        return {'hashed': len(self.files), **self.served}
+
+
+static_assets = StaticAssets()
@@ -0,0 +1,198 @@
+# trivia_sets.py
+import csv
+import json
+import uuid
+from collections import namedtuple
+
+from sqlalchemy import insert
+
+from models import db, TriviaSet, Question, Option
+
+
+QUESTION_TYPES = ('multiple_choice', 'open_ended')
+
+CreatedSet = namedtuple('CreatedSet', ['id', 'trivia_set_id', 'question_ids'])
+
+
+# Set specs
+#--------------------------------------------------------------------------------------
+# A set spec is a plain dict:
+#   {"set_title": ..., "category": ..., "difficulty": ..., "trivia_set_id": optional,
+#    "questions": [{"question_text": ..., "question_type": optional,
+#                   "options": [{"text": ..., "is_correct": bool}, ...]}]}
+# Options may also be given as plain strings together with a 1-based
+# "correct_option", which is how the create form and CSV files describe them.
+def normalize_set(data):
+    if not isinstance(data, dict):
+        raise ValueError('Trivia set is not an object')
+    for field in ('set_title', 'category', 'difficulty'):
+        if not data.get(field):
+            raise ValueError(f"Trivia set is missing '{field}'")
+
+    questions = []
+    for question_num, question in enumerate(data.get('questions') or [], start=1):
+        if not isinstance(question, dict):
+            raise ValueError(f"Question {question_num} of '{data['set_title']}' is not an object")
+        question_text = question.get('question_text')
+        if not question_text:
+            raise ValueError(f"Question {question_num} of '{data['set_title']}' has no text")
+
+        question_type = question.get('question_type') or 'multiple_choice'
+        if question_type not in QUESTION_TYPES:
+            raise ValueError(f"Question {question_num} of '{data['set_title']}' has unknown type '{question_type}'")
+
+        correct_option = question.get('correct_option')
+        options = []
+        for option_num, option in enumerate(question.get('options') or [], start=1):
+            if isinstance(option, str):
+                option = {'text': option, 'is_correct': str(option_num) == str(correct_option)}
+            if not isinstance(option, dict):
+                raise ValueError(f"Option {option_num} of question {question_num} of '{data['set_title']}' "
+                                 f"is not text or an object")
+            if not option.get('text'):
+                continue
+            options.append({'text': option['text'], 'is_correct': bool(option.get('is_correct'))})
+
+        questions.append({'question_text': question_text, 'question_type': question_type, 'options': options})
+
+    trivia_set_id = data.get('trivia_set_id') or str(uuid.uuid4())
+    if not isinstance(trivia_set_id, (str, int)) or isinstance(trivia_set_id, bool):
+        raise ValueError(f"Trivia set '{data['set_title']}' has an invalid trivia_set_id")
+
+    return {
+        'set_title': data['set_title'],
+        'category': data['category'],
+        'difficulty': data['difficulty'],
+        'trivia_set_id': str(trivia_set_id),
+        'questions': questions,
+    }
+
+
+def set_from_form(form, num_questions=5):
+    # Build a set spec from the create_trivia_set form
+    return normalize_set({
+        'set_title': form.get('set_title'),
+        'category': form.get('category'),
+        'difficulty': form.get('difficulty'),
+        'questions': [
+            {
+                'question_text': form.get(f'question_{question_num}'),
+                'options': form.getlist(f'question_{question_num}_options[]'),
+                'correct_option': form.get(f'correct_option_{question_num}'),
+            }
+            for question_num in range(1, num_questions + 1)
+        ],
+    })
+
+
+# Bulk creation
+#--------------------------------------------------------------------------------------
+def create_trivia_sets(sets, user_id, commit=True):
+    # Writes whole set graphs with one INSERT per table (batched by SQLAlchemy's
+    # insertmanyvalues), all inside the current transaction.
+    # Returns a CreatedSet per input set, in input order.
+    sets = [normalize_set(data) for data in sets]
+    if not sets:
+        return []
+
+    set_ids = db.session.scalars(
+        insert(TriviaSet).returning(TriviaSet.id, sort_by_parameter_order=True),
+        [
+            {
+                'set_title': data['set_title'],
+                'category': data['category'],
+                'difficulty': data['difficulty'],
+                'user_id': user_id,
+                'trivia_set_id': data['trivia_set_id'],
+            }
+            for data in sets
+        ],
+    ).all()
+
+    question_rows = [
+        {'question_text': question['question_text'], 'question_type': question['question_type'], 'trivia_set_id': set_id}
+        for set_id, data in zip(set_ids, sets)
+        for question in data['questions']
+    ]
+    question_ids = []
+    if question_rows:
+        question_ids = db.session.scalars(
+            insert(Question).returning(Question.id, sort_by_parameter_order=True), question_rows
+        ).all()
+
+    created = []
+    option_rows = []
+    question_id_iter = iter(question_ids)
+    for set_id, data in zip(set_ids, sets):
+        set_question_ids = []
+        for question in data['questions']:
+            question_id = next(question_id_iter)
+            set_question_ids.append(question_id)
+            option_rows.extend(
+                {'text': option['text'], 'is_correct': option['is_correct'], 'question_id': question_id}
+                for option in question['options']
+            )
+        created.append(CreatedSet(set_id, data['trivia_set_id'], set_question_ids))
+
+    if option_rows:
+        db.session.execute(insert(Option), option_rows)
+
+    if commit:
+        db.session.commit()
+    return created
+
+
+# Content pack files
+#--------------------------------------------------------------------------------------
+def read_json_sets(path):
+    # Either a list of set specs or {"sets": [...]}
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get('sets', [])
+    return data
+
+
+def read_csv_sets(path):
+    # One row per question:
+    #   set_title,category,difficulty,question_text,option_1..option_N,correct_option
+    # Consecutive rows with the same title/category/difficulty form one set.
+    sets = []
+    current_key = None
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            key = (row.get('set_title'), row.get('category'), row.get('difficulty'))
+            if key != current_key:
+                current_key = key
+                sets.append({'set_title': key[0], 'category': key[1], 'difficulty': key[2], 'questions': []})
+
+            option_columns = sorted((name for name in row if name and name.startswith('option_')),
+                                    key=lambda name: int(name.split('_')[1]))
+            sets[-1]['questions'].append({
+                'question_text': row.get('question_text'),
+                'question_type': row.get('question_type') or 'multiple_choice',
+                'options': [row[name] or '' for name in option_columns],
+                'correct_option': row.get('correct_option'),
+            })
+    return sets
+
+
+def read_sets(path, file_format=None):
+    file_format = file_format or ('csv' if path.lower().endswith('.csv') else 'json')
+    if file_format == 'csv':
+        return read_csv_sets(path)
+    return read_json_sets(path)
+
+
+def import_trivia_sets(sets, user_id, batch_size=500):
+    # Validates everything up front, then writes in batches inside a single transaction
+    sets = [normalize_set(data) for data in sets]
+    created = []
+    try:
+        for start in range(0, len(sets), batch_size):
+            created.extend(create_trivia_sets(sets[start:start + batch_size], user_id, commit=False))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return created
@@ -0,0 +1,180 @@
+# user_dashboards.py
+import threading
+import time
+from collections import Counter, namedtuple
+
+from sqlalchemy import func, select
+
+from models import db, TriviaSet, Question, UserScore
+
+
+# A user's sets with question count, play count and score total per set, in one
+# statement. The counts are correlated subqueries so each one is a search on the
+# question and user_score indexes for that set only, whatever the size of the tables.
+SetRow = namedtuple('SetRow', ['id', 'set_title', 'category', 'difficulty', 'trivia_set_id', 'user_id',
+                               'questions', 'plays', 'score_sum'])
+
+
+def average_score(row):
+    return round(row.score_sum / row.plays, 1) if row.plays else None
+
+
+def _set_rows(where, limit=None):
+    questions = (select(func.count()).where(Question.trivia_set_id == TriviaSet.id)
+                 .correlate(TriviaSet).scalar_subquery())
+    plays = (select(func.count()).where(UserScore.trivia_set_id == TriviaSet.id)
+             .correlate(TriviaSet).scalar_subquery())
+    score_sum = (select(func.coalesce(func.sum(UserScore.score), 0)).where(UserScore.trivia_set_id == TriviaSet.id)
+                 .correlate(TriviaSet).scalar_subquery())
+    query = (select(TriviaSet.id, TriviaSet.set_title, TriviaSet.category, TriviaSet.difficulty,
+                    TriviaSet.trivia_set_id, TriviaSet.user_id, questions, plays, score_sum)
+             .where(*where)
+             .order_by(TriviaSet.id))
+    if limit is not None:
+        query = query.limit(limit)
+    return [SetRow(*row) for row in db.session.execute(query)]
+
+
+def dashboard_page(user_id, after=None, limit=20):
+    # Returns (rows, id to pass as `after` for the next page or None). Keyset pagination
+    # on the set id, so every page costs the same however far in it is.
+    where = [TriviaSet.user_id == user_id]
+    if after is not None:
+        where.append(TriviaSet.id > after)
+    rows = _set_rows(where, limit + 1)
+    next_after = rows[limit - 1].id if len(rows) > limit else None
+    return rows[:limit], next_after
+
+
+# Summaries
+#--------------------------------------------------------------------------------------
+class UserSummary:
+    # Totals over all of a user's sets, kept per set so any change is applied as a
+    # difference instead of recounting everything.
+    __slots__ = ('sets', 'categories', 'questions', 'plays', 'score_sum', 'loaded_at')
+
+    def __init__(self, rows=()):
+        self.sets = {}            # set id -> (category, questions, plays, score_sum)
+        self.categories = Counter()
+        self.questions = self.plays = self.score_sum = 0
+        self.loaded_at = time.monotonic()
+        for row in rows:
+            self.put(row)
+
+    def put(self, row):
+        self.remove(row.id)
+        self.sets[row.id] = (row.category, row.questions, row.plays, row.score_sum)
+        self.categories[row.category] += 1
+        self.questions += row.questions
+        self.plays += row.plays
+        self.score_sum += row.score_sum
+
+    def remove(self, set_id):
+        old = self.sets.pop(set_id, None)
+        if old is None:
+            return
+        category, questions, plays, score_sum = old
+        self.categories[category] -= 1
+        if not self.categories[category]:
+            del self.categories[category]
+        self.questions -= questions
+        self.plays -= plays
+        self.score_sum -= score_sum
+
+    def score(self, set_id, score, previous=None):
+        old = self.sets.get(set_id)
+        if old is None:
+            return
+        category, questions, plays, score_sum = old
+        new_play = 1 if previous is None else 0
+        delta = score - (previous or 0)
+        self.sets[set_id] = (category, questions, plays + new_play, score_sum + delta)
+        self.plays += new_play
+        self.score_sum += delta
+
+    def view(self):
+        return {
+            'sets': len(self.sets),
+            'questions': self.questions,
+            'plays': self.plays,
+            'average_score': round(self.score_sum / self.plays, 1) if self.plays else None,
+            'categories': sorted(self.categories),
+        }
+
+
+class DashboardSummaries:
+    # Per-worker summaries, loaded on first use with one grouped query and then kept up
+    # to date from the set and score hooks. Summaries older than max_age seconds are
+    # reloaded so changes made by other workers show up eventually.
+    def __init__(self, max_users=1024, max_age=60):
+        self.max_users = max_users
+        self.max_age = max_age
+        self.loads = 0
+        self._summaries = {}
+        self._owners = {}         # set id -> user id, for the sets of loaded summaries
+        self._lock = threading.RLock()
+
+    def configure(self, max_users, max_age):
+        self.max_users = max_users
+        self.max_age = max_age
+
+    def for_user(self, user_id):
+        with self._lock:
+            summary = self._summaries.get(user_id)
+            if summary is not None and time.monotonic() - summary.loaded_at < self.max_age:
+                self._summaries[user_id] = self._summaries.pop(user_id)
+                return summary
+
+        summary = UserSummary(_set_rows([TriviaSet.user_id == user_id]))
+        with self._lock:
+            self._drop(user_id)
+            self._summaries[user_id] = summary
+            self._owners.update(dict.fromkeys(summary.sets, user_id))
+            while len(self._summaries) > self.max_users:
+                self._drop(next(iter(self._summaries)))
+            self.loads += 1
+        return summary
+
+    def _drop(self, user_id):
+        summary = self._summaries.pop(user_id, None)
+        if summary is not None:
+            for set_id in summary.sets:
+                self._owners.pop(set_id, None)
+
+    def sets_changed(self, set_ids):
+        # Created or edited sets: reloads the rows of those owned by a loaded summary
+        with self._lock:
+            user_ids = list(self._summaries)
+        if not user_ids:
+            return
+        for row in _set_rows([TriviaSet.id.in_(list(set_ids)), TriviaSet.user_id.in_(user_ids)]):
+            with self._lock:
+                summary = self._summaries.get(row.user_id)
+                if summary is not None:
+                    summary.put(row)
+                    self._owners[row.id] = row.user_id
+
+    def sets_deleted(self, set_ids):
+        with self._lock:
+            for set_id in set_ids:
+                user_id = self._owners.pop(set_id, None)
+                if user_id in self._summaries:
+                    self._summaries[user_id].remove(set_id)
+
+    def score_recorded(self, trivia_set_id, score, previous=None):
+        with self._lock:
+            user_id = self._owners.get(trivia_set_id)
+            if user_id in self._summaries:
+                self._summaries[user_id].score(trivia_set_id, score, previous)
+
+    def clear(self):
+        with self._lock:
+            self._summaries.clear()
+            self._owners.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'users': len(self._summaries), 'sets': len(self._owners), 'loads': self.loads}
+
+
+dashboard_summaries = DashboardSummaries()